@@ -0,0 +1,101 @@
+"""Columnar analytics against the same questions asked in SQL.
+
+Seeds a dataset, exports the Parquet snapshot and times the tag histogram of
+a group, the co-occurrence of the 50 most used tags and the daily label rate
+of every annotator, each next to the SQL query answering it on the OLTP DB.
+
+Run from backend/: python -m benchmarks.analytics --annotations 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+HISTOGRAM_SQL = """
+SELECT at.tag_id, COUNT(*) FROM annotation_tags at
+JOIN annotations a ON a.id = at.annotation_id
+JOIN image_groups ig ON ig.image_id = a.image_id
+WHERE ig.group_id = 1 GROUP BY at.tag_id ORDER BY 2 DESC LIMIT 50
+"""
+COOCCURRENCE_SQL = """
+WITH top AS (
+    SELECT tag_id FROM annotation_tags GROUP BY tag_id ORDER BY COUNT(*) DESC LIMIT 50
+)
+SELECT x.tag_id, y.tag_id, COUNT(*) FROM annotation_tags x
+JOIN annotation_tags y ON x.annotation_id = y.annotation_id
+WHERE x.tag_id IN top AND y.tag_id IN top GROUP BY 1, 2
+"""
+LABEL_RATE_SQL = """
+SELECT annotator_id, date(created_at), COUNT(*) FROM annotations GROUP BY 1, 2
+"""
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--annotations", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default=".benchmarks")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir) / f"analytics-{args.annotations}-{args.seed}"
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+
+    from sqlalchemy import text
+
+    from benchmarks.datagen import generate
+    from dal import analytics
+    from dal.setup import ENGINE, setup_db
+
+    if not Path("paladium.db").exists():
+        _, elapsed = timed(lambda: generate(ENGINE, args.annotations, seed=args.seed))
+        print(f"seeded {args.annotations} annotations in {elapsed:.1f}s")
+
+    with setup_db() as db:
+        path, elapsed = timed(lambda: analytics.export(db))
+    size = sum(f.stat().st_size for f in path.iterdir()) / 1e6
+    print(f"export: {elapsed:.2f}s, {size:.1f} MB")
+    facts, elapsed = timed(lambda: analytics.load(path))
+    print(f"load: {elapsed:.2f}s, {len(facts.tag_ids)} rows")
+
+    everything = facts.mask()
+    questions = [
+        (
+            "tag histogram of a group",
+            lambda: analytics.tag_histogram(facts, facts.mask(group_id=1), 50),
+            HISTOGRAM_SQL,
+        ),
+        (
+            "co-occurrence of the top 50",
+            lambda: analytics.cooccurrence(
+                facts, everything, analytics.top_tags(facts, everything, 50)
+            ),
+            COOCCURRENCE_SQL,
+        ),
+        (
+            "daily label rate",
+            lambda: analytics.label_rate(facts, everything, "day"),
+            LABEL_RATE_SQL,
+        ),
+    ]
+    print(f"{'question':<30}{'numpy':>10}{'sql':>10}")
+    with ENGINE.connect() as conn:
+        for name, columnar, sql in questions:
+            _, numpy_time = timed(columnar)
+            _, sql_time = timed(lambda: conn.execute(text(sql)).all())
+            print(f"{name:<30}{numpy_time:>9.3f}s{sql_time:>9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
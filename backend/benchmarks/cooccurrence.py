@@ -0,0 +1,108 @@
+"""Tag co-occurrence: build time and top-K latency on a large vocabulary.
+
+Seeds `--annotations` over a `--vocabulary` of Zipf-distributed tags, builds
+the co-occurrence graph, times related and synonym queries for tags across
+the frequency range, logs `--changes` random edits and times catching up
+with them, then the vocabulary-wide merge suggestions.
+
+Run from backend/: python -m benchmarks.cooccurrence --annotations 1000000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--annotations", type=int, default=1_000_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--changes", type=int, default=2_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default=".benchmarks")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir) / (
+        f"cooccurrence-{args.annotations}-{args.vocabulary}-{args.seed}"
+    )
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+
+    from sqlalchemy import insert
+
+    from benchmarks.datagen import generate
+    from dal import cooccurrence, history
+    from dal.models import AnnotationChange
+    from dal.setup import ENGINE, setup_db
+
+    rng = random.Random(args.seed)
+    if not Path("paladium.db").exists():
+        _, elapsed = timed(
+            lambda: generate(
+                ENGINE, args.annotations, seed=args.seed, vocabulary=args.vocabulary
+            )
+        )
+        print(f"seeded {args.annotations} annotations in {elapsed:.1f}s")
+
+    with setup_db() as db:
+        with cooccurrence._lock:
+            graph, elapsed = timed(lambda: cooccurrence._current(db))
+        print(
+            f"build: {elapsed:.2f}s, {len(graph.annotations.indices) // 2} annotation "
+            f"pairs, {len(graph.images.indices) // 2} image pairs"
+        )
+
+        tags = [rng.randint(1, args.vocabulary) for _ in range(args.queries)]
+        for name, query in (
+            ("related", lambda t: cooccurrence.related(db, t, 20)),
+            ("synonyms", lambda t: cooccurrence.synonyms(db, t, 20, 3)),
+        ):
+            latencies = sorted(timed(lambda: query(t))[1] * 1000 for t in tags)
+            print(
+                f"{name}: p50 {statistics.median(latencies):.2f}ms, "
+                f"p99 {latencies[int(len(latencies) * 0.99)]:.2f}ms, "
+                f"tag 1 (most used) {timed(lambda: query(1))[1] * 1000:.2f}ms"
+            )
+
+        state = graph.state
+        rows = []
+        for _ in range(args.changes):
+            position = rng.randrange(len(state))
+            rows.append(
+                {
+                    "annotation_id": int(state.ids[position]),
+                    "image_id": int(state.image_ids[position]),
+                    "annotator_id": int(state.annotator_ids[position]),
+                    "change": "updated",
+                    "operation": "benchmark",
+                    "added": history.pack([rng.randint(1, args.vocabulary)]),
+                    "removed": history.pack(state.tags(position).tolist()[:1]),
+                }
+            )
+        db.execute(insert(AnnotationChange.__table__), rows)
+        db.commit()
+        with cooccurrence._lock:
+            _, elapsed = timed(lambda: cooccurrence._current(db))
+        print(f"catch up with {args.changes} changes: {elapsed * 1000:.0f}ms")
+
+        _, elapsed = timed(lambda: cooccurrence.merge_suggestions(db, 50, 5, 0.5))
+        _, cached = timed(lambda: cooccurrence.merge_suggestions(db, 50, 5, 0.5))
+        print(f"merge suggestions: {elapsed:.2f}s, {cached * 1000:.2f}ms cached")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Seeded synthetic dataset for benchmarks.
+
+Images are split across groups, every image is annotated by a few members of
+its group and tags follow a Zipf distribution, so popular-tag queries and
+conflict detection see realistic skew. Rows are bulk inserted with Core
+executemany, the ORM is not involved.
+"""
+
+import itertools
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import insert
+
+from core.utils.auth import hash_password
+from core.utils.phash import dhash
+from dal.models import Annotation, Annotator, Base, Groups, Image, Tags, image_groups
+from dal.models.annotator import annotation_tags
+from dal.models.groups import group_annotators
+
+PASSWORD = "benchmark"
+CHUNK = 10_000
+
+# A valid 1x1 PNG, shared by every generated image to keep disk usage flat
+PIXEL = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489"
+    "0000000d4944415478da63fccfc0f01f00050502005fc8f1d20000000049454e44"
+    "ae426082"
+)
+
+
+def _chunks(rows, size=CHUNK):
+    iterator = iter(rows)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def generate(
+    engine,
+    annotations: int,
+    seed: int = 42,
+    groups: int = 10,
+    annotators_per_image: int = 3,
+    vocabulary: int = 5_000,
+    zipf_s: float = 1.1,
+):
+    """Create the schema and fill it with about `annotations` annotations"""
+    rng = random.Random(seed)
+    images = max(1, annotations // annotators_per_image)
+    members_per_group = max(annotators_per_image, annotations // 1_000 // groups)
+    annotators = members_per_group * groups
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    Path("uploads").mkdir(exist_ok=True)
+    (Path("uploads") / "pixel.png").write_bytes(PIXEL)
+
+    cum_weights = list(
+        itertools.accumulate(1 / rank**zipf_s for rank in range(1, vocabulary + 1))
+    )
+    tag_ids = range(1, vocabulary + 1)
+    started = datetime(2025, 1, 1)
+    password_hash = hash_password(PASSWORD)
+    pixel_hash = dhash(PIXEL)
+
+    with engine.begin() as conn:
+        conn.execute(
+            insert(Groups),
+            [{"id": g, "name": f"group-{g}"} for g in range(1, groups + 1)],
+        )
+        conn.execute(insert(Tags), [{"id": t, "name": f"tag-{t}"} for t in tag_ids])
+        conn.execute(
+            insert(Annotator),
+            [
+                {
+                    "id": a,
+                    "name": f"annotator-{a}",
+                    "email": f"annotator-{a}@example.com",
+                    "password_hash": password_hash,
+                }
+                for a in range(1, annotators + 1)
+            ],
+        )
+        conn.execute(
+            insert(group_annotators),
+            [
+                {"group_id": (a - 1) % groups + 1, "annotator_id": a}
+                for a in range(1, annotators + 1)
+            ],
+        )
+
+        for chunk in _chunks(range(1, images + 1)):
+            conn.execute(
+                insert(Image),
+                [
+                    {
+                        "id": i,
+                        "name": f"image-{i}.png",
+                        "url": "/uploads/pixel.png",
+                        "phash": pixel_hash,
+                        "date_added": started + timedelta(seconds=i),
+                    }
+                    for i in chunk
+                ],
+            )
+            conn.execute(
+                insert(image_groups),
+                [{"image_id": i, "group_id": (i - 1) % groups + 1} for i in chunk],
+            )
+
+        def annotation_rows():
+            annotation_id = 0
+            for image_id in range(1, images + 1):
+                group = (image_id - 1) % groups
+                members = rng.sample(range(members_per_group), annotators_per_image)
+                for member in members:
+                    annotation_id += 1
+                    created = started + timedelta(
+                        seconds=image_id * 10 + rng.randint(0, 3600)
+                    )
+                    count = rng.randint(1, 4)
+                    tags = set(rng.choices(tag_ids, cum_weights=cum_weights, k=count))
+                    yield (
+                        {
+                            "id": annotation_id,
+                            "image_id": image_id,
+                            "annotator_id": member * groups + group + 1,
+                            "created_at": created,
+                            "updated_at": created,
+                        },
+                        [{"annotation_id": annotation_id, "tag_id": t} for t in tags],
+                    )
+
+        for chunk in _chunks(annotation_rows()):
+            conn.execute(insert(Annotation), [row for row, _ in chunk])
+            conn.execute(
+                insert(annotation_tags), [tag for _, tags in chunk for tag in tags]
+            )
+
+    return {
+        "annotations": images * annotators_per_image,
+        "images": images,
+        "annotators": annotators,
+        "groups": groups,
+        "tags": vocabulary,
+    }
@@ -0,0 +1,93 @@
+"""Stub OpenAI server so benchmarks never hit the network.
+
+Answers `POST /v1/chat/completions` after a configurable delay: conflict
+checks (max_tokens <= 10) get "NO", everything else a comma-separated tag
+list, streamed word by word when the request asks for `stream`. Point the
+app at it with OPENAI_BASE_URL.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUGGESTION = "tag-1, tag-2, tag-3, street, night"
+
+
+def _completion(content: str) -> dict:
+    return {
+        "id": "chatcmpl-benchmark",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-4o-mini",
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def _chunk(content: str) -> bytes:
+    chunk = {
+        "id": "chatcmpl-benchmark",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n".encode()
+
+
+class FakeOpenAI:
+    def __init__(self, latency: float = 0.3):
+        self.latency = latency
+        self.calls = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("content-length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                fake.calls += 1
+
+                if request.get("stream"):
+                    self.send_response(200)
+                    self.send_header("content-type", "text/event-stream")
+                    self.end_headers()
+                    pieces = SUGGESTION.split(" ")
+                    try:
+                        for piece in pieces:
+                            time.sleep(fake.latency / len(pieces))
+                            self.wfile.write(_chunk(piece + " "))
+                            self.wfile.flush()
+                        self.wfile.write(b"data: [DONE]\n\n")
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass  # the app cancelled the stream
+                    return
+
+                time.sleep(fake.latency)
+                content = "NO" if request.get("max_tokens", 0) <= 10 else SUGGESTION
+                body = json.dumps(_completion(content)).encode()
+                self.send_response(200)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
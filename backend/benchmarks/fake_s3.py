@@ -0,0 +1,119 @@
+"""Stub S3 server, a stand-in for MinIO when trying STORAGE_URL=s3://...
+
+Keeps objects in memory and speaks just enough of the path-style S3 API for
+core.utils.storage: HEAD bucket, PUT/GET/HEAD/DELETE object, Range reads and
+the expiry of presigned URLs. Signatures are not checked.
+
+    with FakeS3() as s3:
+        os.environ["S3_ENDPOINT_URL"] = s3.endpoint_url
+        os.environ["STORAGE_URL"] = "s3://paladium/images"
+"""
+
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class FakeS3:
+    def __init__(self, bucket: str = "paladium"):
+        self.bucket = bucket
+        self.objects: dict[str, tuple[bytes, str]] = {}
+        self.gets = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(
+                self, status: int, body: bytes = b"", headers: Optional[dict] = None
+            ):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _target(self) -> tuple[str, str, dict]:
+                url = urlsplit(self.path)
+                bucket, _, key = url.path.lstrip("/").partition("/")
+                return bucket, key, parse_qs(url.query)
+
+            def _expired(self, query: dict) -> bool:
+                if "X-Amz-Date" not in query:
+                    return False
+                signed = datetime.strptime(query["X-Amz-Date"][0], "%Y%m%dT%H%M%SZ")
+                signed = signed.replace(tzinfo=timezone.utc).timestamp()
+                return time.time() > signed + int(query["X-Amz-Expires"][0])
+
+            def do_HEAD(self):
+                bucket, key, _ = self._target()
+                if bucket != fake.bucket or (key and key not in fake.objects):
+                    return self._reply(404)
+                if not key:
+                    return self._reply(200)
+                content, content_type = fake.objects[key]
+                self._reply(200, content, {"content-type": content_type})
+
+            def do_PUT(self):
+                bucket, key, _ = self._target()
+                content = self.rfile.read(int(self.headers.get("content-length", 0)))
+                if bucket != fake.bucket:
+                    return self._reply(404)
+                content_type = self.headers.get("content-type", "binary/octet-stream")
+                fake.objects[key] = (content, content_type)
+                self._reply(200, headers={"etag": '"0"'})
+
+            def do_DELETE(self):
+                _, key, _ = self._target()
+                fake.objects.pop(key, None)
+                self._reply(204)
+
+            def do_GET(self):
+                bucket, key, query = self._target()
+                if self._expired(query):
+                    return self._reply(403, b"<Error><Code>AccessDenied</Code></Error>")
+                if bucket != fake.bucket or key not in fake.objects:
+                    body = b"<Error><Code>NoSuchKey</Code></Error>"
+                    return self._reply(404, body, {"content-type": "application/xml"})
+                fake.gets += 1
+                content, content_type = fake.objects[key]
+                requested = _RANGE.fullmatch(self.headers.get("range", ""))
+                if not requested:
+                    return self._reply(200, content, {"content-type": content_type})
+
+                first, last = requested.groups()
+                if first:
+                    start = int(first)
+                    end = min(int(last or len(content) - 1), len(content) - 1)
+                else:
+                    start, end = max(len(content) - int(last), 0), len(content) - 1
+                self._reply(
+                    206,
+                    content[start : end + 1],
+                    {
+                        "content-type": content_type,
+                        "content-range": f"bytes {start}-{end}/{len(content)}",
+                    },
+                )
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.endpoint_url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,95 @@
+"""Snapshot and time-travel timings for the annotation history.
+
+Seeds a dataset, snapshots it, appends `--changes` random tag edits to the
+change log and then rebuilds the state as of the latest change, the worst
+case for a query between two snapshots.
+
+Run from backend/: python -m benchmarks.history --annotations 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--annotations", type=int, default=1_000_000)
+    parser.add_argument("--changes", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default=".benchmarks")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir) / f"history-{args.annotations}-{args.seed}"
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+
+    from sqlalchemy import insert, select
+
+    from benchmarks.datagen import generate
+    from dal import history
+    from dal.models import AnnotationChange, AnnotationSnapshot
+    from dal.setup import ENGINE, setup_db
+
+    rng = random.Random(args.seed)
+    if not Path("paladium.db").exists():
+        started = time.perf_counter()
+        dataset = generate(ENGINE, args.annotations, seed=args.seed)
+        print(f"seeded {dataset['annotations']} annotations in "
+              f"{time.perf_counter() - started:.1f}s")
+
+    with setup_db() as db:
+        started = time.perf_counter()
+        snapshot = history.take_snapshot(db)
+        elapsed = time.perf_counter() - started
+        print(f"snapshot: {snapshot.annotations} annotations, "
+              f"{len(snapshot.data) / 1e6:.1f} MB, {elapsed:.2f}s")
+
+        state = history.AnnotationState.loads(snapshot.data)
+        at = snapshot.taken_at
+        rows = []
+        for i in range(args.changes):
+            position = rng.randrange(len(state))
+            current = state.tags(position).tolist()
+            added = [rng.randint(1, 5_000)]
+            rows.append(
+                {
+                    "annotation_id": int(state.ids[position]),
+                    "image_id": int(state.image_ids[position]),
+                    "annotator_id": int(state.annotator_ids[position]),
+                    "change": "updated",
+                    "operation": "benchmark",
+                    "added": history.pack(added),
+                    "removed": history.pack(current[:1]),
+                    "created_at": at + timedelta(milliseconds=i + 1),
+                }
+            )
+        db.execute(insert(AnnotationChange), rows)
+        db.commit()
+        latest = at + timedelta(milliseconds=args.changes)
+
+        history._cached = (None, None)
+        started = time.perf_counter()
+        rebuilt = history.state_as_of(db, latest)
+        cold = time.perf_counter() - started
+        started = time.perf_counter()
+        history.state_as_of(db, latest)
+        warm = time.perf_counter() - started
+        print(f"as-of with {args.changes} changes since the snapshot: "
+              f"{cold:.2f}s cold, {warm:.2f}s with the snapshot cached "
+              f"({len(rebuilt)} annotations)")
+
+        snapshots = db.scalar(select(AnnotationSnapshot.id).order_by(
+            AnnotationSnapshot.id.desc()))
+        print(f"latest snapshot id {snapshots}, now {datetime.utcnow():%H:%M:%S}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Bulk import throughput.
+
+Writes a dataset of `--annotations` (image, annotator) records with a few
+tags each, as JSONL or COCO, into an empty database, then imports it twice:
+the first run creates everything, the second finds it all in place.
+
+Run from backend/: python -m benchmarks.imports --annotations 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+import orjson
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+ANNOTATORS = 50
+
+
+def write_dataset(path: Path, format: str, annotations: int, tags: int, rng):
+    with open(path, "wb") as out:
+        if format == "jsonl":
+            for i in range(annotations):
+                record = {
+                    "image": f"image-{i // ANNOTATORS}.jpg",
+                    "annotator_id": i % ANNOTATORS + 1,
+                    "tags": [f"tag-{t}" for t in rng.sample(range(tags), 3)],
+                }
+                out.write(orjson.dumps(record) + b"\n")
+            return
+        # COCO has no annotators: one record per image, three objects each
+        out.write(b'{"info": {"description": "benchmark"}, "images": [')
+        for i in range(annotations):
+            out.write(b"," if i else b"")
+            out.write(orjson.dumps({"id": i + 1, "file_name": f"image-{i}.jpg"}))
+        out.write(b'], "annotations": [')
+        for i in range(annotations * 3):
+            out.write(b"," if i else b"")
+            out.write(
+                orjson.dumps(
+                    {
+                        "id": i + 1,
+                        "image_id": i // 3 + 1,
+                        "category_id": rng.randrange(tags) + 1,
+                        "bbox": [10.0, 20.0, 30.0, 40.0],
+                    }
+                )
+            )
+        out.write(b'], "categories": ')
+        out.write(orjson.dumps([{"id": t + 1, "name": f"tag-{t}"} for t in range(tags)]))
+        out.write(b"}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--annotations", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=("jsonl", "coco"), default="jsonl")
+    parser.add_argument("--tags", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default=".benchmarks")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir) / f"imports-{args.format}-{args.annotations}"
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+    for stale in Path(".").glob("paladium.db*"):
+        stale.unlink()
+
+    from sqlalchemy import insert
+
+    from core.utils.importers import parse
+    from dal.importer import import_records
+    from dal.models import Annotator, Base
+    from dal.setup import ENGINE, setup_db
+
+    dataset = Path(f"dataset.{args.format}")
+    if not dataset.exists():
+        started = time.perf_counter()
+        write_dataset(dataset, args.format, args.annotations, args.tags,
+                      random.Random(args.seed))
+        print(f"wrote {dataset.stat().st_size / 1e6:.0f} MB in "
+              f"{time.perf_counter() - started:.1f}s")
+
+    Base.metadata.create_all(bind=ENGINE)
+    with setup_db() as db:
+        db.execute(
+            insert(Annotator),
+            [
+                {"name": f"a{i}", "email": f"a{i}@bench", "password_hash": "-"}
+                for i in range(ANNOTATORS)
+            ],
+        )
+        db.commit()
+
+    for run in ("first import", "re-import"):
+        with open(dataset, "rb") as stream, setup_db() as db:
+            for stats in import_records(db, parse(stream, args.format), 1):
+                pass
+        rate = stats.records / stats.elapsed
+        print(f"{run}: {stats.records} records, {stats.annotations_created} "
+              f"annotations and {stats.tags_added} tags added in "
+              f"{stats.elapsed:.1f}s ({rate:,.0f} records/s)")
+
+
+if __name__ == "__main__":
+    main()
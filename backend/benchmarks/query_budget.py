@@ -0,0 +1,331 @@
+"""Query-count harness: every router endpoint must run a constant number of
+SQL statements, whatever the size of the dataset. A route that is neither
+measured nor listed in UNMEASURED with a reason fails the run, so new routes
+get a budget when they are added.
+
+Each endpoint is called against a small and a large seeded database with
+PALADIUM_STRICT_LOADING=1, so relationships missing from `dal.loading` raise
+and per-row queries show up as a growing statement count. Exits non-zero on
+any violation, which makes it suitable as a CI step.
+
+Run from backend/: python -m benchmarks.query_budget
+"""
+
+import io
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ["PALADIUM_STRICT_LOADING"] = "1"
+# Every endpoint is called twice per run; rate limits would answer 429
+for endpoint_class in ("AI", "UPLOAD", "EXPORT"):
+    os.environ[f"ADMISSION_{endpoint_class}_BURST"] = "1000"
+os.chdir(tempfile.mkdtemp(prefix="paladium-queries-"))
+
+from fastapi.routing import APIRoute  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from starlette.routing import Match  # noqa: E402
+
+from core.utils.auth import create_token, hash_password  # noqa: E402
+from core.utils.cache import bump_versions  # noqa: E402
+from core.utils.storage import storage  # noqa: E402
+from dal.models import Annotation, Annotator, Base, Groups, Image, Tags  # noqa: E402
+from dal.setup import ENGINE, setup_db  # noqa: E402
+from main import app  # noqa: E402
+from routers.stats import _stats_cache  # noqa: E402
+
+TABLES = [
+    "users",
+    "annotators",
+    "groups",
+    "group_annotators",
+    "images",
+    "image_groups",
+    "tags",
+    "annotations",
+    "annotation_tags",
+]
+
+
+def _png() -> bytes:
+    from PIL import Image as PILImage
+
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (8, 8), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+PNG = _png()
+IMPORT = (
+    b'{"image": "image-1.jpg", "url": "/uploads/image-1.jpg", "tags": ["imported"]}\n'
+    b'{"image": "imported.jpg", "tags": ["imported", "tag-1"]}\n'
+)
+
+
+# (name, method, path, request arguments); ids refer to rows created by seed(),
+# {new_annotator} to the one "create annotator" adds. Deletions come last, the
+# other requests use the rows they remove
+ENDPOINTS = [
+    ("root", "GET", "/", {}),
+    ("list images", "GET", "/images/", {}),
+    # Builds the in-memory tag index, which the writes below then update
+    ("search images", "GET", "/images/search?q=tag-1 OR NOT tag-5", {}),
+    ("list groups", "GET", "/groups/", {}),
+    ("get group", "GET", "/groups/1", {}),
+    ("list annotators", "GET", "/annotators/", {}),
+    ("get annotator", "GET", "/annotators/1", {}),
+    ("list annotations", "GET", "/annotations/", {}),
+    ("annotator images", "GET", "/annotations/images/1", {}),
+    ("annotator stats", "GET", "/annotations/stats/1", {}),
+    ("group stats", "GET", "/stats/groups", {}),
+    ("all annotator stats", "GET", "/stats/annotators", {}),
+    ("me", "GET", "/auth/me", {}),
+    (
+        "update annotation",
+        "POST",
+        "/annotations/1",
+        {"json": {"image_id": 1, "tag_names": ["x", "y"]}},
+    ),
+    (
+        "create annotation",
+        "POST",
+        "/annotations/1",
+        {"json": {"image_id": 2, "tag_names": ["x"]}},
+    ),
+    ("remove tag", "DELETE", "/images/3/tags/tag-2", {}),
+    (
+        "rename tag",
+        "PATCH",
+        "/images/4/tags/tag-3",
+        {"json": {"new_tag_name": "renamed"}},
+    ),
+    ("remove own tag", "DELETE", "/images/5/annotations/5/tags/tag-4", {}),
+    ("add image to group", "POST", "/images/1/groups/2", {}),
+    ("remove image from group", "DELETE", "/images/1/groups/2", {}),
+    ("remove member", "DELETE", "/groups/1/members/1", {}),
+    ("add member", "POST", "/groups/1/members", {"json": {"annotator_id": 1}}),
+    ("create group", "POST", "/groups/?name=group-3", {}),
+    (
+        "create annotator",
+        "POST",
+        "/annotators/",
+        {"json": {"name": "new", "email": "new@example.com", "password": "pw"}},
+    ),
+    (
+        "register annotator",
+        "POST",
+        "/auth/annotator/register",
+        {"json": {"name": "reg", "email": "reg@example.com", "password": "pw"}},
+    ),
+    (
+        "annotator login",
+        "POST",
+        "/auth/annotator/login",
+        {"json": {"email": "a0@example.com", "password": "password"}},
+    ),
+    (
+        "change password",
+        "POST",
+        "/auth/annotator/change-password",
+        {"json": {"old_password": "password", "new_password": "password"}},
+    ),
+    (
+        "register admin",
+        "POST",
+        "/auth/admin/register",
+        {"json": {"email": "admin@example.com", "password": "pw"}},
+    ),
+    (
+        "admin login",
+        "POST",
+        "/auth/admin/login",
+        {"json": {"email": "admin@example.com", "password": "pw"}},
+    ),
+    (
+        "upload image",
+        "POST",
+        "/images/upload",
+        {"files": {"file": ("new.png", PNG, "image/png")}},
+    ),
+    ("metrics", "GET", "/metrics", {}),
+    ("duplicate clusters", "GET", "/images/duplicates", {}),
+    ("image duplicates", "GET", "/images/1/duplicates", {}),
+    ("propagate to duplicates", "POST", "/images/7/duplicates/propagate", {}),
+    ("search tags", "GET", "/tags/search?q=tag", {}),
+    ("health", "GET", "/health", {}),
+    ("ready", "GET", "/ready", {}),
+    ("signed image url", "GET", "/images/1/url", {}),
+    ("stored upload", "GET", "/uploads/image-0.jpg", {}),
+    ("annotation outbox", "GET", "/annotations/outbox", {}),
+    ("annotation history", "GET", "/annotations/history", {}),
+    ("take snapshot", "POST", "/annotations/history/snapshots", {}),
+    ("annotations as of", "GET", "/annotations/as-of?at=2100-01-01T00:00:00", {}),
+    (
+        "import dataset",
+        "POST",
+        "/imports?format=jsonl&annotator_id=1",
+        {"files": {"file": ("dataset.jsonl", IMPORT, "application/x-ndjson")}},
+    ),
+    ("take analytics snapshot", "POST", "/analytics/snapshot", {}),
+    ("analytics snapshot", "GET", "/analytics/snapshot", {}),
+    ("tag histogram", "GET", "/analytics/tags?group_id=1", {}),
+    ("tag cooccurrence", "GET", "/analytics/cooccurrence", {}),
+    ("label rate", "GET", "/analytics/label-rate?bucket=hour", {}),
+    ("related tags", "GET", "/tags/tag-1/related", {}),
+    ("synonym candidates", "GET", "/tags/tag-1/synonyms?min_support=1", {}),
+    ("merge suggestions", "GET", "/tags/merge-suggestions?min_support=1", {}),
+    (
+        "bulk add members",
+        "POST",
+        "/groups/2/members/bulk-add",
+        {"json": {"annotator_ids": [1, 2, 3]}},
+    ),
+    (
+        "bulk remove members",
+        "POST",
+        "/groups/2/members/bulk-remove",
+        {"json": {"annotator_ids": [1, 2, 3]}},
+    ),
+    (
+        "bulk add images",
+        "POST",
+        "/groups/2/images/bulk-add",
+        {"json": {"q": "tag-1 OR tag-2"}},
+    ),
+    (
+        "bulk remove images",
+        "POST",
+        "/groups/2/images/bulk-remove",
+        {"json": {"image_ids": [1, 2, 3]}},
+    ),
+    ("admission costs", "GET", "/stats/costs", {}),
+    ("delete image", "DELETE", "/images/10", {}),
+    ("delete annotator", "DELETE", "/annotators/{new_annotator}", {}),
+    ("delete group", "DELETE", "/groups/3", {}),
+]
+# Routes not measured, and why
+UNMEASURED = {
+    ("GET", "/annotations/ai-suggest/{image_id}"): "calls OpenAI",
+    ("GET", "/annotations/ai-suggest/{image_id}/stream"): "calls OpenAI",
+    ("GET", "/events"): "streams until the client disconnects",
+}
+
+
+def _route(method: str, path: str) -> Optional[APIRoute]:
+    """The route serving a request: the first that fully matches, as routing
+    picks it"""
+    scope = {"type": "http", "method": method, "path": path.split("?")[0]}
+    for route in app.routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return route if isinstance(route, APIRoute) else None
+    return None
+
+
+def unmeasured() -> list[str]:
+    """Routes of the app neither called by ENDPOINTS nor listed in UNMEASURED"""
+    served = {
+        (method, route.path)
+        for _, method, path, _ in ENDPOINTS
+        if (route := _route(method, path)) is not None
+    }
+    return [
+        f"{method} {route.path}"
+        for route in app.routes
+        if isinstance(route, APIRoute)
+        for method in sorted(route.methods)
+        if (method, route.path) not in served | UNMEASURED.keys()
+    ]
+
+
+def seed(size: int):
+    """Seed `size` annotators and images, one two-tag annotation per image.
+
+    Images come in identical pairs by perceptual hash: 1 and 2, 3 and 4, ...
+    Only the first image has its bytes in storage.
+    """
+    Base.metadata.drop_all(bind=ENGINE)
+    Base.metadata.create_all(bind=ENGINE)
+    db = setup_db()
+    password_hash = hash_password("password")
+    groups = [Groups(name="group-1"), Groups(name="group-2")]
+    tags = [Tags(name=f"tag-{i}") for i in range(8)]
+    for i in range(size):
+        annotator = Annotator(
+            name=f"annotator-{i}",
+            email=f"a{i}@example.com",
+            password_hash=password_hash,
+        )
+        image = Image(
+            name=f"image-{i}.jpg",
+            url=f"/uploads/image-{i}.jpg",
+            phash=f"{random.Random(i // 2).getrandbits(64):016x}",
+        )
+        groups[i % 2].annotators.append(annotator)
+        groups[0].images.append(image)
+        db.add(
+            Annotation(
+                image=image,
+                annotator=annotator,
+                tags=[tags[i % 8], tags[(i + 1) % 8]],
+            )
+        )
+    db.add_all(groups)
+    db.commit()
+    storage.put("image-0.jpg", PNG, "image/png")
+    db.close()
+    bump_versions(*TABLES)
+    _stats_cache.clear()
+
+
+def count_statements(client: TestClient, size: int) -> dict[str, int]:
+    seed(size)
+    headers = {"Authorization": f"Bearer {create_token(1, 'annotator')}"}
+    counts = {}
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(ENGINE, "before_cursor_execute", on_execute)
+    try:
+        for name, method, path, arguments in ENDPOINTS:
+            statements.clear()
+            path = path.format(new_annotator=size + 1)
+            response = client.request(method, path, headers=headers, **arguments)
+            if response.status_code >= 400:
+                raise SystemExit(f"{name}: {method} {path} -> {response.text}")
+            counts[name] = len(statements)
+    finally:
+        event.remove(ENGINE, "before_cursor_execute", on_execute)
+    return counts
+
+
+def main():
+    missing = unmeasured()
+    if missing:
+        raise SystemExit(
+            "Add to ENDPOINTS, or to UNMEASURED with a reason: " + ", ".join(missing)
+        )
+    with TestClient(app) as client:
+        small = count_statements(client, 10)
+        large = count_statements(client, 100)
+
+    failures = 0
+    print(f"{'endpoint':<26}{'10 rows':>9}{'100 rows':>10}")
+    for name, *_ in ENDPOINTS:
+        flag = "" if large[name] <= small[name] else "  <-- grows with data"
+        failures += bool(flag)
+        print(f"{name:<26}{small[name]:>9}{large[name]:>10}{flag}")
+
+    if failures:
+        raise SystemExit(f"{failures} endpoint(s) issue per-row queries")
+
+
+if __name__ == "__main__":
+    main()
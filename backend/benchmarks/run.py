@@ -0,0 +1,162 @@
+"""Load-test runner: seed a dataset, replay scenarios, report latency percentiles
+and throughput per endpoint, and optionally compare against a stored baseline.
+
+Run from backend/:
+    python -m benchmarks.run --size 10k --scenarios labeler dashboard
+    python -m benchmarks.run --size 10k --save-baseline baseline.json
+    python -m benchmarks.run --size 10k --baseline baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+SCENARIOS = ["labeler", "dashboard", "export", "login"]
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_scenario(app, name: str, dataset: dict, args) -> dict:
+    import httpx
+
+    from benchmarks import scenarios
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+
+    def record(endpoint: str, seconds: float, status: int):
+        latencies[endpoint].append(seconds)
+        if status >= 400:
+            errors[endpoint] += 1
+
+    # Server errors are counted per endpoint instead of aborting the run
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://benchmark", timeout=None
+    ) as client:
+
+        async def worker(index: int):
+            rng = random.Random(args.seed * 1000 + index)
+            session = scenarios.Session(client, record, dataset, rng)
+            for _ in range(args.iterations):
+                await scenarios.SCENARIOS[name](session)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+        wall = time.perf_counter() - started
+
+    return {
+        endpoint: {
+            "count": len(values),
+            "errors": errors[endpoint],
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "rps": len(values) / wall,
+        }
+        for endpoint, values in latencies.items()
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """p95 regressions beyond `tolerance` (ignoring sub-5 ms noise)"""
+    regressions = []
+    for scenario, endpoints in results.items():
+        for endpoint, current in endpoints.items():
+            previous = baseline.get(scenario, {}).get(endpoint)
+            if not previous:
+                continue
+            limit = max(previous["p95_ms"] * (1 + tolerance), previous["p95_ms"] + 5)
+            if current["p95_ms"] > limit:
+                regressions.append(
+                    f"{scenario} {endpoint}: p95 {current['p95_ms']:.1f} ms "
+                    f"(baseline {previous['p95_ms']:.1f} ms)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", choices=SIZES, default="10k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--ai-latency", type=float, default=0.01)
+    parser.add_argument("--workdir", default=".benchmarks")
+    parser.add_argument("--baseline")
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    baseline_path = Path(args.baseline).resolve() if args.baseline else None
+    save_path = Path(args.save_baseline).resolve() if args.save_baseline else None
+
+    # ENGINE resolves paladium.db against the working directory when dal.setup
+    # is first imported, so nothing touching the app may be imported before this
+    workdir = Path(args.workdir) / f"{args.size}-{args.seed}"
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+
+    from benchmarks.datagen import generate
+    from benchmarks.fake_openai import FakeOpenAI
+
+    with FakeOpenAI(latency=args.ai_latency) as fake:
+        os.environ["OPENAI_BASE_URL"] = fake.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+        from dal.setup import ENGINE
+        from main import app
+
+        marker = Path("dataset.json")
+        if marker.exists():
+            dataset = json.loads(marker.read_text())
+        else:
+            started = time.perf_counter()
+            dataset = generate(ENGINE, SIZES[args.size], seed=args.seed)
+            marker.write_text(json.dumps(dataset))
+            print(f"seeded {dataset} in {time.perf_counter() - started:.1f}s")
+
+        results = {}
+        for name in args.scenarios:
+            results[name] = asyncio.run(run_scenario(app, name, dataset, args))
+
+    print(
+        f"{'scenario':<10}{'endpoint':<36}{'n':>6}{'err':>5}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}"
+    )
+    for scenario, endpoints in results.items():
+        for endpoint, r in sorted(endpoints.items()):
+            print(
+                f"{scenario:<10}{endpoint:<36}{r['count']:>6}{r['errors']:>5}"
+                f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+                f"{r['rps']:>9.1f}"
+            )
+    print(f"stub OpenAI calls: {fake.calls}")
+
+    if save_path:
+        save_path.write_text(json.dumps(results, indent=2))
+    if baseline_path:
+        baseline = json.loads(baseline_path.read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
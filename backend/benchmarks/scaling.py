@@ -0,0 +1,179 @@
+"""Throughput of the Gunicorn deployment with 1..N workers.
+
+Seeds a dataset, then for every worker count starts gunicorn.conf.py,
+drives it from several client processes for a fixed time and finally sends
+SIGTERM to time the graceful shutdown. Requests avoid the AI endpoints and
+the response cache so the numbers reflect work done by the workers.
+
+Run from backend/:
+    python -m benchmarks.scaling --workers 1 2 4 --duration 15
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def _urls(dataset: dict, rng: random.Random) -> list[str]:
+    annotator = rng.randint(1, dataset["annotators"])
+    group = rng.randint(1, dataset["groups"])
+    tag = rng.randint(1, 50)
+    return [
+        f"/annotations/stats/{annotator}",
+        f"/groups/{group}",
+        f"/tags/search?q=tag-{tag}",
+        f"/images/search?q=tag-{tag} AND NOT tag-{tag + 1}&limit=20",
+    ]
+
+
+async def _client(base_url: str, dataset: dict, seed: int, concurrency: int, until: float):
+    import httpx
+
+    latencies, errors = [], 0
+    rng = random.Random(seed)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+
+        async def loop():
+            nonlocal errors
+            while time.monotonic() < until:
+                for url in _urls(dataset, rng):
+                    started = time.perf_counter()
+                    try:
+                        response = await client.get(url)
+                        errors += response.status_code >= 400
+                    except httpx.HTTPError:
+                        errors += 1
+                    latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def _client_process(args):
+    return asyncio.run(_client(*args))
+
+
+def _wait_ready(base_url: str, timeout: float = 60):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+def measure(workers: int, dataset: dict, args) -> dict:
+    port = args.port
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            str(BACKEND_DIR / "gunicorn.conf.py"),
+            "--pythonpath",
+            str(BACKEND_DIR),
+            "--workers",
+            str(workers),
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--access-logfile",
+            "/dev/null",
+            "main:app",
+        ],
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_ready(base_url)
+        # Warm-up builds the per-worker indexes outside of the measurement
+        warm = time.monotonic() + 2
+        _client_process((base_url, dataset, 0, workers * 2, warm))
+
+        until = time.monotonic() + args.duration
+        jobs = [
+            (base_url, dataset, args.seed + i, args.concurrency, until)
+            for i in range(args.clients)
+        ]
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(_client_process, jobs)
+    finally:
+        started = time.perf_counter()
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+        shutdown = time.perf_counter() - started
+
+    latencies = sorted(value for values, _ in results for value in values)
+    return {
+        "workers": workers,
+        "requests": len(latencies),
+        "errors": sum(errors for _, errors in results),
+        "rps": len(latencies) / args.duration,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "shutdown_s": shutdown,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", choices=["10k", "100k"], default="10k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1]
+    )
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workdir", default=".benchmarks")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir) / f"scaling-{args.size}-{args.seed}"
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+
+    marker = Path("dataset.json")
+    if marker.exists():
+        dataset = json.loads(marker.read_text())
+    else:
+        from sqlalchemy import create_engine
+
+        from benchmarks.datagen import generate
+
+        size = {"10k": 10_000, "100k": 100_000}[args.size]
+        dataset = generate(create_engine("sqlite:///paladium.db"), size, seed=args.seed)
+        marker.write_text(json.dumps(dataset))
+
+    print(f"cpus: {os.cpu_count()}")
+    print(f"{'workers':>8}{'req':>8}{'err':>6}{'req/s':>9}{'speedup':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'stop s':>8}")
+    baseline = None
+    for workers in sorted(set(args.workers)):
+        r = measure(workers, dataset, args)
+        baseline = baseline or r["rps"]
+        print(
+            f"{r['workers']:>8}{r['requests']:>8}{r['errors']:>6}{r['rps']:>9.1f}"
+            f"{r['rps'] / baseline:>9.2f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+            f"{r['shutdown_s']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
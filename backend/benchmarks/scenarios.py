@@ -0,0 +1,101 @@
+"""Scripted user journeys driven against the ASGI app.
+
+Each scenario runs one iteration and reports every request through `record`
+under a stable endpoint name, so runs can be compared with each other.
+"""
+
+import random
+import time
+
+from benchmarks.datagen import PASSWORD
+
+DASHBOARD_URLS = [
+    "/images/",
+    "/groups/",
+    "/annotators/",
+    "/stats/groups",
+    "/stats/annotators",
+]
+
+
+class Session:
+    def __init__(self, client, record, dataset: dict, rng: random.Random):
+        self.client = client
+        self.record = record
+        self.dataset = dataset
+        self.rng = rng
+
+    async def call(self, name: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        self.record(name, time.perf_counter() - started, response.status_code)
+        return response
+
+
+async def labeler_session(session: Session):
+    """Log in, open the queue, ask for suggestions and label a few images"""
+    annotator_id = session.rng.randint(1, session.dataset["annotators"])
+    response = await session.call(
+        "POST /auth/annotator/login",
+        "POST",
+        "/auth/annotator/login",
+        json={"email": f"annotator-{annotator_id}@example.com", "password": PASSWORD},
+    )
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    images = await session.call(
+        "GET /annotations/images/{id}",
+        "GET",
+        f"/annotations/images/{annotator_id}",
+        headers=headers,
+    )
+    await session.call(
+        "GET /annotations/stats/{id}",
+        "GET",
+        f"/annotations/stats/{annotator_id}",
+        headers=headers,
+    )
+
+    queue = images.json()
+    for image in session.rng.sample(queue, min(3, len(queue))):
+        await session.call(
+            "GET /annotations/ai-suggest/{id}",
+            "GET",
+            f"/annotations/ai-suggest/{image['id']}",
+            headers=headers,
+        )
+        await session.call(
+            "POST /annotations/{id}",
+            "POST",
+            f"/annotations/{annotator_id}",
+            json={"image_id": image["id"], "tag_names": ["tag-1", "tag-2"]},
+            headers=headers,
+        )
+
+
+async def admin_dashboard(session: Session):
+    """Everything the admin pages load on refresh"""
+    for url in DASHBOARD_URLS:
+        await session.call(f"GET {url}", "GET", url)
+
+
+async def export(session: Session):
+    await session.call("GET /annotations/", "GET", "/annotations/")
+
+
+async def login_burst(session: Session):
+    annotator_id = session.rng.randint(1, session.dataset["annotators"])
+    await session.call(
+        "POST /auth/annotator/login",
+        "POST",
+        "/auth/annotator/login",
+        json={"email": f"annotator-{annotator_id}@example.com", "password": PASSWORD},
+    )
+
+
+SCENARIOS = {
+    "labeler": labeler_session,
+    "dashboard": admin_dashboard,
+    "export": export,
+    "login": login_burst,
+}
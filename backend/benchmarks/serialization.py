@@ -0,0 +1,84 @@
+"""Compare response serialization paths on a large all-annotations payload.
+
+Run from backend/: python -m benchmarks.serialization [--rows 100000]
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+from core.schemas.api import AnnotationList
+
+
+def build_payload(rows: int) -> dict:
+    start = datetime(2025, 1, 1)
+    annotations = [
+        {
+            "annotation_id": i,
+            "image_id": i // 3,
+            "annotator_id": i % 50,
+            "annotator_name": f"annotator-{i % 50}",
+            "image_path": f"/uploads/{i // 3:032x}.jpg",
+            "tags": ["car", "street", "night"][: i % 3 + 1],
+            "created_at": start + timedelta(seconds=i),
+            "updated_at": start + timedelta(seconds=i),
+        }
+        for i in range(rows)
+    ]
+    return {"ok": True, "total": rows, "annotations": annotations}
+
+
+def stdlib_json(payload: dict) -> bytes:
+    # Previous path: untyped dict -> jsonable_encoder -> json.dumps
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def orjson_typed(payload: dict) -> bytes:
+    # Current path: response_model validation/serialization -> orjson
+    adapter = TypeAdapter(AnnotationList)
+    content = adapter.dump_python(adapter.validate_python(payload), mode="json")
+    return ORJSONResponse(content).body
+
+
+def orjson_raw(payload: dict) -> bytes:
+    return ORJSONResponse(payload).body
+
+
+def timed(fn, payload: dict, repeat: int) -> tuple[float, int]:
+    best = float("inf")
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(fn(payload))
+        best = min(best, time.perf_counter() - started)
+    return best, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    payload = build_payload(args.rows)
+    baseline = None
+    print(f"{'path':<16}{'best (ms)':>12}{'size (MB)':>12}{'speedup':>10}")
+    for name, fn in [
+        ("stdlib json", stdlib_json),
+        ("orjson + model", orjson_typed),
+        ("orjson raw", orjson_raw),
+    ]:
+        seconds, size = timed(fn, payload, args.repeat)
+        baseline = baseline or seconds
+        print(
+            f"{name:<16}{seconds * 1000:>12.1f}{size / 1e6:>12.2f}"
+            f"{baseline / seconds:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
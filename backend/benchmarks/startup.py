@@ -0,0 +1,115 @@
+"""Cold start: time to import the app and to run its startup, plus a
+`python -X importtime` report of what the import pulls in.
+
+Every measurement runs in a fresh interpreter inside a scratch directory, the
+startup ones against a database migrated by an untimed first run. Exits
+non-zero when a module meant to be imported on first use is imported by
+`import main`, or when the median import exceeds `--max-import-ms`, which
+makes it suitable as a CI step.
+
+Run from backend/: python -m benchmarks.startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+# Imported on first use or by the warm-up thread, never by `import main`
+LAZY = ("openai", "passlib", "jose", "pyarrow", "filetype")
+
+IMPORT = """
+import time
+started = time.perf_counter()
+import main
+print(time.perf_counter() - started)
+"""
+STARTUP = """
+import time
+from fastapi.testclient import TestClient
+import main
+started = time.perf_counter()
+with TestClient(main.app):
+    print(time.perf_counter() - started)
+"""
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run(code: str, workdir: str, *flags: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR))
+    result = subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        cwd=workdir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise SystemExit(result.stderr)
+    return result
+
+
+def importtime(stderr: str) -> tuple[Counter, dict[str, int]]:
+    """Self time per top-level package and cumulative time per module, in us"""
+    packages, modules = Counter(), {}
+    for line in stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            own, cumulative, _, name = match.groups()
+            packages[name.split(".")[0]] += int(own)
+            modules[name] = int(cumulative)
+    return packages, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--report", help="write the importtime report as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="paladium-startup-")
+    imports = [float(run(IMPORT, workdir).stdout) for _ in range(args.runs)]
+    run(STARTUP, workdir)  # migrates the new database
+    startups = [float(run(STARTUP, workdir).stdout) for _ in range(args.runs)]
+    packages, modules = importtime(run(IMPORT, workdir, "-X", "importtime").stderr)
+
+    total = sum(packages.values())
+    print(f"{'package':<24}{'self ms':>10}{'share':>8}")
+    for package, own in packages.most_common(args.top):
+        print(f"{package:<24}{own / 1000:>10.1f}{own / total:>8.1%}")
+    import_ms = statistics.median(imports) * 1000
+    print(f"\nimport main: {import_ms:.0f}ms (median of {args.runs})")
+    print(f"startup:     {statistics.median(startups) * 1000:.0f}ms")
+
+    if args.report:
+        Path(args.report).write_text(
+            json.dumps(
+                {
+                    "import_ms": import_ms,
+                    "startup_ms": statistics.median(startups) * 1000,
+                    "packages_us": dict(packages.most_common()),
+                    "modules_us": modules,
+                },
+                indent=2,
+            )
+        )
+
+    failures = [f"{name} is imported eagerly" for name in LAZY if name in modules]
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failures.append(f"import took {import_ms:.0f}ms > {args.max_import_ms:.0f}ms")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import asyncio
+import math
+import re
+import time
+from collections import defaultdict
+from typing import Optional
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+from core.middleware.metrics import RequestStats, current_stats
+from core.utils.admission import CLASSES, EndpointClass, backend
+from core.utils.auth import request_actor
+
+# Expensive routes, with the endpoint class whose limits apply to them
+ADMITTED_ROUTES = [
+    # Checks every contested image with OpenAI
+    ("GET", re.compile(r"^/images/?$"), "ai"),
+    ("GET", re.compile(r"^/annotations/ai-suggest/\d+(/stream)?$"), "ai"),
+    ("POST", re.compile(r"^/images/upload$"), "upload"),
+    ("POST", re.compile(r"^/imports/?$"), "upload"),
+    ("GET", re.compile(r"^/annotations/?$"), "export"),
+    ("GET", re.compile(r"^/annotations/as-of$"), "export"),
+    ("POST", re.compile(r"^/annotations/history/snapshots$"), "export"),
+    ("POST", re.compile(r"^/analytics/snapshot$"), "export"),
+]
+# A slot released in this worker wakes a queued request at once; one released
+# by another worker sharing the backend is noticed by retrying, backing off
+# from the first delay to the second
+RETRY_SECONDS = (0.05, 1.0)
+
+
+def _endpoint_class(method: str, path: str) -> Optional[EndpointClass]:
+    for route_method, pattern, name in ADMITTED_ROUTES:
+        if method == route_method and pattern.match(path):
+            return CLASSES[name]
+    return None
+
+
+async def _call(function, *args, **kwargs):
+    if not backend.blocking:
+        return function(*args, **kwargs)
+    return await run_in_threadpool(function, *args, **kwargs)
+
+
+def _principal(request: Request) -> str:
+    host = request.client.host if request.client else "unknown"
+    return request_actor(request) or f"ip:{host}"
+
+
+class AdmissionMiddleware:
+    """Rate limit expensive endpoints per principal and cap their concurrency.
+
+    Over its rate a principal gets 429 at once. A request finding every slot
+    of its class taken waits in a bounded queue and gets 503 when the queue
+    is full or its wait times out. OpenAI calls after the first are taken
+    from the principal's bucket once the response is done, and every request
+    is charged to the principal for /stats/costs.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so a slot is held until a
+    streamed response has been sent in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._waiting: dict[str, int] = defaultdict(int)
+        self._released: dict[str, asyncio.Condition] = defaultdict(asyncio.Condition)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        endpoint = _endpoint_class(scope["method"], scope["path"])
+        if endpoint is None:
+            return await self.app(scope, receive, send)
+
+        principal = _principal(Request(scope))
+        bucket = f"{endpoint.name}:{principal}"
+        wait = await _call(backend.take, bucket, endpoint.rate, endpoint.burst)
+        if wait:
+            await _call(backend.charge, principal, endpoint.name, rejected=1)
+            response = _rejected(429, "Rate limit exceeded", wait)
+            return await response(scope, receive, send)
+
+        slot = await self._acquire(endpoint)
+        if slot is None:
+            await _call(backend.charge, principal, endpoint.name, rejected=1)
+            response = _rejected(
+                503,
+                f"Too many {endpoint.name} requests in progress",
+                endpoint.queue_timeout,
+            )
+            return await response(scope, receive, send)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await _call(backend.release, endpoint.name, slot)
+            released = self._released[endpoint.name]
+            async with released:
+                released.notify()
+            seconds = time.perf_counter() - started
+            # Read here, the request's stats are a context variable
+            stats = current_stats()
+            await _call(_charge, principal, endpoint, bucket, stats, seconds)
+
+    async def _acquire(self, endpoint: EndpointClass) -> Optional[str]:
+        slot = await _call(backend.acquire, endpoint.name, endpoint.concurrency)
+        if slot is not None or self._waiting[endpoint.name] >= endpoint.queue:
+            return slot
+
+        deadline = time.monotonic() + endpoint.queue_timeout
+        delay, max_delay = RETRY_SECONDS
+        released = self._released[endpoint.name]
+        self._waiting[endpoint.name] += 1
+        try:
+            # Held while trying, so a release in between is not missed
+            async with released:
+                while (remaining := deadline - time.monotonic()) > 0:
+                    try:
+                        await asyncio.wait_for(released.wait(), min(delay, remaining))
+                    except asyncio.TimeoutError:
+                        delay = min(delay * 2, max_delay)
+                    slot = await _call(
+                        backend.acquire, endpoint.name, endpoint.concurrency
+                    )
+                    if slot is not None:
+                        return slot
+            return None
+        finally:
+            self._waiting[endpoint.name] -= 1
+
+
+def _charge(
+    principal: str,
+    endpoint: EndpointClass,
+    bucket: str,
+    stats: Optional[RequestStats],
+    seconds: float,
+):
+    """Take OpenAI calls after the first from the bucket, and record costs"""
+    ai_calls = stats.ai_calls if stats else 0
+    if ai_calls > 1:
+        backend.take(bucket, endpoint.rate, endpoint.burst, ai_calls - 1, force=True)
+    backend.charge(
+        principal,
+        endpoint.name,
+        requests=1,
+        ai_calls=ai_calls,
+        ai_seconds=stats.ai_seconds if stats else 0,
+        db_seconds=stats.db_seconds if stats else 0,
+        seconds=seconds,
+    )
+
+
+def _rejected(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detail},
+        status_code=status_code,
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
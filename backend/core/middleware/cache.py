@@ -0,0 +1,110 @@
+import hashlib
+import re
+from typing import Optional
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from core.utils.cache import backend, table_versions
+
+# GET routes served from the cache, with the tables their responses are built from
+CACHED_ROUTES = [
+    (re.compile(r"^/groups/?$"), ("groups", "group_annotators", "annotators")),
+    (re.compile(r"^/annotators/?$"), ("annotators",)),
+    (
+        re.compile(r"^/images/?$"),
+        ("images", "image_groups", "groups", "annotations", "annotation_tags", "tags"),
+    ),
+    (
+        re.compile(r"^/annotations/images/\d+$"),
+        (
+            "annotators",
+            "images",
+            "image_groups",
+            "group_annotators",
+            "annotations",
+            "annotation_tags",
+            "tags",
+            "image_priority",
+        ),
+    ),
+]
+
+
+def _cached_tables(path: str) -> Optional[tuple[str, ...]]:
+    for pattern, tables in CACHED_ROUTES:
+        if pattern.match(path):
+            return tables
+    return None
+
+
+async def _call(function, *args):
+    """Backends reading SQLite or Redis are called off the event loop"""
+    if not backend.blocking:
+        return function(*args)
+    return await run_in_threadpool(function, *args)
+
+
+def _pack(etag: str, media_type: str, body: bytes) -> bytes:
+    return f"{etag}\n{media_type}\n".encode() + body
+
+
+def _unpack(entry: bytes) -> tuple[str, str, bytes]:
+    etag, media_type, body = entry.split(b"\n", 2)
+    return etag.decode(), media_type.decode(), body
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    candidates = request.headers.get("if-none-match", "")
+    return etag in [c.strip() for c in candidates.split(",")] or candidates == "*"
+
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+    """Serve cached GET responses with ETag / If-None-Match support.
+
+    Entries are keyed by route, query params, principal and the version of
+    every table the response is built from, so a write that bumps one of
+    those versions makes older entries unreachable.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        tables = _cached_tables(request.url.path)
+        if request.method != "GET" or tables is None:
+            return await call_next(request)
+
+        principal = hashlib.sha256(
+            request.headers.get("authorization", "").encode()
+        ).hexdigest()
+        params = sorted(request.query_params.multi_items())
+        versions = await _call(table_versions, tables)
+        key = hashlib.sha256(
+            f"{request.url.path}|{params}|{principal}|{versions}".encode()
+        ).hexdigest()
+
+        entry = await _call(backend.get, key)
+        if entry is not None:
+            etag, media_type, body = _unpack(entry)
+            if _not_modified(request, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+            return Response(
+                body, media_type=media_type, headers={"ETag": etag, "X-Cache": "HIT"}
+            )
+
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        media_type = response.headers.get("content-type", "application/json")
+        await _call(backend.set, key, _pack(etag, media_type, body))
+
+        if _not_modified(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        headers = dict(response.headers)
+        headers["ETag"] = etag
+        headers["X-Cache"] = "MISS"
+        return Response(body, status_code=200, headers=headers)
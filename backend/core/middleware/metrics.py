@@ -0,0 +1,289 @@
+import asyncio
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.routing import Match
+
+from core.utils.auth import decode_token
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+@dataclass
+class RequestStats:
+    statements: int = 0
+    db_seconds: float = 0.0
+    ai_calls: int = 0
+    ai_seconds: float = 0.0
+    profile_requested: bool = False
+    profile: Optional[str] = None
+
+
+# Shared by reference with the worker threads running sync endpoints
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def current_stats() -> Optional[RequestStats]:
+    """Statements and OpenAI calls of the request being served so far"""
+    return _request_stats.get()
+
+
+class _Registry:
+    """Prometheus counters and latency histograms, labelled by route template"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: dict[tuple[str, str, int], int] = {}
+        self.latency: dict[str, list[float]] = {}
+        self.route_totals: dict[str, list[float]] = {}
+        self.slow_queries = 0
+
+    def observe(self, method: str, route: str, status: int, seconds: float, stats):
+        with self._lock:
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            # Cumulative buckets followed by sum and count
+            histogram = self.latency.setdefault(
+                route, [0.0] * (len(LATENCY_BUCKETS) + 2)
+            )
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+            totals = self.route_totals.setdefault(route, [0.0, 0.0, 0.0, 0.0])
+            totals[0] += stats.statements
+            totals[1] += stats.db_seconds
+            totals[2] += stats.ai_calls
+            totals[3] += stats.ai_seconds
+
+    def slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    def render(self) -> str:
+        lines = [
+            "# HELP paladium_http_requests_total HTTP requests by route and status",
+            "# TYPE paladium_http_requests_total counter",
+        ]
+        with self._lock:
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'paladium_http_requests_total{{method="{method}",'
+                    f'route="{route}",status="{status}"}} {count}'
+                )
+
+            lines += [
+                "# HELP paladium_http_request_duration_seconds Request latency",
+                "# TYPE paladium_http_request_duration_seconds histogram",
+            ]
+            for route, histogram in sorted(self.latency.items()):
+                for bound, count in zip(LATENCY_BUCKETS, histogram):
+                    lines.append(
+                        f"paladium_http_request_duration_seconds_bucket"
+                        f'{{route="{route}",le="{bound}"}} {count:g}'
+                    )
+                lines.append(
+                    f"paladium_http_request_duration_seconds_bucket"
+                    f'{{route="{route}",le="+Inf"}} {histogram[-1]:g}'
+                )
+                lines.append(
+                    f"paladium_http_request_duration_seconds_sum"
+                    f'{{route="{route}"}} {histogram[-2]:.6f}'
+                )
+                lines.append(
+                    f"paladium_http_request_duration_seconds_count"
+                    f'{{route="{route}"}} {histogram[-1]:g}'
+                )
+
+            for i, (name, help_text) in enumerate(
+                [
+                    ("paladium_db_statements_total", "SQL statements executed"),
+                    ("paladium_db_duration_seconds_total", "Time spent in SQL"),
+                    ("paladium_ai_calls_total", "OpenAI calls made"),
+                    ("paladium_ai_duration_seconds_total", "Time spent in OpenAI"),
+                ]
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for route, totals in sorted(self.route_totals.items()):
+                    lines.append(f'{name}{{route="{route}"}} {totals[i]:g}')
+
+            lines += [
+                "# HELP paladium_db_slow_queries_total Queries over SLOW_QUERY_MS",
+                "# TYPE paladium_db_slow_queries_total counter",
+                f"paladium_db_slow_queries_total {self.slow_queries}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+registry = _Registry()
+
+
+def render_metrics() -> str:
+    return registry.render()
+
+
+def instrument_engine(engine):
+    """Count and time every statement run on `engine`, logging slow ones"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_seconds += elapsed
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            registry.slow_query()
+            logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, statement)
+
+
+@contextmanager
+def track_ai():
+    """Account the wrapped OpenAI call to the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.ai_calls += 1
+            stats.ai_seconds += time.perf_counter() - started
+
+
+def _profile_report(profiler: cProfile.Profile) -> str:
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+    return out.getvalue()
+
+
+def _profiled(endpoint):
+    # include_router() rebuilds every route from the already wrapped endpoint
+    if getattr(endpoint, "__profiled__", False):
+        return endpoint
+
+    if asyncio.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            stats = _request_stats.get()
+            if stats is None or not stats.profile_requested:
+                return await endpoint(*args, **kwargs)
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                profiler.disable()
+                stats.profile = _profile_report(profiler)
+
+        async_wrapper.__profiled__ = True
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        stats = _request_stats.get()
+        if stats is None or not stats.profile_requested:
+            return endpoint(*args, **kwargs)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            profiler.disable()
+            stats.profile = _profile_report(profiler)
+
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute whose endpoint can be profiled on demand.
+
+    Sync endpoints run in a worker thread, where a profiler enabled by the
+    middleware would see nothing, so the endpoint itself is wrapped.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _profiled(endpoint), **kwargs)
+
+
+def _is_admin(request: Request) -> bool:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        return decode_token(token).get("type") == "admin"
+    except Exception:
+        return False
+
+
+def _route_template(request: Request) -> str:
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """Record latency, SQL and OpenAI time per request; serve ?profile=1 to admins"""
+
+    async def dispatch(self, request: Request, call_next):
+        stats = RequestStats()
+        if request.query_params.get("profile") == "1":
+            if not _is_admin(request):
+                return PlainTextResponse("Admin access required", status_code=403)
+            stats.profile_requested = True
+
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            _request_stats.reset(token)
+        elapsed = time.perf_counter() - started
+
+        route = _route_template(request)
+        registry.observe(request.method, route, response.status_code, elapsed, stats)
+        response.headers["Server-Timing"] = (
+            f"db;dur={stats.db_seconds * 1000:.1f}, "
+            f"ai;dur={stats.ai_seconds * 1000:.1f}, "
+            f"total;dur={elapsed * 1000:.1f}"
+        )
+
+        if stats.profile is not None:
+            summary = (
+                f"{request.method} {route} -> {response.status_code}\n"
+                f"total {elapsed * 1000:.1f} ms, {stats.statements} SQL statements "
+                f"({stats.db_seconds * 1000:.1f} ms), {stats.ai_calls} AI calls "
+                f"({stats.ai_seconds * 1000:.1f} ms)\n\n"
+            )
+            return PlainTextResponse(summary + stats.profile)
+        return response
@@ -19,6 +19,31 @@ class AddMemberRequest(BaseModel):
     annotator_id: int
 
 
+class BulkMembersRequest(BaseModel):
+    annotator_ids: list[int]
+
+
+class BulkImagesRequest(BaseModel):
+    """Images by id, or matching a tag expression as in /images/search"""
+
+    image_ids: Optional[list[int]] = None
+    q: Optional[str] = None
+    min_agreement: int = 1
+    # Only match images of this group
+    source_group_id: Optional[int] = None
+
+
+class BulkMembershipResult(BaseModel):
+    requested: int
+    # Added or removed
+    changed: int
+    # Already in (or not in) the group
+    unchanged: int
+    not_found: int
+    # Annotators left in the group they belong to
+    in_other_group: int = 0
+
+
 class AnnotatorCreate(BaseModel):
     name: str
     email: EmailStr
@@ -42,7 +67,19 @@ class AnnotationCreate(BaseModel):
     tag_names: list[str]
 
 
-class ImageResponse(BaseModel):
+class ImageMeta(BaseModel):
+    """Read at upload, unknown for images never decoded"""
+
+    width: Optional[int] = None
+    height: Optional[int] = None
+    mime_type: Optional[str] = None
+    byte_size: Optional[int] = None
+    orientation: Optional[int] = None
+    # Tiny JPEG data URL to show blurred while the image loads
+    placeholder: Optional[str] = None
+
+
+class ImageResponse(ImageMeta):
     id: int
     name: str
     url: str
@@ -50,6 +87,195 @@ class ImageResponse(BaseModel):
     is_classified: bool
     classified_at: Optional[datetime]
     date_added: datetime
+    # Value of labeling this image next, see dal.priority; None until scored
+    priority: Optional[float] = None
+
+
+class TagStat(BaseModel):
+    id: int
+    name: str
+    count: int
+    percentage: int
+
+
+class RelatedTag(BaseModel):
+    tag: str
+    count: int
+    npmi: float
+
+
+class SynonymCandidate(BaseModel):
+    tag: str
+    images: int
+    together: int
+    npmi: float
+
+
+class MergeSuggestion(BaseModel):
+    source: str
+    target: str
+    source_images: int
+    target_images: int
+    images: int
+    together: int
+    npmi: float
+
+
+class TagSearchResult(BaseModel):
+    id: int
+    name: str
+    usage: int
+    match: str
+    score: float
+
+
+class GroupRef(BaseModel):
+    id: int
+    name: str
+
+
+class ImageListItem(ImageMeta):
+    id: int
+    name: str
+    url: str
+    tags: list[TagStat]
+    groups: list[GroupRef]
+    total_annotators: int
+    has_conflict: bool
+    date_added: Optional[datetime]
+
+
+class DuplicateImage(ImageMeta):
+    id: int
+    name: str
+    url: str
+    distance: int
+    total_annotators: int
+
+
+class DuplicateCluster(BaseModel):
+    size: int
+    images: list[DuplicateImage]
+
+
+class ImageRef(ImageMeta):
+    id: int
+    name: str
+    url: str
+
+
+class ImageSearchResult(BaseModel):
+    total: int
+    images: list[ImageRef]
+
+
+class OutboxEntry(BaseModel):
+    id: int
+    topic: str
+    payload: dict
+    created_at: datetime
+
+
+class OutboxPage(BaseModel):
+    events: list[OutboxEntry]
+    next_after: int
+
+
+class AnnotationChangeEntry(BaseModel):
+    id: int
+    annotation_id: int
+    image_id: Optional[int]
+    annotator_id: int
+    change: str
+    operation: str
+    actor: Optional[str]
+    added: list[str]
+    removed: list[str]
+    created_at: datetime
+
+
+class AnnotationState(BaseModel):
+    annotation_id: int
+    image_id: int
+    annotator_id: int
+    tags: list[str]
+
+
+class AnnotationsAsOf(BaseModel):
+    as_of: datetime
+    total: int
+    annotations: list[AnnotationState]
+
+
+class SnapshotInfo(BaseModel):
+    id: int
+    change_id: int
+    taken_at: datetime
+    annotations: int
+
+
+class AnalyticsSnapshot(BaseModel):
+    change_id: int
+    taken_at: datetime
+    annotations: int
+    rows: int
+
+
+class TagCount(BaseModel):
+    tag: str
+    count: int
+    share: float
+
+
+class TagHistogram(BaseModel):
+    snapshot_at: datetime
+    annotations: int
+    tags: list[TagCount]
+
+
+class TagCooccurrence(BaseModel):
+    snapshot_at: datetime
+    tags: list[str]
+    counts: list[list[int]]
+
+
+class LabelRatePoint(BaseModel):
+    start: datetime
+    count: int
+
+
+class AnnotatorLabelRate(BaseModel):
+    annotator_id: int
+    total: int
+    points: list[LabelRatePoint]
+
+
+class LabelRate(BaseModel):
+    snapshot_at: datetime
+    bucket: str
+    annotators: list[AnnotatorLabelRate]
+
+
+class SignedUrl(BaseModel):
+    url: str
+    expires_at: datetime
+
+
+class AnnotationRow(BaseModel):
+    annotation_id: int
+    image_id: int
+    annotator_id: int
+    annotator_name: Optional[str]
+    image_path: Optional[str]
+    tags: list[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+
+class AnnotationList(BaseModel):
+    ok: bool
+    total: int
+    annotations: list[AnnotationRow]
 
 
 class AITagSuggestion(BaseModel):
@@ -85,3 +311,37 @@ class UserResponse(BaseModel):
     id: int
     email: str
     type: str
+
+
+class PrincipalCost(BaseModel):
+    principal: str
+    endpoint_class: str
+    requests: int
+    # Turned away with 429 or 503
+    rejected: int
+    ai_calls: int
+    ai_seconds: float
+    db_seconds: float
+    seconds: float
+
+
+class GroupStats(BaseModel):
+    group_id: int
+    name: str
+    total_images: int
+    total_annotators: int
+    expected_labels: int
+    completed_labels: int
+    remaining_labels: int
+    progress_percentage: float
+    labels_per_hour: Optional[float]
+
+
+class AnnotatorStats(BaseModel):
+    annotator_id: int
+    name: str
+    total_images: int
+    classified_images: int
+    remaining_images: int
+    progress_percentage: float
+    labels_per_hour: Optional[float]
@@ -0,0 +1,310 @@
+"""Admission control state: token buckets per principal and endpoint class,
+concurrency slots per endpoint class and the cost charged to each principal.
+
+Kept in this process by default, so every worker enforces its own limits.
+ADMISSION_BACKEND_URL (defaulting to CACHE_BACKEND_URL) shares them between
+workers: a Redis URL, or a SQLite file standing in for it on a single host.
+Backends with `blocking` set do I/O and are called off the event loop.
+"""
+
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+from core.utils.cache import SqliteFile
+
+COSTS = ("requests", "rejected", "ai_calls", "ai_seconds", "db_seconds", "seconds")
+# A shared slot not released by then (its worker died) is reclaimed
+SLOT_LEASE = 600
+
+
+@dataclass(frozen=True)
+class EndpointClass:
+    name: str
+    # Tokens per second and principal, each admitted request takes one
+    rate: float
+    burst: int
+    # Requests in flight, across the workers sharing the backend
+    concurrency: int
+    # Requests of this worker waiting for a slot, and for how long at most
+    queue: int
+    queue_timeout: float
+
+
+def _endpoint_class(name: str, **defaults) -> EndpointClass:
+    """Defaults overridden by ADMISSION_<NAME>_<FIELD>, e.g. ADMISSION_AI_RATE"""
+    fields = {
+        field: type(default)(
+            os.getenv(f"ADMISSION_{name.upper()}_{field.upper()}", default)
+        )
+        for field, default in defaults.items()
+    }
+    return EndpointClass(name, **fields)
+
+
+CLASSES = {
+    endpoint.name: endpoint
+    for endpoint in (
+        _endpoint_class(
+            "ai", rate=0.5, burst=10, concurrency=4, queue=16, queue_timeout=10.0
+        ),
+        _endpoint_class(
+            "upload", rate=2.0, burst=20, concurrency=8, queue=32, queue_timeout=30.0
+        ),
+        _endpoint_class(
+            "export", rate=0.1, burst=3, concurrency=2, queue=4, queue_timeout=30.0
+        ),
+    )
+}
+
+
+def _take(tokens: float, rate: float, burst: int, cost: float, force: bool):
+    """New balance and the wait until `cost` tokens are there, 0 if taken.
+
+    Forced takes charge work already done and may leave the balance negative,
+    down to -burst, which delays the principal's next requests.
+    """
+    if force or tokens >= cost:
+        return max(tokens - cost, -burst), 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class MemoryBackend:
+    """Buckets, slots and costs kept in this process only"""
+
+    blocking = False
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._slots: dict[str, int] = {}
+        self._costs: dict[tuple[str, str], dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(
+        self, key: str, rate: float, burst: int, cost: float = 1, force: bool = False
+    ) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            tokens, wait = _take(tokens, rate, burst, cost, force)
+            self._buckets[key] = (tokens, now)
+        return wait
+
+    def acquire(self, name: str, limit: int) -> Optional[str]:
+        with self._lock:
+            if self._slots.get(name, 0) >= limit:
+                return None
+            self._slots[name] = self._slots.get(name, 0) + 1
+        return name
+
+    def release(self, name: str, slot: str):
+        with self._lock:
+            self._slots[name] -= 1
+
+    def charge(self, principal: str, endpoint: str, **amounts: float):
+        with self._lock:
+            totals = self._costs.setdefault(
+                (principal, endpoint), dict.fromkeys(COSTS, 0)
+            )
+            for cost, amount in amounts.items():
+                totals[cost] += amount
+
+    def costs(self) -> list[dict]:
+        with self._lock:
+            return [
+                {"principal": principal, "endpoint_class": endpoint, **totals}
+                for (principal, endpoint), totals in self._costs.items()
+            ]
+
+
+class SqliteBackend:
+    """Buckets, slots and costs in a SQLite file shared by the workers of a host.
+
+    Stand-in for Redis when a deployment is a single machine.
+    """
+
+    blocking = True
+
+    def __init__(self, url: str):
+        self.store = SqliteFile(
+            url,
+            "CREATE TABLE IF NOT EXISTS rate_buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS slots "
+            "(id TEXT PRIMARY KEY, name TEXT NOT NULL, expires REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS costs (principal TEXT, endpoint_class TEXT, "
+            + ", ".join(f"{cost} REAL NOT NULL DEFAULT 0" for cost in COSTS)
+            + ", PRIMARY KEY (principal, endpoint_class))",
+        )
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, reads and writes are atomic
+        conn = self.store.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def take(
+        self, key: str, rate: float, burst: int, cost: float = 1, force: bool = False
+    ) -> float:
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens = burst if row is None else row[0] + max(now - row[1], 0) * rate
+            tokens, wait = _take(min(burst, tokens), rate, burst, cost, force)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+        return wait
+
+    def acquire(self, name: str, limit: int) -> Optional[str]:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM slots WHERE name = ? AND expires < ?", (name, now)
+            )
+            (taken,) = conn.execute(
+                "SELECT count(*) FROM slots WHERE name = ?", (name,)
+            ).fetchone()
+            if taken >= limit:
+                return None
+            slot = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO slots VALUES (?, ?, ?)", (slot, name, now + SLOT_LEASE)
+            )
+        return slot
+
+    def release(self, name: str, slot: str):
+        self.store.connection().execute("DELETE FROM slots WHERE id = ?", (slot,))
+
+    def charge(self, principal: str, endpoint: str, **amounts: float):
+        columns = list(amounts)
+        self.store.connection().execute(
+            f"INSERT INTO costs (principal, endpoint_class, {', '.join(columns)}) "
+            f"VALUES (?, ?{', ?' * len(columns)}) "
+            "ON CONFLICT (principal, endpoint_class) DO UPDATE SET "
+            + ", ".join(
+                f"{column} = {column} + excluded.{column}" for column in columns
+            ),
+            (principal, endpoint, *amounts.values()),
+        )
+
+    def costs(self) -> list[dict]:
+        rows = self.store.connection().execute(
+            f"SELECT principal, endpoint_class, {', '.join(COSTS)} FROM costs"
+        )
+        return [dict(zip(("principal", "endpoint_class", *COSTS), row)) for row in rows]
+
+
+# Refill and take in one round trip; Lua numbers come back as integers, hence
+# the string
+_TAKE = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+local updated = tonumber(redis.call('HGET', KEYS[1], 'updated'))
+local now, rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local cost, force = tonumber(ARGV[4]), ARGV[5] == '1'
+if tokens == nil then tokens = burst else
+    tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate) end
+local wait = 0
+if force or tokens >= cost then tokens = math.max(tokens - cost, -burst)
+else wait = (cost - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(2 * burst / rate) + 1)
+return tostring(wait)
+"""
+_ACQUIRE = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then return 0 end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+return 1
+"""
+
+
+class SharedBackend:
+    """Buckets, slots and costs shared by every worker through Redis.
+
+    Slots are members of a sorted set scored by their lease expiry, costs are
+    hashes listed in a set. Needs a client with Lua scripting, e.g. redis-py.
+    """
+
+    blocking = True
+
+    def __init__(self, client, prefix: str = "paladium:admission:"):
+        self.client = client
+        self.prefix = prefix
+        self._take = client.register_script(_TAKE)
+        self._acquire = client.register_script(_ACQUIRE)
+
+    def take(
+        self, key: str, rate: float, burst: int, cost: float = 1, force: bool = False
+    ) -> float:
+        return float(
+            self._take(
+                keys=[f"{self.prefix}bucket:{key}"],
+                args=[time.time(), rate, burst, cost, int(force)],
+            )
+        )
+
+    def acquire(self, name: str, limit: int) -> Optional[str]:
+        now = time.time()
+        slot = uuid.uuid4().hex
+        admitted = self._acquire(
+            keys=[f"{self.prefix}slots:{name}"],
+            args=[now, limit, now + SLOT_LEASE, slot],
+        )
+        return slot if admitted else None
+
+    def release(self, name: str, slot: str):
+        self.client.zrem(f"{self.prefix}slots:{name}", slot)
+
+    def charge(self, principal: str, endpoint: str, **amounts: float):
+        key = f"{self.prefix}cost:{endpoint}:{principal}"
+        pipeline = self.client.pipeline()
+        for cost, amount in amounts.items():
+            pipeline.hincrbyfloat(key, cost, amount)
+        pipeline.sadd(f"{self.prefix}costs", f"{endpoint} {principal}")
+        pipeline.execute()
+
+    def costs(self) -> list[dict]:
+        members = [
+            member.decode().split(" ", 1)
+            for member in self.client.smembers(f"{self.prefix}costs")
+        ]
+        pipeline = self.client.pipeline()
+        for endpoint, principal in members:
+            pipeline.hgetall(f"{self.prefix}cost:{endpoint}:{principal}")
+        return [
+            {
+                "principal": principal,
+                "endpoint_class": endpoint,
+                **{cost: float(totals.get(cost.encode(), 0)) for cost in COSTS},
+            }
+            for (endpoint, principal), totals in zip(members, pipeline.execute())
+        ]
+
+
+def _build_backend():
+    url = os.getenv("ADMISSION_BACKEND_URL", os.getenv("CACHE_BACKEND_URL"))
+    if url and url.startswith("redis"):
+        import redis
+
+        return SharedBackend(redis.Redis.from_url(url))
+    if url and url.startswith("sqlite"):
+        return SqliteBackend(url)
+    return MemoryBackend()
+
+
+backend = _build_backend()
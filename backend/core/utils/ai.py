@@ -0,0 +1,190 @@
+import base64
+import os
+import re
+from collections import defaultdict
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from core.utils import embeddings
+from core.utils.storage import key_for, storage
+from dal.models import Annotation, Tags
+from dal.models.annotator import annotation_tags
+
+MODEL = "gpt-4o-mini"
+SUGGESTION_COUNT = 5
+
+# Off by default: the descriptor matches look, not subject, and an image
+# with the palette of a labeled one would skip the model
+LOCAL_SUGGESTIONS = os.getenv("LOCAL_SUGGESTIONS", "0") == "1"
+LOCAL_NEIGHBOURS = int(os.getenv("LOCAL_SUGGEST_NEIGHBOURS", "10"))
+LOCAL_MIN_SIMILARITY = float(os.getenv("LOCAL_SUGGEST_MIN_SIMILARITY", "0.9"))
+# Labeled neighbours that must give a tag before it is suggested without
+# the model
+LOCAL_MIN_AGREEMENT = int(os.getenv("LOCAL_SUGGEST_MIN_AGREEMENT", "3"))
+
+_SEPARATORS = re.compile(r"[\n•;]")
+
+
+def popular_tags(db: Session, limit: int = 10) -> list[str]:
+    """Most used tag names, most popular first"""
+    rows = (
+        db.query(Tags.name, func.count(Tags.id).label("count"))
+        .join(Annotation.tags)
+        .group_by(Tags.name)
+        .order_by(func.count(Tags.id).desc())
+        .limit(limit)
+        .all()
+    )
+    return [row[0] for row in rows]
+
+
+def suggestion_prompt(popular: list[str]) -> str:
+    common = ", ".join(popular) if popular else "none"
+    return (
+        "You are an image tagging assistant. "
+        "Suggest exactly 5 short, relevant, lowercase tags (no '#', no spaces—use hyphens), "
+        f"favoring common tags when relevant. Common tags in this dataset: {common}.\n"
+        "Return them as a comma-separated list only."
+    )
+
+
+def image_data_url(url: str, mime_type: Optional[str] = None) -> str:
+    """The stored image inlined, with its own type rather than always JPEG"""
+    import filetype
+
+    data = storage.read(key_for(url))
+    mime_type = mime_type or filetype.guess_mime(data) or "image/jpeg"
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+def vision_messages(prompt: str, data_url: str) -> list[dict]:
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": data_url}},
+            ],
+        }
+    ]
+
+
+def _normalize(raw: str) -> str:
+    return raw.strip().lower().strip("#").replace(" ", "-")
+
+
+def _key(tag: str) -> str:
+    # "street-art", "street art" and "streetarts" are the same suggestion
+    return tag.replace("-", "").removesuffix("s")
+
+
+class TagStreamParser:
+    """Turns completion text, whole or in chunks, into distinct tags.
+
+    A tag is complete once a separator follows it. Near-duplicates of a
+    popular tag are replaced by the popular spelling so suggestions do not
+    grow the vocabulary with variants.
+    """
+
+    def __init__(self, popular: list[str], limit: int = SUGGESTION_COUNT):
+        self.popular = popular
+        self.limit = limit
+        self.tags: list[str] = []
+        self._canonical = {_key(tag): tag for tag in popular}
+        self._seen: set[str] = set()
+        self._buffer = ""
+
+    @property
+    def done(self) -> bool:
+        return len(self.tags) >= self.limit
+
+    def _accept(self, pieces: list[str]) -> list[str]:
+        accepted = []
+        for piece in pieces:
+            tag = _normalize(piece)
+            if not tag or self.done:
+                continue
+            key = _key(tag)
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            tag = self._canonical.get(key, tag)
+            self.tags.append(tag)
+            accepted.append(tag)
+        return accepted
+
+    def feed(self, text: str) -> list[str]:
+        """New complete tags found in this chunk"""
+        *complete, self._buffer = _SEPARATORS.sub(",", self._buffer + text).split(",")
+        return self._accept(complete)
+
+    def finish(self) -> list[str]:
+        """The trailing tag, then popular tags until the limit is reached"""
+        accepted = self._accept([self._buffer])
+        self._buffer = ""
+        return accepted + self._accept(self.popular)
+
+
+def local_suggestions(
+    db: Session, image_id: int, url: str, popular: list[str]
+) -> Optional[list[str]]:
+    """Tags of the most similar labeled images, weighted by similarity.
+
+    Each neighbour votes for its tags with similarity * share of its
+    annotators that used the tag; only tags given by LOCAL_MIN_AGREEMENT
+    neighbours count. None when too few labeled images are similar enough
+    or they do not agree, the caller then asks the model.
+    """
+    if not LOCAL_SUGGESTIONS:
+        return None
+    vector = embeddings.vector_for(image_id, url)
+    if vector is None:
+        return None
+
+    # Over-fetch: the closest images are not necessarily labeled yet
+    similarity = {
+        neighbour: score
+        for neighbour, score in embeddings.index().nearest(
+            vector, LOCAL_NEIGHBOURS * 5, exclude=image_id
+        )
+        if score >= LOCAL_MIN_SIMILARITY
+    }
+    if not similarity:
+        return None
+
+    annotators = dict(
+        db.execute(
+            select(Annotation.image_id, func.count(Annotation.id))
+            .where(Annotation.image_id.in_(similarity))
+            .group_by(Annotation.image_id)
+        ).all()
+    )
+    labeled = set(sorted(annotators, key=similarity.get, reverse=True)[:LOCAL_NEIGHBOURS])
+    if len(labeled) < LOCAL_MIN_AGREEMENT:
+        return None
+
+    scores = defaultdict(float)
+    voters = defaultdict(int)
+    for neighbour, name, count in db.execute(
+        select(Annotation.image_id, Tags.name, func.count())
+        .join(annotation_tags, annotation_tags.c.annotation_id == Annotation.id)
+        .join(Tags, Tags.id == annotation_tags.c.tag_id)
+        .where(Annotation.image_id.in_(labeled))
+        .group_by(Annotation.image_id, Tags.name)
+    ):
+        scores[name] += similarity[neighbour] * count / annotators[neighbour]
+        voters[name] += 1
+    scores = {
+        name: score
+        for name, score in scores.items()
+        if voters[name] >= LOCAL_MIN_AGREEMENT
+    }
+    if not scores:
+        return None
+
+    parser = TagStreamParser(popular)
+    parser.feed(",".join(sorted(scores, key=scores.get, reverse=True)) + ",")
+    parser.finish()
+    return parser.tags
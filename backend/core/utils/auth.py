@@ -1,7 +1,8 @@
-from passlib.context import CryptContext
-from jose import jwt, JWTError
+import functools
 from datetime import datetime, timedelta
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 
@@ -12,19 +13,28 @@ from dal.setup import get_db
 SECRET_KEY = "your-secret-key-change-in-production"
 ALGORITHM = "HS256"
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
 
+# passlib and jose are imported on first use, they add to every cold start
+@functools.cache
+def _pwd_context():
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return _pwd_context().hash(password)
 
 
 def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+    return _pwd_context().verify(plain, hashed)
 
 
 def create_token(user_id: int, user_type: str) -> str:
+    from jose import jwt
+
     expire = datetime.utcnow() + timedelta(hours=24)
     data = {
         "sub": str(user_id),
@@ -35,6 +45,8 @@ def create_token(user_id: int, user_type: str) -> str:
 
 
 def decode_token(token: str):
+    from jose import jwt
+
     payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     return payload
 
@@ -101,3 +113,17 @@ def require_annotator(current_user: dict = Depends(get_current_user)):
             status_code=status.HTTP_403_FORBIDDEN, detail="Annotator access required"
         )
     return current_user["user"]
+
+
+def request_actor(request: Request) -> Optional[str]:
+    """`type:id` of the caller if the request carries a valid token, for audit logs"""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    from jose import JWTError
+
+    try:
+        payload = decode_token(token)
+    except JWTError:
+        return None
+    return f"{payload.get('type')}:{payload.get('sub')}"
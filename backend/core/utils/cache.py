@@ -0,0 +1,201 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional
+
+
+class TTLCache:
+    """Thread-safe in-process cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: dict[Any, tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get_or_set(self, key: Any, factory: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+
+        value = factory()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LRUByteCache:
+    """Thread-safe LRU of bytes values bounded by their total size"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        # A single oversized entry would flush everything else
+        if len(value) > self.max_bytes // 4:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class MemoryBackend:
+    """Response cache and table versions kept in this process only"""
+
+    blocking = False
+
+    def __init__(self, max_bytes: int):
+        self.entries = LRUByteCache(max_bytes)
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.entries.get(key)
+
+    def set(self, key: str, value: bytes):
+        self.entries.set(key, value)
+
+    def bump(self, table: str):
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+
+    def versions(self, tables: Iterable[str]) -> list[int]:
+        with self._lock:
+            return [self._versions.get(table, 0) for table in tables]
+
+
+class SharedBackend:
+    """Response cache and table versions shared by every worker.
+
+    `client` only needs Redis-style `get`, `set(key, value, ex=...)`, `incr`
+    and `mget`, so any compatible object (including a dict-backed fake) works.
+    Entries expire after `ttl` seconds since the store is not size bounded here.
+    """
+
+    blocking = True
+
+    def __init__(self, client, ttl: int = 300, prefix: str = "paladium:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(f"{self.prefix}response:{key}")
+
+    def set(self, key: str, value: bytes):
+        self.client.set(f"{self.prefix}response:{key}", value, ex=self.ttl)
+
+    def bump(self, table: str):
+        self.client.incr(f"{self.prefix}version:{table}")
+
+    def versions(self, tables: Iterable[str]) -> list[int]:
+        keys = [f"{self.prefix}version:{table}" for table in tables]
+        return [int(value or 0) for value in self.client.mget(keys)]
+
+
+class SqliteFile:
+    """Per-thread connections to a small SQLite file shared by local workers"""
+
+    def __init__(self, url: str, schema: str):
+        self.path = url.removeprefix("sqlite:///")
+        self._local = threading.local()
+        with self.connection() as conn:
+            conn.executescript(schema)
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+class SqliteBackend(MemoryBackend):
+    """Response entries per process, table versions in a SQLite file.
+
+    Every worker on the host reads the same versions, so a write served by
+    one worker invalidates the caches of all of them. Stand-in for Redis
+    when a deployment is a single machine.
+    """
+
+    # Versions are read from the file, waiting on busy_timeout under writes
+    blocking = True
+
+    def __init__(self, url: str, max_bytes: int):
+        super().__init__(max_bytes)
+        self.store = SqliteFile(
+            url,
+            "CREATE TABLE IF NOT EXISTS versions "
+            "(name TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+        )
+
+    def bump(self, table: str):
+        self.store.connection().execute(
+            "INSERT INTO versions VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+            (table,),
+        )
+
+    def versions(self, tables: Iterable[str]) -> list[int]:
+        tables = list(tables)
+        rows = self.store.connection().execute(
+            f"SELECT name, version FROM versions WHERE name IN ({','.join('?' * len(tables))})",
+            tables,
+        )
+        found = dict(rows.fetchall())
+        return [found.get(table, 0) for table in tables]
+
+
+def _build_backend():
+    url = os.getenv("CACHE_BACKEND_URL")
+    max_bytes = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    if url and url.startswith("redis"):
+        import redis
+
+        return SharedBackend(redis.Redis.from_url(url))
+    if url and url.startswith("sqlite"):
+        return SqliteBackend(url, max_bytes)
+    return MemoryBackend(max_bytes)
+
+
+backend = _build_backend()
+
+
+def bump_versions(*tables: str):
+    """Invalidate every cached response built from one of these tables"""
+    for table in tables:
+        backend.bump(table)
+
+
+def table_versions(tables: Iterable[str]) -> list[int]:
+    return backend.versions(tables)
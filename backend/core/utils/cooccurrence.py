@@ -0,0 +1,160 @@
+from collections import defaultdict
+from itertools import combinations
+from typing import Iterable
+
+import numpy as np
+
+# Pairs expanded at once while counting, bounds the temporary arrays
+PAIR_CHUNK = 4_000_000
+
+
+def pair_counts(
+    groups: np.ndarray, tags: np.ndarray, size: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Pairs of distinct tags sharing a group, as sorted `a * size + b` codes
+    with a < b, and how many groups share each.
+
+    `groups` must be sorted and a tag must appear at most once per group.
+    """
+    if not len(groups):
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    tags = tags.astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    sizes = np.diff(np.r_[starts, len(groups)])
+    squares = np.cumsum(sizes.astype(np.int64) ** 2)
+
+    codes, counts = [], []
+    first = 0
+    while first < len(starts):
+        last = max(
+            first + 1, int(np.searchsorted(squares, squares[first] + PAIR_CHUNK))
+        )
+        chunk_sizes = sizes[first:last]
+        begin = starts[first]
+        end = starts[last - 1] + chunk_sizes[-1]
+        # Each element pairs with every element of its group, itself included
+        repeats = np.repeat(chunk_sizes, chunk_sizes)
+        left = np.repeat(np.arange(begin, end), repeats)
+        group_start = np.repeat(np.repeat(starts[first:last], chunk_sizes), repeats)
+        within = np.arange(len(left)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+        a, b = tags[left], tags[group_start + within]
+        keep = a < b
+        chunk_codes, chunk_counts = np.unique(
+            a[keep] * size + b[keep], return_counts=True
+        )
+        codes.append(chunk_codes)
+        counts.append(chunk_counts)
+        first = last
+
+    codes, counts = np.concatenate(codes), np.concatenate(counts)
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+    boundaries = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    return codes[boundaries], np.add.reduceat(counts[order], boundaries)
+
+
+class CooccurrenceMatrix:
+    """Symmetric tag x tag counts of groups (annotations, images) sharing both
+    tags: CSR rows, plus an overlay of deltas applied since it was built"""
+
+    def __init__(
+        self,
+        size: int,
+        codes: np.ndarray,
+        counts: np.ndarray,
+        frequency: np.ndarray,
+        total: int,
+    ):
+        a, b = codes // size, codes % size
+        rows, cols = np.r_[a, b], np.r_[b, a]
+        order = np.lexsort((cols, rows))
+        self.size = size
+        self.indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=size))]
+        self.indices = cols[order].astype(np.int32)
+        self.data = np.r_[counts, counts][order].astype(np.int32)
+        self.frequency = frequency.astype(np.int64)
+        self.total = total
+        self.overlay: dict[int, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.overlay_size = 0
+
+    def _grow(self, tag_id: int):
+        if tag_id >= len(self.frequency):
+            grown = np.zeros(tag_id * 2 + 1, np.int64)
+            grown[: len(self.frequency)] = self.frequency
+            self.frequency = grown
+
+    def retag(self, before: Iterable[int], after: Iterable[int]):
+        """A group's tag set went from `before` to `after`"""
+        before, after = set(before), set(after)
+        if before == after:
+            return
+        for tag_id in before | after:
+            self._grow(tag_id)
+        for tag_id in before - after:
+            self.frequency[tag_id] -= 1
+        for tag_id in after - before:
+            self.frequency[tag_id] += 1
+        self.total += bool(after) - bool(before)
+        for a, b in combinations(sorted(before), 2):
+            if a not in after or b not in after:
+                self._add(a, b, -1)
+        for a, b in combinations(sorted(after), 2):
+            if a not in before or b not in before:
+                self._add(a, b, 1)
+
+    def _add(self, a: int, b: int, delta: int):
+        self.overlay[a][b] += delta
+        self.overlay[b][a] += delta
+        self.overlay_size += 2
+
+    def row(self, tag_id: int) -> tuple[np.ndarray, np.ndarray]:
+        """Tags sharing a group with `tag_id` and in how many groups"""
+        if tag_id < self.size:
+            start, end = self.indptr[tag_id], self.indptr[tag_id + 1]
+            cols, counts = self.indices[start:end], self.data[start:end]
+        else:
+            cols, counts = np.zeros(0, np.int32), np.zeros(0, np.int32)
+        deltas = self.overlay.get(tag_id)
+        if deltas:
+            cols = np.r_[cols, np.fromiter(deltas.keys(), np.int64, len(deltas))]
+            counts = np.r_[counts, np.fromiter(deltas.values(), np.int64, len(deltas))]
+            cols, inverse = np.unique(cols, return_inverse=True)
+            counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        keep = counts > 0
+        return cols[keep].astype(np.int64), counts[keep].astype(np.int64)
+
+    def pairs(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Every (a, b, count) with a < b, ordered by a then b"""
+        rows = np.repeat(np.arange(self.size), np.diff(self.indptr))
+        upper = rows < self.indices
+        a, b = rows[upper].astype(np.int64), self.indices[upper].astype(np.int64)
+        counts = self.data[upper].astype(np.int64)
+        extra = [
+            (x, y, delta)
+            for x, deltas in self.overlay.items()
+            for y, delta in deltas.items()
+            if x < y and delta
+        ]
+        if extra:
+            size = max(self.size, len(self.frequency))
+            x, y, delta = (np.array(column, np.int64) for column in zip(*extra))
+            codes, inverse = np.unique(
+                np.r_[a * size + b, x * size + y], return_inverse=True
+            )
+            counts = np.bincount(inverse, weights=np.r_[counts, delta]).astype(np.int64)
+            a, b = codes // size, codes % size
+        keep = counts > 0
+        return a[keep], b[keep], counts[keep]
+
+
+def npmi(
+    together: np.ndarray, first: np.ndarray, second: np.ndarray, total: int
+) -> np.ndarray:
+    """Normalised pointwise mutual information: 1 when two tags always go
+    together, 0 when independent, -1 when they never meet"""
+    together = np.maximum(together, 1e-12)
+    p_xy = together / total
+    pmi = np.log(p_xy / ((first / total) * (second / total)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = pmi / -np.log(p_xy)
+    return np.where(p_xy >= 1, 1.0, np.clip(result, -1, 1))
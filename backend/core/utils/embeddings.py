@@ -0,0 +1,299 @@
+"""CPU-only image embeddings for local tag suggestions.
+
+Vectors are computed in a process pool and stored in a memory-mapped matrix
+under EMBEDDINGS_DIR, one row per image, so they survive restarts and the
+k-NN scan never loads the whole matrix into the heap. The embedding is a
+hand-crafted descriptor (structure thumbnail + colour histogram): cheap,
+deterministic and good at what matters here, finding images that look like
+already labeled ones.
+"""
+
+import fcntl
+import io
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image as PILImage, ImageOps
+
+from core.utils.storage import NotFound, key_for, storage
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 384
+BATCH_SIZE = 64
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def embed_image(content: bytes) -> np.ndarray:
+    """L2-normalised float32 descriptor of one encoded image"""
+    with PILImage.open(io.BytesIO(content)) as img:
+        img.draft("RGB", (64, 64))  # JPEG: decode at reduced scale
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        gray = img.convert("L").resize((16, 16), PILImage.Resampling.BILINEAR)
+        hsv = img.resize((32, 32), PILImage.Resampling.BILINEAR).convert("HSV")
+
+    structure = np.asarray(gray, dtype=np.float32).ravel()
+    structure = _unit(structure - structure.mean())
+
+    h, s, v = (np.asarray(c, dtype=np.int32).ravel() for c in hsv.split())
+    bins = (h * 8 // 256) * 16 + (s * 4 // 256) * 4 + v * 4 // 256
+    colour = _unit(np.bincount(bins, minlength=128).astype(np.float32))
+
+    return _unit(np.concatenate([structure, colour])).astype(np.float32)
+
+
+def embed_batch(keys: list[str]) -> list[Optional[np.ndarray]]:
+    """Runs in a worker process; missing or unreadable images yield None"""
+    vectors = []
+    for key in keys:
+        try:
+            vectors.append(embed_image(storage.read(key)))
+        except (NotFound, OSError, ValueError):
+            vectors.append(None)
+    return vectors
+
+
+class EmbeddingIndex:
+    """Append-only matrix of image vectors backed by two memory-mapped files.
+
+    Several workers may share the files: appends happen under a file lock
+    and each process picks up rows written by the others before using them.
+    A row's id is written after its vector, so a visible id is a complete row.
+    Removing an image appends a row with its negated id, a tombstone.
+    """
+
+    def __init__(self, directory: Path, dim: int = EMBEDDING_DIM, capacity: int = 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self._lock = threading.Lock()
+
+        existing = self.directory / "ids.i64"
+        if existing.exists():
+            capacity = max(capacity, existing.stat().st_size // 8)
+        self._open(capacity)
+        # Rows read so far, live or not, and the live row of every image
+        self._count = 0
+        self._rows: dict[int, int] = {}
+        self._dead: set[int] = set()
+        self._sync()
+
+    def _open(self, capacity: int):
+        for name, row_bytes in (("vectors.f32", 4 * self.dim), ("ids.i64", 8)):
+            path = self.directory / name
+            with open(path, "ab") as f:
+                if f.tell() < capacity * row_bytes:
+                    f.truncate(capacity * row_bytes)
+        self.capacity = capacity
+        self._vectors = np.memmap(
+            self.directory / "vectors.f32",
+            dtype=np.float32,
+            mode="r+",
+            shape=(capacity, self.dim),
+        )
+        self._ids = np.memmap(
+            self.directory / "ids.i64", dtype=np.int64, mode="r+", shape=(capacity,)
+        )
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, image_id: int) -> bool:
+        return image_id in self._rows
+
+    def _sync(self):
+        """Pick up rows appended by other processes"""
+        size = (self.directory / "ids.i64").stat().st_size // 8
+        if size > self.capacity:
+            self._open(size)
+        while self._count < self.capacity and self._ids[self._count]:
+            image_id = int(self._ids[self._count])
+            previous = self._rows.pop(abs(image_id), None)
+            if previous is not None:
+                self._dead.add(previous)
+            if image_id > 0:
+                self._rows[image_id] = self._count
+            else:
+                self._dead.add(self._count)
+            self._count += 1
+
+    @contextmanager
+    def _exclusive(self):
+        with self._lock, open(self.directory / "lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._sync()
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def add(self, image_id: int, vector: np.ndarray):
+        with self._exclusive():
+            row = self._rows.get(image_id)
+            if row is None:
+                row = self._append()
+            self._vectors[row] = vector
+            self._ids[row] = image_id
+            self._rows[image_id] = row
+
+    def remove(self, image_id: int):
+        """Forget an image; SQLite may give its id to the next one"""
+        with self._exclusive():
+            row = self._rows.pop(image_id, None)
+            if row is None:
+                return
+            self._vectors[row] = 0
+            self._dead.add(row)
+            tombstone = self._append()
+            self._ids[tombstone] = -image_id
+            self._dead.add(tombstone)
+
+    def _append(self) -> int:
+        row = self._count
+        if row >= self.capacity:
+            self.flush()
+            self._open(self.capacity * 2)
+        self._count += 1
+        return row
+
+    def vector(self, image_id: int) -> Optional[np.ndarray]:
+        with self._lock:
+            self._sync()
+            row = self._rows.get(image_id)
+            return None if row is None else np.array(self._vectors[row])
+
+    def nearest(
+        self, vector: np.ndarray, k: int, exclude: Optional[int] = None
+    ) -> list[tuple[int, float]]:
+        """Up to k (image_id, cosine similarity) pairs, most similar first"""
+        with self._lock:
+            self._sync()
+            count = self._count
+            vectors, ids = self._vectors, self._ids
+            hidden = list(self._dead)
+            if exclude is not None and exclude in self._rows:
+                hidden.append(self._rows[exclude])
+        if count == 0:
+            return []
+
+        similarities = vectors[:count] @ vector
+        similarities[hidden] = -np.inf
+        k = min(k, count)
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [
+            (int(ids[row]), float(similarities[row]))
+            for row in top
+            if similarities[row] > -np.inf
+        ]
+
+    def flush(self):
+        self._vectors.flush()
+        self._ids.flush()
+
+
+_index: Optional[EmbeddingIndex] = None
+_index_lock = threading.Lock()
+
+
+def index() -> EmbeddingIndex:
+    """The index under EMBEDDINGS_DIR, opened on first use rather than on
+    import, which would create the directory in every importing process"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = EmbeddingIndex(Path(os.getenv("EMBEDDINGS_DIR", "embeddings")))
+        return _index
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that runs the event loop and DB threads is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=int(os.getenv("EMBEDDING_WORKERS", "2")),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _store(image_ids: list[int], future: Future):
+    if future.cancelled():
+        return
+    if future.exception() is not None:
+        logger.warning("Embedding batch failed: %s", future.exception())
+        return
+    for image_id, vector in zip(image_ids, future.result()):
+        if vector is not None:
+            index().add(image_id, vector)
+
+
+def schedule(images: list[tuple[int, str]]) -> list[Future]:
+    """Embed (image_id, url) pairs in the background, skipping indexed ones"""
+    indexed = index()
+    missing = [(i, url) for i, url in images if i not in indexed]
+    futures = []
+    iterator = iter(missing)
+    while batch := list(itertools.islice(iterator, BATCH_SIZE)):
+        image_ids = [i for i, _ in batch]
+        future = _executor().submit(embed_batch, [key_for(url) for _, url in batch])
+        future.add_done_callback(lambda f, ids=image_ids: _store(ids, f))
+        futures.append(future)
+    return futures
+
+
+def vector_for(image_id: int, url: str) -> Optional[np.ndarray]:
+    """The stored vector, computed in the calling thread when the image is new.
+
+    A single small image is cheaper to embed here than to queue behind a
+    backfill in the pool.
+    """
+    vector = index().vector(image_id)
+    if vector is None:
+        vector = embed_batch([key_for(url)])[0]
+        if vector is not None:
+            index().add(image_id, vector)
+    return vector
+
+
+_claims = []
+
+
+def claim_backfill() -> bool:
+    """True in exactly one of the workers sharing EMBEDDINGS_DIR at a time"""
+    handle = open(index().directory / "backfill.lock", "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return False
+    _claims.append(handle)  # held until the process exits
+    return True
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+    with _index_lock:
+        if _index is not None:
+            _index.flush()
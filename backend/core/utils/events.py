@@ -0,0 +1,202 @@
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import orjson
+
+from core.utils.cache import SqliteFile
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Event:
+    id: int
+    type: str
+    data: dict
+
+
+@dataclass(eq=False)
+class Subscriber:
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue
+    topics: Optional[set[str]] = None
+    annotator_id: Optional[int] = None
+    resyncs: int = field(default=0)
+
+    def wants(self, event: Event) -> bool:
+        if self.topics and event.type.split(".")[0] not in self.topics:
+            return False
+        owner = event.data.get("annotator_id")
+        return self.annotator_id is None or owner is None or owner == self.annotator_id
+
+    def put(self, event: Event):
+        """Runs on the subscriber's loop; never blocks the publisher"""
+        if self.queue.full():
+            # Slow client: drop its backlog and tell it to refetch everything
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.resyncs += 1
+            event = Event(id=event.id, type="resync", data={})
+        self.queue.put_nowait(event)
+
+
+def sse(type: str, data: dict, id: Optional[int] = None) -> str:
+    """One server-sent event frame"""
+    head = f"id: {id}\n" if id is not None else ""
+    return f"{head}event: {type}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+class EventBus:
+    """In-process pub/sub between request handlers and /events subscribers.
+
+    Handlers publish small deltas from any thread; each subscriber gets a
+    bounded queue on its own event loop, so a slow client only ever costs
+    `queue_size` events before being asked to resync.
+    """
+
+    def __init__(self, queue_size: int = 256, relay=None):
+        self.queue_size = queue_size
+        self.relay = relay
+        self._subscribers: set[Subscriber] = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(
+        self, topics: Optional[set[str]] = None, annotator_id: Optional[int] = None
+    ) -> Subscriber:
+        subscriber = Subscriber(
+            loop=asyncio.get_running_loop(),
+            queue=asyncio.Queue(maxsize=self.queue_size),
+            topics=topics,
+            annotator_id=annotator_id,
+        )
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, type: str, **data):
+        self.deliver(type, data)
+        if self.relay is not None:
+            self.relay.send(type, data)
+
+    def deliver(self, type: str, data: dict):
+        """Fan an event out to the subscribers of this process"""
+        event = Event(id=next(self._ids), type=type, data=data)
+        with self._lock:
+            subscribers = [s for s in self._subscribers if s.wants(event)]
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.put, event)
+            except RuntimeError:
+                # Loop already closed, the stream is going away
+                self.unsubscribe(subscriber)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    @property
+    def active(self) -> bool:
+        """Whether publishing reaches anyone; other workers may be listening"""
+        return self.relay is not None or self.subscriber_count > 0
+
+    def start(self):
+        if self.relay is not None:
+            self.relay.start(self.deliver)
+
+    def close(self):
+        """Ask every stream to reconnect (to another worker) and stop relaying"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        event = Event(id=next(self._ids), type="reconnect", data={})
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.put, event)
+            except RuntimeError:
+                pass
+        if self.relay is not None:
+            self.relay.stop()
+
+
+class SqliteRelay:
+    """Forwards events between the workers of one host through a SQLite file.
+
+    Each worker appends what it publishes and polls for rows written by the
+    others; rows older than `retention` seconds are pruned.
+    """
+
+    def __init__(self, url: str, poll_interval: float = 0.2, retention: float = 60):
+        self.store = SqliteFile(
+            url,
+            "CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "origin TEXT, type TEXT, data BLOB, created REAL)",
+        )
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def send(self, type: str, data: dict):
+        self.store.connection().execute(
+            "INSERT INTO events (origin, type, data, created) VALUES (?, ?, ?, ?)",
+            (self.origin, type, orjson.dumps(data), time.time()),
+        )
+
+    def start(self, deliver: Callable[[str, dict], None]):
+        self._stop.clear()
+        last = self.store.connection().execute(
+            "SELECT COALESCE(MAX(id), 0) FROM events"
+        ).fetchone()[0]
+        self._thread = threading.Thread(
+            target=self._poll, args=(deliver, last), name="event-relay", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _poll(self, deliver: Callable[[str, dict], None], last: int):
+        conn = self.store.connection()
+        pruned_at = time.monotonic()
+        while not self._stop.wait(self.poll_interval):
+            try:
+                rows = conn.execute(
+                    "SELECT id, origin, type, data FROM events WHERE id > ? ORDER BY id",
+                    (last,),
+                ).fetchall()
+                for last, origin, type, data in rows:
+                    if origin != self.origin:
+                        deliver(type, orjson.loads(data))
+                if time.monotonic() - pruned_at > self.retention:
+                    conn.execute(
+                        "DELETE FROM events WHERE created < ?",
+                        (time.time() - self.retention,),
+                    )
+                    pruned_at = time.monotonic()
+            except Exception as e:
+                logger.warning("Event relay poll failed: %s", e)
+
+
+def _build_relay():
+    url = os.getenv("EVENT_BUS_URL")
+    if url and url.startswith("sqlite"):
+        return SqliteRelay(url)
+    return None
+
+
+bus = EventBus(relay=_build_relay())
@@ -0,0 +1,49 @@
+"""Image properties read once at upload, so lists can lay out a grid and show
+a placeholder without fetching any image."""
+
+import base64
+import io
+
+from PIL import Image as PILImage, ImageOps
+
+# Longest side of the placeholder, upscaled and blurred by the client
+PLACEHOLDER_SIZE = 16
+ORIENTATION_TAG = 0x0112
+# EXIF orientations turning the image by 90 degrees
+TRANSPOSED = {5, 6, 7, 8}
+
+
+def extract(data: bytes) -> dict:
+    """Width and height as displayed (EXIF orientation applied), MIME type,
+    byte size, EXIF orientation and a tiny JPEG data URL placeholder.
+
+    Raises OSError or ValueError for data Pillow cannot decode.
+    """
+    with PILImage.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        mime_type = img.get_format_mimetype() or PILImage.MIME.get(img.format)
+        orientation = img.getexif().get(ORIENTATION_TAG, 1)
+        if orientation not in range(1, 9):
+            orientation = 1
+        img.draft("RGB", (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+        thumbnail = ImageOps.exif_transpose(img)
+        if thumbnail.mode not in ("RGB", "RGBA", "L"):
+            thumbnail = thumbnail.convert("RGBA")
+        thumbnail.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+
+    if thumbnail.mode == "RGBA":
+        background = PILImage.new("RGBA", thumbnail.size, "white")
+        thumbnail = PILImage.alpha_composite(background, thumbnail)
+    buffer = io.BytesIO()
+    thumbnail.convert("RGB").save(buffer, "JPEG", quality=50, optimize=True)
+    if orientation in TRANSPOSED:
+        width, height = height, width
+    return {
+        "width": width,
+        "height": height,
+        "mime_type": mime_type,
+        "byte_size": len(data),
+        "orientation": orientation,
+        "placeholder": "data:image/jpeg;base64,"
+        + base64.b64encode(buffer.getvalue()).decode("ascii"),
+    }
@@ -0,0 +1,262 @@
+"""Streaming parsers for labeled datasets: COCO JSON, CSV and JSON Lines.
+
+Every parser reads a binary stream incrementally and yields ImportRecords,
+one per (image, annotator) with the tags that annotator gave the image.
+
+JSONL, one object per line:
+    {"image": "cat.jpg", "tags": ["cat", "indoor"], "annotator_email": "a@x.com"}
+CSV, with a header; tags are separated by "|" or ";":
+    image,tags,annotator_id
+    cat.jpg,cat|indoor,3
+COCO: category names of an image's annotations become its tags.
+
+`url` is optional everywhere and defaults to /uploads/<image>. Without an
+annotator column the importer's default annotator is used.
+
+A row of the wrong shape is yielded with `error` set, for the importer to
+skip and report; only a file that cannot be read further raises
+ImportFormatError.
+"""
+
+import csv
+import io
+import json
+from array import array
+from dataclasses import dataclass, field
+from typing import IO, Iterator, Optional
+
+import numpy as np
+import orjson
+
+FORMATS = ("coco", "csv", "jsonl")
+READ_SIZE = 1 << 16
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+@dataclass
+class ImportRecord:
+    image: str
+    tags: list[str] = field(default_factory=list)
+    url: Optional[str] = None
+    annotator_id: Optional[int] = None
+    annotator_email: Optional[str] = None
+    # Line in the file; COCO has none and leaves it 0
+    line: int = 0
+    # Why the row cannot be imported
+    error: Optional[str] = None
+
+
+def _string(data: dict, key: str) -> Optional[str]:
+    value = data.get(key)
+    if value in (None, ""):
+        return None
+    if not isinstance(value, str):
+        raise ImportFormatError(f"'{key}' must be a string")
+    return value
+
+
+def _record(data: object, line: int) -> ImportRecord:
+    if not isinstance(data, dict):
+        raise ImportFormatError(f"expected an object, got {type(data).__name__}")
+    image = _string(data, "image") or _string(data, "file_name")
+    if not image:
+        raise ImportFormatError("missing image")
+    tags = data.get("tags") or []
+    if isinstance(tags, str):
+        tags = tags.replace(";", "|").split("|")
+    elif not isinstance(tags, list) or not all(isinstance(t, str) for t in tags):
+        raise ImportFormatError("'tags' must be a list of strings")
+    annotator_id = data.get("annotator_id")
+    if annotator_id == "":
+        annotator_id = None
+    elif annotator_id is not None:
+        try:
+            annotator_id = int(annotator_id)
+        except (TypeError, ValueError):
+            raise ImportFormatError(f"annotator_id {annotator_id!r} is not a number")
+    return ImportRecord(
+        image=image,
+        tags=[t.strip().lower() for t in tags if t.strip()],
+        url=_string(data, "url"),
+        annotator_id=annotator_id,
+        annotator_email=_string(data, "annotator_email"),
+        line=line,
+    )
+
+
+def _checked(data: object, line: int) -> ImportRecord:
+    try:
+        return _record(data, line)
+    except ImportFormatError as e:
+        return ImportRecord(image="", line=line, error=str(e))
+
+
+def parse_jsonl(stream: IO[bytes]) -> Iterator[ImportRecord]:
+    for line, raw in enumerate(stream, start=1):
+        if not raw.strip():
+            continue
+        try:
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError as e:
+            yield ImportRecord(image="", line=line, error=str(e))
+            continue
+        yield _checked(data, line)
+
+
+def parse_csv(stream: IO[bytes]) -> Iterator[ImportRecord]:
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+    try:
+        if not {"image", "file_name"} & set(reader.fieldnames or ()):
+            raise ImportFormatError("CSV needs an 'image' column")
+        # line_num is where the row ends, quoted values may span lines
+        for row in reader:
+            yield _checked(row, reader.line_num)
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ImportFormatError(f"Line {reader.line_num + 1}: {e}")
+
+
+class _JsonStream:
+    """Incremental reader of one JSON document, a value at a time"""
+
+    def __init__(self, stream: IO[bytes]):
+        self.text = io.TextIOWrapper(stream, encoding="utf-8")
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        chunk = self.text.read(READ_SIZE)
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+        self.eof = not chunk
+        return bool(chunk)
+
+    def peek(self) -> str:
+        while True:
+            while (
+                self.position < len(self.buffer)
+                and self.buffer[self.position] in " \t\r\n"
+            ):
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                raise ImportFormatError("Unexpected end of JSON")
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            found = self.buffer[self.position : self.position + 20]
+            raise ImportFormatError(f"Expected '{char}' at '{found}'")
+        self.position += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError as e:
+                if self._fill():
+                    continue
+                raise ImportFormatError(str(e))
+            # A number at the very end of the buffer may go on in the next read
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.position = end
+            return value
+
+    def members(self) -> Iterator[tuple[str, object]]:
+        """(key, element) per element of top-level arrays, (key, value) otherwise"""
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            if self.peek() == "[":
+                self.position += 1
+                if self.peek() == "]":
+                    self.position += 1
+                else:
+                    while True:
+                        yield key, self.value()
+                        if self.peek() == ",":
+                            self.position += 1
+                            continue
+                        self.expect("]")
+                        break
+            else:
+                yield key, self.value()
+            if self.peek() == ",":
+                self.position += 1
+                continue
+            self.expect("}")
+            return
+
+
+def parse_coco(stream: IO[bytes]) -> Iterator[ImportRecord]:
+    """Keys may come in any order, so annotations are kept as two int arrays
+    until the categories are known, then grouped by image"""
+    files: dict[int, tuple[str, Optional[str]]] = {}
+    categories: dict[int, str] = {}
+    image_ids, category_ids = array("q"), array("q")
+
+    try:
+        for key, item in _JsonStream(stream).members():
+            try:
+                if key == "images":
+                    files[item["id"]] = (
+                        _string(item, "file_name"),
+                        _string(item, "coco_url"),
+                    )
+                elif key == "annotations":
+                    image_ids.append(item["image_id"])
+                    category_ids.append(item["category_id"])
+                elif key == "categories":
+                    categories[item["id"]] = _string(item, "name") or ""
+            except (AttributeError, KeyError, TypeError, ImportFormatError):
+                raise ImportFormatError(
+                    f"Malformed entry in '{key}': {str(item)[:80]}"
+                )
+    except UnicodeDecodeError as e:
+        raise ImportFormatError(str(e))
+
+    images = np.frombuffer(image_ids, dtype=np.int64)
+    order = np.argsort(images, kind="stable")
+    images = images[order]
+    labels = np.frombuffer(category_ids, dtype=np.int64)[order]
+    bounds = np.flatnonzero(np.diff(images)) + 1
+    for start, end in zip(
+        np.concatenate([[0], bounds]), np.concatenate([bounds, [len(images)]])
+    ):
+        if start == end:
+            continue
+        image_id = int(images[start])
+        if image_id not in files:
+            raise ImportFormatError(f"Annotation refers to unknown image {image_id}")
+        name, url = files[image_id]
+        if not name:
+            yield ImportRecord(image="", error=f"image {image_id} has no file_name")
+            continue
+        tags = sorted(
+            {
+                categories[c].strip().lower()
+                for c in labels[start:end].tolist()
+                if categories.get(c, "").strip()
+            }
+        )
+        yield ImportRecord(image=name, tags=tags, url=url)
+
+
+def parse(stream: IO[bytes], format: str) -> Iterator[ImportRecord]:
+    if format == "coco":
+        return parse_coco(stream)
+    if format == "csv":
+        return parse_csv(stream)
+    if format == "jsonl":
+        return parse_jsonl(stream)
+    raise ImportFormatError(f"Unknown format '{format}', expected one of {FORMATS}")
@@ -0,0 +1,42 @@
+import logging
+import signal
+import threading
+
+from core.utils.events import bus
+
+logger = logging.getLogger(__name__)
+
+_draining = threading.Event()
+
+
+def draining() -> bool:
+    return _draining.is_set()
+
+
+def start_draining():
+    """Fail readiness and end event streams so the server can stop promptly.
+
+    Uvicorn only runs the lifespan shutdown once every open response has
+    finished, and SSE responses never finish on their own.
+    """
+    if _draining.is_set():
+        return
+    _draining.set()
+    logger.info("Draining: readiness now fails, event streams are closed")
+    bus.close()
+
+
+def install_drain_handlers():
+    """Drain on SIGTERM/SIGINT, then let the server's own handler run"""
+    if threading.current_thread() is not threading.main_thread():
+        return  # e.g. the test client runs the lifespan in a worker thread
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+
+        def handler(signum, frame, previous=previous):
+            start_draining()
+            if callable(previous):
+                previous(signum, frame)
+
+        signal.signal(sig, handler)
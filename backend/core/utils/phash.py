@@ -0,0 +1,102 @@
+"""Perceptual hashing and Hamming-distance search for near-duplicate images."""
+
+import io
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from PIL import Image as PILImage, ImageOps
+
+HASH_BITS = 64
+
+
+def dhash(data: bytes) -> str:
+    """64-bit difference hash as 16 hex chars.
+
+    Survives re-encoding, resizing and small brightness changes, which is
+    what separates consecutive video frames from real near-duplicates.
+    """
+    with PILImage.open(io.BytesIO(data)) as img:
+        img.draft("L", (64, 64))
+        small = ImageOps.exif_transpose(img).convert("L").resize(
+            (9, 8), PILImage.Resampling.LANCZOS
+        )
+    pixels = list(small.getdata())
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left, right = pixels[row * 9 + col], pixels[row * 9 + col + 1]
+            value = value << 1 | (left > right)
+    return f"{value:016x}"
+
+
+def distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Metric tree over 64-bit hashes; range queries visit only a few nodes"""
+
+    def __init__(self):
+        self._root: Optional[list] = None  # [hash, {distance: child}]
+        self._ids: dict[int, list[int]] = defaultdict(list)
+        self.values: dict[int, int] = {}
+
+    def add(self, value: int, item_id: int):
+        # Exact duplicates share a node
+        self.values[item_id] = value
+        self._ids[value].append(item_id)
+        if len(self._ids[value]) > 1:
+            return
+        if self._root is None:
+            self._root = [value, {}]
+            return
+        node = self._root
+        while True:
+            d = distance(value, node[0])
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = [value, {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> list[tuple[int, int]]:
+        """(item_id, distance) of every item within max_distance"""
+        return [
+            (item_id, d)
+            for node_value, d in self._search_values(value, max_distance)
+            for item_id in self._ids[node_value]
+        ]
+
+    def clusters(self, max_distance: int) -> list[list[int]]:
+        """Connected components of items within max_distance of each other"""
+        parent = {value: value for value in self._ids}
+
+        def find(value):
+            while parent[value] != value:
+                parent[value] = parent[parent[value]]
+                value = parent[value]
+            return value
+
+        stack = [self._root] if self._root else []
+        while stack:
+            node_value, children = stack.pop()
+            stack.extend(children.values())
+            for other, _ in self._search_values(node_value, max_distance):
+                parent[find(other)] = find(node_value)
+
+        components = defaultdict(list)
+        for value, ids in self._ids.items():
+            components[find(value)].extend(ids)
+        return [sorted(ids) for ids in components.values() if len(ids) > 1]
+
+    def _search_values(self, value: int, max_distance: int) -> Iterable[tuple[int, int]]:
+        stack = [self._root] if self._root else []
+        while stack:
+            node_value, children = stack.pop()
+            d = distance(value, node_value)
+            if d <= max_distance:
+                yield node_value, d
+            for child_distance, child in children.items():
+                if d - max_distance <= child_distance <= d + max_distance:
+                    stack.append(child)
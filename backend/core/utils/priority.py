@@ -0,0 +1,39 @@
+"""Active-learning priority: how much one more label on an image is worth.
+
+Images with few labels or with annotators split over a tag score high, images
+local suggestions would already tag confidently lower, and images with many
+near-duplicates higher, since their labels can be propagated to the cluster.
+"""
+
+import math
+
+# Share of the priority a fully confident suggestion takes away
+CONFIDENCE_WEIGHT = 0.5
+
+
+def confidence(similarity: float, agreement: float, min_similarity: float) -> float:
+    """0 to 1: suggestions copied from one labeled neighbour this similar,
+    whose annotators agree on its top tag at this share"""
+    if similarity < min_similarity:
+        return 0.0
+    if min_similarity >= 1:
+        return agreement
+    return (similarity - min_similarity) / (1 - min_similarity) * agreement
+
+
+def score(
+    annotators: int, shares: list[float], confidence: float, duplicates: int
+) -> float:
+    """Priority of an image from its number of annotators, the share of them
+    that gave each of its tags, the suggestion confidence and the size of its
+    near-duplicate cluster (1 for a unique image). Higher comes first."""
+    # Each label moves the consensus of a sparsely labeled image the most
+    need = 1 / (1 + annotators)
+    # 4p(1-p): 1 when annotators split evenly over a tag, 0 when they agree
+    dispersion = max((4 * share * (1 - share) for share in shares), default=0.0)
+    uncertainty = 1 - (1 - need) * (1 - dispersion)
+    return (
+        uncertainty
+        * (1 - CONFIDENCE_WEIGHT * confidence)
+        * math.log2(1 + max(duplicates, 1))
+    )
@@ -0,0 +1,168 @@
+"""Where uploaded image bytes live.
+
+Images are addressed by key, the file name after `/uploads/` in their url.
+LocalStorage keeps them in the uploads directory; S3Storage in a bucket of
+any S3-compatible service (AWS, MinIO, ...), selected with
+STORAGE_URL=s3://bucket[/prefix] and S3_ENDPOINT_URL. Both hand out signed,
+time-limited URLs so clients can fetch the bytes without going through the
+API.
+"""
+
+import hashlib
+import hmac
+import os
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlencode
+
+URL_PREFIX = "/uploads/"
+SIGNED_URL_TTL = int(os.getenv("SIGNED_URL_TTL", "3600"))
+REQUIRE_SIGNED_URLS = os.getenv("STORAGE_REQUIRE_SIGNED_URLS") == "1"
+
+
+class NotFound(Exception):
+    pass
+
+
+def key_for(url: str) -> str:
+    """Storage key of an image url; never a path outside the store"""
+    return Path(url).name
+
+
+def url_for(key: str) -> str:
+    return f"{URL_PREFIX}{key}"
+
+
+class LocalStorage:
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        return self.root / key_for(key)
+
+    def put(self, key: str, data: bytes, content_type: str):
+        self.path(key).write_bytes(data)
+
+    def read(self, key: str) -> bytes:
+        try:
+            return self.path(key).read_bytes()
+        except FileNotFoundError:
+            raise NotFound(key)
+
+    def existing(self, keys: list[str]) -> set[str]:
+        """Those of `keys` that are stored"""
+        return {key for key in keys if self.path(key).is_file()}
+
+    def delete(self, key: str):
+        self.path(key).unlink(missing_ok=True)
+
+    def _signature(self, key: str, expires: int) -> str:
+        secret = os.getenv("STORAGE_SIGNING_KEY")
+        if secret is None:
+            from core.utils.auth import SECRET_KEY
+
+            secret = SECRET_KEY
+        message = f"{key_for(key)}:{expires}".encode()
+        return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+    def signed_url(self, key: str, expires_in: int = SIGNED_URL_TTL) -> str:
+        expires = int(time.time()) + expires_in
+        query = {"expires": expires, "signature": self._signature(key, expires)}
+        return f"{url_for(key)}?{urlencode(query)}"
+
+    def verify(self, key: str, expires: int, signature: str) -> bool:
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self._signature(key, expires), signature)
+
+    def problem(self) -> Optional[str]:
+        """Why the store cannot take uploads right now, if it cannot"""
+        if not os.access(self.root, os.W_OK):
+            return "uploads not writable"
+        return None
+
+
+class S3Storage:
+    def __init__(
+        self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None
+    ):
+        import boto3
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            config=Config(signature_version="s3v4", s3={"addressing_style": "path"}),
+        )
+
+    def _object(self, key: str) -> str:
+        return self.prefix + key_for(key)
+
+    def put(self, key: str, data: bytes, content_type: str):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self._object(key),
+            Body=data,
+            ContentType=content_type,
+        )
+
+    def read(self, key: str) -> bytes:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._object(key))
+        except self.client.exceptions.NoSuchKey:
+            raise NotFound(key)
+        return response["Body"].read()
+
+    def existing(self, keys: list[str]) -> set[str]:
+        """Those of `keys` that are stored, listing only the range of object
+        names between the first and the last rather than one HEAD per key"""
+        if not keys:
+            return set()
+        wanted = {self._object(key): key for key in keys}
+        first, last = min(wanted), max(wanted)
+        found = set()
+        pages = self.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket,
+            Prefix=self.prefix,
+            # Listing starts after this name, so step back one character
+            StartAfter=first[:-1],
+        )
+        for page in pages:
+            for item in page.get("Contents", ()):
+                if item["Key"] > last:
+                    return found
+                if item["Key"] in wanted:
+                    found.add(wanted[item["Key"]])
+        return found
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object(key))
+
+    def signed_url(self, key: str, expires_in: int = SIGNED_URL_TTL) -> str:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._object(key)},
+            ExpiresIn=expires_in,
+        )
+
+    def problem(self) -> Optional[str]:
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except Exception as e:
+            return f"bucket unavailable: {e}"
+        return None
+
+
+def _build_storage():
+    url = os.getenv("STORAGE_URL", "")
+    if url.startswith("s3://"):
+        bucket, _, prefix = url.removeprefix("s3://").partition("/")
+        return S3Storage(bucket, prefix, os.getenv("S3_ENDPOINT_URL"))
+    return LocalStorage(Path(os.getenv("UPLOAD_DIR", "uploads")))
+
+
+storage = _build_storage()
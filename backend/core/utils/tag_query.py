@@ -0,0 +1,166 @@
+"""Boolean tag expressions evaluated over an inverted index of image bitsets.
+
+Grammar, keywords are case-insensitive and AND is implied between terms:
+
+    expr := and ("OR" and)*
+    and  := not (["AND"] not)*
+    not  := "NOT" not | atom
+    atom := "(" expr ")" | tag [">=" n]
+
+`car>=2 AND NOT truck` finds images tagged car by at least two annotators
+and by no annotator as truck.
+"""
+
+import re
+from collections import defaultdict
+from typing import Iterable
+
+import numpy as np
+
+MERGE_THRESHOLD = 1_000
+# Bounds on user input: nesting is parsed recursively, every term is a pass
+# over the universe
+MAX_DEPTH = 32
+MAX_TOKENS = 500
+
+_TOKENS = re.compile(r"\(|\)|[^\s()]+")
+_TERM = re.compile(r"^(?P<tag>.+?)(?:>=(?P<count>\d{1,9}))?$")
+
+
+class QueryError(ValueError):
+    pass
+
+
+class TagImageIndex:
+    """Per tag, the images it was applied to and by how many annotators.
+
+    Built once into NumPy arrays; later writes land in small per-tag
+    deltas that are folded back into the arrays once they grow.
+    """
+
+    def __init__(self, rows: Iterable[tuple[str, int, int]]):
+        grouped = defaultdict(lambda: ([], []))
+        self.size = 1
+        for tag, image_id, count in rows:
+            ids, counts = grouped[tag]
+            ids.append(image_id)
+            counts.append(count)
+            self.size = max(self.size, image_id + 1)
+        self._base = {
+            tag: (np.array(ids, dtype=np.int64), np.array(counts, dtype=np.int32))
+            for tag, (ids, counts) in grouped.items()
+        }
+        self._delta: dict[str, dict[int, int]] = defaultdict(dict)
+
+    def set(self, tag: str, image_id: int, count: int):
+        """Record the current number of annotators using `tag` on an image"""
+        delta = self._delta[tag]
+        delta[image_id] = count
+        self.size = max(self.size, image_id + 1)
+        if len(delta) > MERGE_THRESHOLD:
+            self._merge(tag)
+
+    def _merge(self, tag: str):
+        delta = self._delta.pop(tag)
+        empty = (np.array([], np.int64), np.array([], np.int32))
+        ids, counts = self._base.get(tag, empty)
+        keep = ~np.isin(ids, np.fromiter(delta, dtype=np.int64))
+        updates = [(i, c) for i, c in delta.items() if c > 0]
+        self._base[tag] = (
+            np.concatenate([ids[keep], np.array([i for i, _ in updates], np.int64)]),
+            np.concatenate([counts[keep], np.array([c for _, c in updates], np.int32)]),
+        )
+
+    def mask(self, tag: str, min_count: int, size: int) -> np.ndarray:
+        result = np.zeros(size, dtype=bool)
+        if tag in self._base:
+            ids, counts = self._base[tag]
+            selected = ids[counts >= min_count]
+            result[selected[selected < size]] = True
+        for image_id, count in self._delta.get(tag, {}).items():
+            if image_id < size:
+                result[image_id] = count >= min_count
+        return result
+
+
+class _Parser:
+    def __init__(
+        self, text: str, index: TagImageIndex, universe: np.ndarray, min_count: int
+    ):
+        self.tokens = _TOKENS.findall(text)
+        self.position = 0
+        self.depth = 0
+        self.index = index
+        self.universe = universe
+        self.min_count = min_count
+
+    def _peek(self) -> str:
+        return self.tokens[self.position] if self.position < len(self.tokens) else ""
+
+    def _take(self) -> str:
+        token = self._peek()
+        self.position += 1
+        return token
+
+    def parse(self) -> np.ndarray:
+        if not self.tokens:
+            raise QueryError("Empty expression")
+        if len(self.tokens) > MAX_TOKENS:
+            raise QueryError(f"Expression longer than {MAX_TOKENS} terms")
+        result = self._or()
+        if self.position < len(self.tokens):
+            raise QueryError(f"Unexpected '{self._peek()}'")
+        return result
+
+    def _or(self) -> np.ndarray:
+        result = self._and()
+        while self._peek().upper() == "OR":
+            self._take()
+            result = result | self._and()
+        return result
+
+    def _and(self) -> np.ndarray:
+        result = self._not()
+        while self._peek() and self._peek() != ")" and self._peek().upper() != "OR":
+            if self._peek().upper() == "AND":
+                self._take()
+            result = result & self._not()
+        return result
+
+    def _nested(self, parse) -> np.ndarray:
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            raise QueryError(f"Expression nested deeper than {MAX_DEPTH}")
+        result = parse()
+        self.depth -= 1
+        return result
+
+    def _not(self) -> np.ndarray:
+        if self._peek().upper() == "NOT":
+            self._take()
+            return self.universe & ~self._nested(self._not)
+        return self._atom()
+
+    def _atom(self) -> np.ndarray:
+        token = self._take()
+        if token == "(":
+            result = self._nested(self._or)
+            if self._take() != ")":
+                raise QueryError("Missing ')'")
+            return result
+        if not token or token == ")" or token.upper() in ("AND", "OR", "NOT"):
+            raise QueryError(f"Expected a tag, got '{token or 'end of expression'}'")
+
+        term = _TERM.match(token)
+        count = int(term["count"]) if term["count"] else self.min_count
+        if count < 1:
+            raise QueryError(f"Agreement for '{term['tag']}' must be at least 1")
+        mask = self.index.mask(term["tag"].lower(), count, len(self.universe))
+        return self.universe & mask
+
+
+def evaluate(
+    expression: str, index: TagImageIndex, universe: np.ndarray, min_count: int = 1
+) -> np.ndarray:
+    """Boolean mask over image ids matching `expression` within `universe`"""
+    return _Parser(expression, index, universe, min_count).parse()
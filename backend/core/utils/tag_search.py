@@ -0,0 +1,121 @@
+"""In-memory tag autocomplete: prefix search on a sorted array plus trigram
+matching for typos, both ranked by how often a tag is used."""
+
+import bisect
+from collections import defaultdict
+
+import numpy as np
+
+MIN_SIMILARITY = 0.3
+MAX_RECENT = 1_000
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(shared: int, a: int, b: int) -> float:
+    return shared / (a + b - shared) if shared else 0.0
+
+
+class TagIndex:
+    def __init__(self, tags: list[tuple[int, str]], usage: dict[int, int]):
+        tags = sorted(tags, key=lambda t: t[1])
+        self.ids = np.array([tag_id for tag_id, _ in tags], dtype=np.int64)
+        self.names = [name for _, name in tags]
+        self.max_id = int(self.ids.max()) if len(tags) else 0
+        # Tags created after the build, scanned linearly until the next rebuild
+        self.recent: list[tuple[int, str]] = []
+
+        postings = defaultdict(list)
+        sizes = []
+        for position, name in enumerate(self.names):
+            grams = trigrams(name)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(position)
+        self._postings = {g: np.array(p, dtype=np.int32) for g, p in postings.items()}
+        self._sizes = np.array(sizes, dtype=np.int32)
+        self.set_usage(usage)
+
+    def __len__(self) -> int:
+        return len(self.names) + len(self.recent)
+
+    def set_usage(self, usage: dict[int, int]):
+        self._usage_by_id = usage
+        self.usage = np.array([usage.get(int(i), 0) for i in self.ids], dtype=np.int64)
+
+    def extend(self, tags: list[tuple[int, str]]) -> bool:
+        """Remember new tags; False when the index should be rebuilt instead"""
+        self.recent.extend(tags)
+        self.max_id = max([self.max_id, *(tag_id for tag_id, _ in tags)])
+        return len(self.recent) <= MAX_RECENT
+
+    def _row(self, position: int, match: str, score: float) -> dict:
+        return {
+            "id": int(self.ids[position]),
+            "name": self.names[position],
+            "usage": int(self.usage[position]),
+            "match": match,
+            "score": round(score, 3),
+        }
+
+    def _recent_row(self, tag_id: int, name: str, match: str, score: float) -> dict:
+        return {
+            "id": tag_id,
+            "name": name,
+            "usage": self._usage_by_id.get(tag_id, 0),
+            "match": match,
+            "score": round(score, 3),
+        }
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        """Prefix matches by usage first, then trigram matches by similarity"""
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        # Prefix: names are sorted, so matches form one contiguous range
+        lo = bisect.bisect_left(self.names, query)
+        hi = bisect.bisect_left(self.names, query + "\uffff")
+        positions = np.arange(lo, hi)
+        if hi - lo > limit:
+            top = np.argpartition(-self.usage[lo:hi], limit - 1)[:limit]
+            positions = positions[top]
+        positions = sorted(positions, key=lambda p: -self.usage[p])
+        result = [self._row(p, "prefix", 1.0) for p in positions]
+
+        for tag_id, name in self.recent:
+            if name.startswith(query):
+                result.append(self._recent_row(tag_id, name, "prefix", 1.0))
+
+        if len(result) < limit and len(query) >= 3:
+            result += self._fuzzy(query, limit - len(result), exclude=range(lo, hi))
+
+        result.sort(key=lambda r: (-r["score"], -r["usage"], r["name"]))
+        return result[:limit]
+
+    def _fuzzy(self, query: str, limit: int, exclude: range) -> list[dict]:
+        grams = trigrams(query)
+        lists = [self._postings[g] for g in grams if g in self._postings]
+        result = []
+        if lists:
+            shared = np.bincount(np.concatenate(lists), minlength=len(self.names))
+            scores = shared / (len(grams) + self._sizes - shared)
+            scores[exclude.start : exclude.stop] = 0
+            candidates = np.flatnonzero(scores >= MIN_SIMILARITY)
+            if len(candidates) > limit:
+                # Similarity first, usage breaks ties
+                order = np.lexsort((-self.usage[candidates], -scores[candidates]))
+                candidates = candidates[order[:limit]]
+            result = [self._row(p, "fuzzy", float(scores[p])) for p in candidates]
+
+        for tag_id, name in self.recent:
+            if name.startswith(query):
+                continue
+            tag_grams = trigrams(name)
+            score = _similarity(len(grams & tag_grams), len(grams), len(tag_grams))
+            if score >= MIN_SIMILARITY:
+                result.append(self._recent_row(tag_id, name, "fuzzy", score))
+        return result
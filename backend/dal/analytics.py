@@ -0,0 +1,377 @@
+"""Columnar snapshot of the annotation-tag facts, for analytics.
+
+A background job exports the facts to Parquet whenever the change log moved
+since the last export: one row per (annotation, tag) ordered by annotation,
+with tag_id 0 for an annotation without tags, next to the tag names and the
+image groups. Reports load the newest export once per process and answer
+with NumPy, so they never scan the OLTP tables; group assignments are as of
+the export.
+"""
+
+import fcntl
+import logging
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.orm import Session
+
+from dal.history import int_matrix
+from dal.models import Annotation, AnnotationChange, Tags, image_groups
+from dal.models.annotator import annotation_tags
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_DIR = Path(os.getenv("ANALYTICS_DIR", "analytics"))
+SNAPSHOT_INTERVAL = float(os.getenv("ANALYTICS_SNAPSHOT_INTERVAL", "300"))
+# How long a report waits for another worker exporting the first snapshot
+FIRST_SNAPSHOT_TIMEOUT = float(os.getenv("ANALYTICS_FIRST_SNAPSHOT_TIMEOUT", "30"))
+KEEP = 2
+
+BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+# 1970-01-01 was a Thursday, weeks start on Monday
+_WEEK_OFFSET = 3 * 86400
+
+
+class SnapshotPending(Exception):
+    """No snapshot yet, and the first one is still being exported"""
+
+
+@dataclass
+class Facts:
+    path: Path
+    change_id: int
+    taken_at: datetime
+    annotation_ids: np.ndarray
+    image_ids: np.ndarray
+    annotator_ids: np.ndarray
+    created_at: np.ndarray  # seconds since the epoch, UTC
+    tag_ids: np.ndarray
+    first: np.ndarray  # the first row of each annotation
+    tag_names: dict[int, str]
+    group_image_ids: np.ndarray
+    group_ids: np.ndarray
+
+    @property
+    def annotations(self) -> int:
+        return int(self.first.sum())
+
+    def mask(
+        self,
+        group_id: Optional[int] = None,
+        annotator_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> np.ndarray:
+        mask = np.ones(len(self.tag_ids), dtype=bool)
+        if group_id is not None:
+            images = self.group_image_ids[self.group_ids == group_id]
+            mask &= np.isin(self.image_ids, images)
+        if annotator_id is not None:
+            mask &= self.annotator_ids == annotator_id
+        if since is not None:
+            mask &= self.created_at >= _epoch(since)
+        if until is not None:
+            mask &= self.created_at < _epoch(until)
+        return mask
+
+
+def _epoch(moment: datetime) -> int:
+    """Naive datetimes are UTC, like every timestamp stored by the app"""
+    if moment.tzinfo:
+        return int(moment.timestamp())
+    return int((moment - datetime(1970, 1, 1)).total_seconds())
+
+
+def export(db: Session) -> Path:
+    """Write the facts as of now to a new snapshot directory"""
+    # pyarrow is imported on first use, it adds to every cold start
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    db.rollback()
+    # Same as history snapshots: every read below must see the same moment
+    db.connection().exec_driver_sql("BEGIN")
+    change_id = db.scalar(select(func.coalesce(func.max(AnnotationChange.id), 0)))
+    taken_at = datetime.utcnow()
+    rows = int_matrix(
+        db.execute(
+            select(
+                Annotation.id,
+                Annotation.image_id,
+                Annotation.annotator_id,
+                cast(func.strftime("%s", Annotation.created_at), Integer),
+            )
+            .where(Annotation.image_id.is_not(None))
+            .order_by(Annotation.id)
+        ),
+        4,
+    )
+    pairs = int_matrix(
+        db.execute(
+            select(annotation_tags.c.annotation_id, annotation_tags.c.tag_id).order_by(
+                annotation_tags.c.annotation_id, annotation_tags.c.tag_id
+            )
+        ),
+        2,
+    )
+    tags = db.execute(select(Tags.id, Tags.name)).all()
+    groups = int_matrix(
+        db.execute(select(image_groups.c.image_id, image_groups.c.group_id)), 2
+    )
+    db.rollback()
+
+    # One row per tag of each annotation, or a single row with tag 0
+    position = np.searchsorted(rows[:, 0], pairs[:, 0])
+    valid = position < len(rows)
+    valid[valid] = rows[position[valid], 0] == pairs[valid, 0]
+    position, tag_ids = position[valid], pairs[valid, 1]
+    counts = np.bincount(position, minlength=len(rows))
+    repeats = np.maximum(counts, 1)
+    starts = np.cumsum(repeats) - repeats
+    rank = np.arange(len(position)) - (np.cumsum(counts) - counts)[position]
+    facts_tags = np.zeros(int(repeats.sum()), dtype=np.int32)
+    facts_tags[starts[position] + rank] = tag_ids
+    facts = rows.repeat(repeats, axis=0)
+
+    table = pa.table(
+        {
+            "annotation_id": facts[:, 0].astype(np.int32),
+            "image_id": facts[:, 1].astype(np.int32),
+            "annotator_id": facts[:, 2].astype(np.int32),
+            "created_at": pa.array(facts[:, 3], type=pa.timestamp("s")),
+            "tag_id": facts_tags,
+        }
+    ).replace_schema_metadata(
+        {"change_id": str(change_id), "taken_at": taken_at.isoformat()}
+    )
+
+    ANALYTICS_DIR.mkdir(parents=True, exist_ok=True)
+    staging = ANALYTICS_DIR / f".staging-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir()
+    pq.write_table(table, staging / "facts.parquet", compression="zstd")
+    pq.write_table(
+        pa.table(
+            {
+                "id": pa.array([i for i, _ in tags], type=pa.int32()),
+                "name": [name for _, name in tags],
+            }
+        ),
+        staging / "tags.parquet",
+    )
+    pq.write_table(
+        pa.table(
+            {
+                "image_id": groups[:, 0].astype(np.int32),
+                "group_id": groups[:, 1].astype(np.int32),
+            }
+        ),
+        staging / "image_groups.parquet",
+    )
+    # Readers only ever see complete directories
+    path = ANALYTICS_DIR / f"snapshot-{taken_at:%Y%m%dT%H%M%S%f}-{change_id}"
+    staging.rename(path)
+    for old in _snapshots()[:-KEEP]:
+        shutil.rmtree(old, ignore_errors=True)
+    return path
+
+
+def _snapshots() -> list[Path]:
+    return sorted(ANALYTICS_DIR.glob("snapshot-*"))
+
+
+def _change_id(path: Path) -> int:
+    return int(path.name.rsplit("-", 1)[1])
+
+
+_cache_lock = threading.Lock()
+_cached: Optional[Facts] = None
+
+
+def load(path: Path) -> Facts:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path / "facts.parquet")
+    metadata = table.schema.metadata
+    annotation_ids = table["annotation_id"].to_numpy()
+    first = np.ones(len(annotation_ids), dtype=bool)
+    first[1:] = annotation_ids[1:] != annotation_ids[:-1]
+    tags = pq.read_table(path / "tags.parquet")
+    groups = pq.read_table(path / "image_groups.parquet")
+    return Facts(
+        path=path,
+        change_id=int(metadata[b"change_id"]),
+        taken_at=datetime.fromisoformat(metadata[b"taken_at"].decode()),
+        annotation_ids=annotation_ids,
+        image_ids=table["image_id"].to_numpy(),
+        annotator_ids=table["annotator_id"].to_numpy(),
+        # Parquet has no seconds unit, they come back as milliseconds
+        created_at=table["created_at"]
+        .cast(pa.timestamp("s"))
+        .cast(pa.int64())
+        .to_numpy(),
+        tag_ids=table["tag_id"].to_numpy(),
+        first=first,
+        tag_names=dict(zip(tags["id"].to_pylist(), tags["name"].to_pylist())),
+        group_image_ids=groups["image_id"].to_numpy(),
+        group_ids=groups["group_id"].to_numpy(),
+    )
+
+
+def current(db: Session) -> Facts:
+    """The newest readable snapshot, exporting a first one if there is none.
+
+    Falls back to an older snapshot, or the one already loaded, when the
+    newest cannot be read; raises SnapshotPending if another worker is still
+    exporting the first one after FIRST_SNAPSHOT_TIMEOUT.
+    """
+    global _cached
+    deadline = time.monotonic() + FIRST_SNAPSHOT_TIMEOUT
+    while not (snapshots := _snapshots()) and _cached is None:
+        if snapshot_if_due(db, force=True) is None:
+            # Another worker holds the lock and is exporting the first one
+            if time.monotonic() >= deadline:
+                raise SnapshotPending()
+            time.sleep(1)
+
+    for path in reversed(snapshots):
+        with _cache_lock:
+            if _cached is not None and _cached.path == path:
+                return _cached
+        try:
+            facts = load(path)
+        except (OSError, ValueError) as e:
+            # Pruned by a newer export in between, or damaged
+            logger.warning("Cannot read analytics snapshot %s: %s", path, e)
+            continue
+        with _cache_lock:
+            _cached = facts
+        return facts
+    if _cached is None:
+        raise SnapshotPending()
+    return _cached
+
+
+def snapshot_if_due(db: Session, force: bool = False) -> Optional[Path]:
+    """Export once the change log moved past the newest snapshot; one worker at
+    a time"""
+    snapshots = _snapshots()
+    if snapshots and not force:
+        latest = db.scalar(select(func.coalesce(func.max(AnnotationChange.id), 0)))
+        if latest <= _change_id(snapshots[-1]):
+            return None
+
+    with open("paladium.db.analytics.lock", "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None  # another worker is on it
+        return export(db)
+
+
+def tag_histogram(facts: Facts, mask: np.ndarray, limit: int) -> list[dict]:
+    annotations = int((facts.first & mask).sum())
+    tag_ids = facts.tag_ids[mask]
+    counts = np.bincount(tag_ids[tag_ids > 0])
+    order = np.argsort(counts, kind="stable")[::-1][:limit]
+    return [
+        {
+            "tag": facts.tag_names.get(int(tag_id), str(tag_id)),
+            "count": int(counts[tag_id]),
+            "share": round(int(counts[tag_id]) / annotations, 4),
+        }
+        for tag_id in order
+        if counts[tag_id]
+    ]
+
+
+def cooccurrence(facts: Facts, mask: np.ndarray, tag_ids: np.ndarray) -> np.ndarray:
+    """Annotations carrying both tags, for every pair of `tag_ids`; the
+    diagonal counts each tag alone"""
+    size = len(tag_ids)
+    index = np.full(max(facts.tag_names, default=0) + 1, -1)
+    index[tag_ids] = np.arange(size)
+    rows = mask & (index[facts.tag_ids] >= 0)
+    annotations = facts.annotation_ids[rows]
+    positions = index[facts.tag_ids[rows]]
+
+    # Rows are grouped by annotation: pair each row with the one `gap` rows
+    # ahead until no annotation has that many selected tags
+    counts = np.bincount(positions * size + positions, minlength=size * size)
+    gap = 1
+    while gap < len(annotations):
+        same = annotations[gap:] == annotations[:-gap]
+        if not same.any():
+            break
+        a, b = positions[:-gap][same], positions[gap:][same]
+        counts += np.bincount(a * size + b, minlength=size * size)
+        counts += np.bincount(b * size + a, minlength=size * size)
+        gap += 1
+    return counts.reshape(size, size)
+
+
+def top_tags(facts: Facts, mask: np.ndarray, limit: int) -> np.ndarray:
+    tag_ids = facts.tag_ids[mask]
+    counts = np.bincount(tag_ids[tag_ids > 0])
+    order = np.argsort(counts, kind="stable")[::-1][:limit]
+    return order[counts[order] > 0]
+
+
+def label_rate(facts: Facts, mask: np.ndarray, bucket: str) -> list[dict]:
+    """Annotations per annotator and time bucket"""
+    width = BUCKETS[bucket]
+    offset = _WEEK_OFFSET if bucket == "week" else 0
+    rows = mask & facts.first
+    annotators = facts.annotator_ids[rows].astype(np.int64)
+    starts = (facts.created_at[rows] + offset) // width * width - offset
+    if not len(starts):
+        return []
+    first = int(starts.min())
+    slots = (starts - first) // width
+    span = int(slots.max()) + 1
+    keys, counts = np.unique(annotators * span + slots, return_counts=True)
+
+    series: dict[int, dict] = {}
+    for key, count in zip(keys.tolist(), counts.tolist()):
+        annotator_id, slot = divmod(key, span)
+        entry = series.setdefault(
+            annotator_id, {"annotator_id": annotator_id, "total": 0, "points": []}
+        )
+        entry["total"] += count
+        entry["points"].append(
+            {"start": datetime.utcfromtimestamp(first + slot * width), "count": count}
+        )
+    return list(series.values())
+
+
+_stop = threading.Event()
+
+
+def start_snapshots(session_factory: Callable[[], Session]):
+    """Export in the background every SNAPSHOT_INTERVAL seconds, if due"""
+
+    def run():
+        while not _stop.wait(SNAPSHOT_INTERVAL):
+            try:
+                with session_factory() as db:
+                    path = snapshot_if_due(db)
+                if path is not None:
+                    logger.info("Analytics snapshot written to %s", path)
+            except Exception as e:
+                logger.warning("Analytics snapshot failed: %s", e)
+
+    _stop.clear()
+    threading.Thread(target=run, name="analytics-snapshots", daemon=True).start()
+
+
+def stop_snapshots():
+    _stop.set()
@@ -0,0 +1,310 @@
+"""Tag co-occurrence, kept current from the annotation change log.
+
+Two symmetric tag x tag matrices: annotations carrying both tags, and images
+given both by any of their annotators. Each worker builds them once, then
+folds in the AnnotationChange rows logged since before answering, so every
+write path counts, imports included. A long backlog of changes or a large
+overlay of deltas rebuilds instead.
+
+Synonyms are tags that different annotators give the same images but one
+annotator hardly ever uses together: a high NPMI over images with a small
+share of shared annotations.
+"""
+
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from core.utils.cooccurrence import CooccurrenceMatrix, npmi, pair_counts
+from dal.history import AnnotationState, int_matrix, unpack
+from dal.models import Annotation, AnnotationChange, Tags
+from dal.models.annotator import annotation_tags
+
+REBUILD_CHANGES = int(os.getenv("COOCCURRENCE_REBUILD_CHANGES", "20000"))
+REBUILD_OVERLAY = int(os.getenv("COOCCURRENCE_REBUILD_OVERLAY", "2000000"))
+# Above this share of their images in the same annotation, two tags are
+# used together on purpose rather than one instead of the other
+MAX_TOGETHER = 0.1
+
+
+@dataclass
+class TagGraph:
+    change_id: int
+    annotations: CooccurrenceMatrix
+    images: CooccurrenceMatrix
+    # Tags of every annotation and tag counts of every image when built
+    state: AnnotationState
+    image_ids: np.ndarray
+    image_offsets: np.ndarray
+    image_tags: np.ndarray
+    image_counts: np.ndarray
+    # Both as changed since
+    changed_annotations: dict[int, set[int]] = field(default_factory=dict)
+    changed_images: dict[int, dict[int, int]] = field(default_factory=dict)
+    suggestions: dict[tuple, list[dict]] = field(default_factory=dict)
+
+    def _annotation(self, annotation_id: int) -> set[int]:
+        tags = self.changed_annotations.get(annotation_id)
+        if tags is not None:
+            return tags
+        position = self.state.find(annotation_id)
+        return set() if position is None else set(self.state.tags(position).tolist())
+
+    def _image(self, image_id: int) -> dict[int, int]:
+        counts = self.changed_images.get(image_id)
+        if counts is not None:
+            return counts
+        position = int(np.searchsorted(self.image_ids, image_id))
+        if position == len(self.image_ids) or self.image_ids[position] != image_id:
+            return {}
+        start, end = self.image_offsets[position], self.image_offsets[position + 1]
+        return dict(
+            zip(
+                self.image_tags[start:end].tolist(),
+                self.image_counts[start:end].tolist(),
+            )
+        )
+
+    def apply(self, changes: Iterable[tuple]):
+        """Fold in (annotation_id, image_id, change, added, removed) rows"""
+        for annotation_id, image_id, change, added, removed in changes:
+            before = self._annotation(annotation_id)
+            if change == "deleted":
+                after = set()
+            else:
+                after = (before - set(unpack(removed).tolist())) | set(
+                    unpack(added).tolist()
+                )
+            self.changed_annotations[annotation_id] = after
+            self.annotations.retag(before, after)
+            if image_id is None:
+                continue
+
+            counts = dict(self._image(image_id))
+            image_before = {tag for tag, count in counts.items() if count > 0}
+            for tag in before - after:
+                counts[tag] -= 1
+            for tag in after - before:
+                counts[tag] = counts.get(tag, 0) + 1
+            self.changed_images[image_id] = counts
+            self.images.retag(
+                image_before, {tag for tag, count in counts.items() if count > 0}
+            )
+        self.suggestions.clear()
+
+    @property
+    def overlay_size(self) -> int:
+        return self.annotations.overlay_size + self.images.overlay_size
+
+
+def _build(db: Session) -> TagGraph:
+    db.rollback()
+    # Like history snapshots: the counts must match the change id exactly
+    db.connection().exec_driver_sql("BEGIN")
+    change_id = db.scalar(select(func.coalesce(func.max(AnnotationChange.id), 0)))
+    rows = int_matrix(
+        db.execute(
+            select(Annotation.id, Annotation.image_id, Annotation.annotator_id).where(
+                Annotation.image_id.is_not(None)
+            )
+        ),
+        3,
+    )
+    pairs = int_matrix(
+        db.execute(select(annotation_tags.c.annotation_id, annotation_tags.c.tag_id)),
+        2,
+    )
+    size = int(db.scalar(select(func.coalesce(func.max(Tags.id), 0)))) + 1
+    db.rollback()
+
+    state = AnnotationState.build(rows, pairs)
+    size = max(size, int(state.tag_ids.max(initial=0)) + 1)
+    lengths = np.diff(state.offsets)
+    groups = np.repeat(np.arange(len(state)), lengths)
+    annotations = CooccurrenceMatrix(
+        size,
+        *pair_counts(groups, state.tag_ids, size),
+        np.bincount(state.tag_ids, minlength=size),
+        int((lengths > 0).sum()),
+    )
+
+    codes, counts = np.unique(
+        np.repeat(state.image_ids, lengths) * size + state.tag_ids, return_counts=True
+    )
+    image_of, tag_of = codes // size, codes % size
+    image_ids, starts = np.unique(image_of, return_index=True)
+    images = CooccurrenceMatrix(
+        size,
+        *pair_counts(image_of, tag_of, size),
+        np.bincount(tag_of, minlength=size),
+        len(image_ids),
+    )
+    return TagGraph(
+        change_id=change_id,
+        annotations=annotations,
+        images=images,
+        state=state,
+        image_ids=image_ids,
+        image_offsets=np.r_[starts, len(image_of)],
+        image_tags=tag_of.astype(np.int32),
+        image_counts=counts.astype(np.int32),
+    )
+
+
+_lock = threading.Lock()
+_graph: Optional[TagGraph] = None
+
+
+def _current(db: Session) -> TagGraph:
+    """The graph, caught up with the change log; hold _lock"""
+    global _graph
+    latest = db.scalar(select(func.coalesce(func.max(AnnotationChange.id), 0)))
+    if (
+        _graph is None
+        or latest - _graph.change_id > REBUILD_CHANGES
+        or _graph.overlay_size > REBUILD_OVERLAY
+    ):
+        _graph = _build(db)
+    elif latest > _graph.change_id:
+        _graph.apply(
+            db.execute(
+                select(
+                    AnnotationChange.annotation_id,
+                    AnnotationChange.image_id,
+                    AnnotationChange.change,
+                    AnnotationChange.added,
+                    AnnotationChange.removed,
+                )
+                .where(
+                    AnnotationChange.id > _graph.change_id,
+                    AnnotationChange.id <= latest,
+                )
+                .order_by(AnnotationChange.id)
+            )
+        )
+        _graph.change_id = latest
+    return _graph
+
+
+def _top(scores: np.ndarray, limit: int) -> np.ndarray:
+    """Positions of the `limit` highest scores, best first"""
+    if len(scores) > limit:
+        candidates = np.argpartition(-scores, limit - 1)[:limit]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def related(db: Session, tag_id: int, limit: int) -> list[dict]:
+    """Tags most often in the same annotation as `tag_id`"""
+    with _lock:
+        graph = _current(db)
+        matrix = graph.annotations
+        if tag_id >= len(matrix.frequency):
+            return []
+        tag_ids, counts = matrix.row(tag_id)
+        top = _top(counts.astype(float), limit)
+        scores = npmi(
+            counts[top],
+            matrix.frequency[tag_id],
+            matrix.frequency[tag_ids[top]],
+            matrix.total,
+        )
+    return [
+        {"tag_id": int(t), "count": int(c), "npmi": round(float(s), 4)}
+        for t, c, s in zip(tag_ids[top], counts[top], scores)
+    ]
+
+
+def _together(graph: TagGraph, tag_id: int, tag_ids: np.ndarray) -> np.ndarray:
+    """Annotations carrying both `tag_id` and each of `tag_ids`"""
+    columns, counts = graph.annotations.row(tag_id)
+    positions = np.searchsorted(columns, tag_ids)
+    found = positions < len(columns)
+    found[found] = columns[positions[found]] == tag_ids[found]
+    together = np.zeros(len(tag_ids), np.int64)
+    together[found] = counts[positions[found]]
+    return together
+
+
+def synonyms(db: Session, tag_id: int, limit: int, min_support: int) -> list[dict]:
+    """Tags given to the same images as `tag_id` but rarely alongside it"""
+    with _lock:
+        graph = _current(db)
+        matrix = graph.images
+        if tag_id >= len(matrix.frequency):
+            return []
+        tag_ids, shared = matrix.row(tag_id)
+        keep = shared >= min_support
+        tag_ids, shared = tag_ids[keep], shared[keep]
+        together = _together(graph, tag_id, tag_ids)
+        scores = npmi(
+            shared, matrix.frequency[tag_id], matrix.frequency[tag_ids], matrix.total
+        )
+        candidates = np.flatnonzero(together <= MAX_TOGETHER * shared)
+        top = candidates[_top(scores[candidates], limit)]
+    return [
+        {
+            "tag_id": int(tag_ids[i]),
+            "images": int(shared[i]),
+            "together": int(together[i]),
+            "npmi": round(float(scores[i]), 4),
+        }
+        for i in top
+    ]
+
+
+def merge_suggestions(
+    db: Session, limit: int, min_support: int, min_npmi: float
+) -> list[dict]:
+    """Likely synonym pairs over the whole vocabulary, the rarer tag first"""
+    with _lock:
+        graph = _current(db)
+        key = (limit, min_support, min_npmi)
+        if key in graph.suggestions:
+            return graph.suggestions[key]
+
+        matrix = graph.images
+        a, b, shared = matrix.pairs()
+        keep = shared >= min_support
+        a, b, shared = a[keep], b[keep], shared[keep]
+
+        size = max(len(graph.annotations.frequency), len(matrix.frequency))
+        codes = a * size + b
+        x, y, counts = graph.annotations.pairs()
+        known = x * size + y
+        positions = np.searchsorted(known, codes)
+        found = positions < len(known)
+        found[found] = known[positions[found]] == codes[found]
+        together = np.zeros(len(codes), np.int64)
+        together[found] = counts[positions[found]]
+
+        frequency = matrix.frequency
+        scores = npmi(shared, frequency[a], frequency[b], matrix.total)
+        candidates = np.flatnonzero(
+            (together <= MAX_TOGETHER * shared) & (scores >= min_npmi)
+        )
+        top = candidates[_top(scores[candidates], limit)]
+        suggestions = []
+        for i in top.tolist():
+            source, target = int(a[i]), int(b[i])
+            if frequency[source] > frequency[target]:
+                source, target = target, source
+            suggestions.append(
+                {
+                    "source_id": source,
+                    "target_id": target,
+                    "source_images": int(frequency[source]),
+                    "target_images": int(frequency[target]),
+                    "images": int(shared[i]),
+                    "together": int(together[i]),
+                    "npmi": round(float(scores[i]), 4),
+                }
+            )
+        graph.suggestions[key] = suggestions
+        return suggestions
@@ -0,0 +1,88 @@
+import logging
+import threading
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from core.utils import phash
+from core.utils.cache import bump_versions, table_versions
+from core.utils.storage import NotFound, key_for, storage
+from dal.models import Image
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK = 500
+# phash of images that could not be read or decoded, so they are tried once
+UNHASHABLE = ""
+
+_tree_lock = threading.Lock()
+# Table versions, the tree, and its clusters by max_distance
+_tree: tuple[list[int], phash.BKTree, dict[int, list[list[int]]]] = (
+    [],
+    phash.BKTree(),
+    {},
+)
+
+
+def backfill_hashes(db: Session) -> int:
+    """Hash images stored before hashing existed, or imported by URL.
+
+    Run once per start by the warm-up rather than per request, since every
+    image without a hash is read from storage.
+    """
+    rows = db.execute(select(Image.id, Image.url).where(Image.phash.is_(None))).all()
+    hashed = 0
+    for start in range(0, len(rows), BACKFILL_CHUNK):
+        values = []
+        for image_id, url in rows[start : start + BACKFILL_CHUNK]:
+            try:
+                content = storage.read(key_for(url))
+                values.append({"id": image_id, "phash": phash.dhash(content)})
+            except (NotFound, OSError, ValueError) as e:
+                logger.warning("Cannot hash image %s: %s", image_id, e)
+                values.append({"id": image_id, "phash": UNHASHABLE})
+        if values:
+            db.execute(update(Image), values)
+            db.commit()
+            hashed += sum(value["phash"] != UNHASHABLE for value in values)
+    if rows:
+        bump_versions("images")
+    return hashed
+
+
+def duplicate_tree(db: Session) -> phash.BKTree:
+    """BK-tree of every hashed image, rebuilt only when images change"""
+    global _tree
+    versions = table_versions(["images"])
+    with _tree_lock:
+        if _tree[0] == versions:
+            return _tree[1]
+
+    tree = phash.BKTree()
+    for image_id, value in db.execute(
+        select(Image.id, Image.phash).where(
+            Image.phash.is_not(None), Image.phash != UNHASHABLE
+        )
+    ):
+        tree.add(int(value, 16), image_id)
+
+    with _tree_lock:
+        _tree = (versions, tree, {})
+    return tree
+
+
+def duplicate_clusters(db: Session, max_distance: int) -> list[list[int]]:
+    """tree.clusters(), largest first; it searches around every image, so it
+    runs once per version of the images table and distance"""
+    tree = duplicate_tree(db)
+    with _tree_lock:
+        cached = _tree[2].get(max_distance) if _tree[1] is tree else None
+    if cached is not None:
+        return cached
+
+    clusters = tree.clusters(max_distance)
+    clusters.sort(key=len, reverse=True)
+    with _tree_lock:
+        if _tree[1] is tree:
+            _tree[2][max_distance] = clusters
+    return clusters
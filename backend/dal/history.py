@@ -0,0 +1,438 @@
+"""Append-only annotation history and time travel.
+
+Every change to an annotation appends an AnnotationChange holding the tag
+ids it added and removed. Snapshots store all annotations as NumPy arrays,
+one row per annotation with their tag ids in a single flat array (CSR), so
+the dataset as of any moment is the latest snapshot before it plus the
+changes logged in between.
+"""
+
+import fcntl
+import io
+import itertools
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+from sqlalchemy import func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from dal import outbox
+from dal.models import (
+    Annotation,
+    AnnotationChange,
+    AnnotationSnapshot,
+    OutboxEvent,
+    Tags,
+)
+from dal.models.annotator import annotation_tags
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_CHANGES = int(os.getenv("HISTORY_SNAPSHOT_CHANGES", "10000"))
+SNAPSHOT_INTERVAL = float(os.getenv("HISTORY_SNAPSHOT_INTERVAL", "600"))
+
+_MISSING = object()
+
+
+def pack(tag_ids: Iterable[int]) -> bytes:
+    return np.array(sorted(tag_ids), dtype="<i4").tobytes()
+
+
+def unpack(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype="<i4")
+
+
+def record(
+    db: Session,
+    annotation: Annotation,
+    change: str,
+    operation: str,
+    actor: Optional[str] = None,
+):
+    """Log a change to `annotation` and queue it in the outbox, before commit.
+
+    The delta is read from the session's pending collection changes, so call
+    this after changing the tags and before anything flushes them. New
+    annotations must be flushed first for their id; all their tags count as
+    added.
+    """
+    if change == "created":
+        added, removed = annotation.tags, []
+    elif change == "deleted":
+        added, removed = [], annotation.tags
+    else:
+        pending = inspect(annotation).attrs.tags.history
+        added, removed = pending.added, pending.deleted
+
+    db.add(
+        AnnotationChange(
+            annotation_id=annotation.id,
+            image_id=annotation.image_id,
+            annotator_id=annotation.annotator_id,
+            change=change,
+            operation=operation,
+            actor=actor,
+            added=pack(tag.id for tag in added),
+            removed=pack(tag.id for tag in removed),
+        )
+    )
+    outbox.record_annotation(db, annotation, change)
+
+
+def record_bulk(db: Session, rows: list[dict], tag_names: dict[int, str]):
+    """Log many changes with one executemany per table, for imports.
+
+    Rows hold annotation_id, image_id, annotator_id, change, operation, actor
+    and the added/removed tag id lists; `tags` is the full set after the
+    change, named through `tag_names` for the outbox.
+    """
+    if not rows:
+        return
+    db.execute(
+        insert(AnnotationChange.__table__),
+        [
+            {
+                "annotation_id": row["annotation_id"],
+                "image_id": row["image_id"],
+                "annotator_id": row["annotator_id"],
+                "change": row["change"],
+                "operation": row["operation"],
+                "actor": row["actor"],
+                "added": pack(row["added"]),
+                "removed": pack(row["removed"]),
+            }
+            for row in rows
+        ],
+    )
+    db.execute(
+        insert(OutboxEvent.__table__),
+        [
+            outbox.annotation_event(
+                row["change"],
+                row["annotation_id"],
+                row["image_id"],
+                row["annotator_id"],
+                (tag_names[tag_id] for tag_id in row["tags"]),
+            )
+            for row in rows
+        ],
+    )
+
+
+@dataclass
+class AnnotationState:
+    """Every annotation at one moment, sorted by id"""
+
+    ids: np.ndarray
+    image_ids: np.ndarray
+    annotator_ids: np.ndarray
+    offsets: np.ndarray
+    tag_ids: np.ndarray
+
+    @classmethod
+    def build(cls, rows: np.ndarray, pairs: np.ndarray) -> "AnnotationState":
+        """From (id, image_id, annotator_id) rows and (annotation_id, tag_id) pairs"""
+        rows = rows[np.argsort(rows[:, 0], kind="stable")]
+        pairs = pairs[np.argsort(pairs[:, 0], kind="stable")]
+        positions = np.searchsorted(rows[:, 0], pairs[:, 0])
+        known = positions < len(rows)
+        known[known] = rows[positions[known], 0] == pairs[known, 0]
+        counts = np.bincount(positions[known], minlength=len(rows))
+        return cls(
+            ids=rows[:, 0].copy(),
+            image_ids=rows[:, 1].copy(),
+            annotator_ids=rows[:, 2].copy(),
+            offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            tag_ids=pairs[known, 1].astype(np.int32),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def tags(self, position: int) -> np.ndarray:
+        return self.tag_ids[self.offsets[position] : self.offsets[position + 1]]
+
+    def find(self, annotation_id: int) -> Optional[int]:
+        position = int(np.searchsorted(self.ids, annotation_id))
+        if position < len(self.ids) and self.ids[position] == annotation_id:
+            return position
+        return None
+
+    def dumps(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            ids=self.ids,
+            image_ids=self.image_ids,
+            annotator_ids=self.annotator_ids,
+            offsets=self.offsets,
+            tag_ids=self.tag_ids,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def loads(cls, data: bytes) -> "AnnotationState":
+        with np.load(io.BytesIO(data)) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+    def apply(self, changes: Iterable[tuple]) -> "AnnotationState":
+        """A new state with (annotation_id, image_id, annotator_id, change,
+        added, removed) changes applied in order"""
+        overlay: dict[int, Optional[tuple[int, int, set[int]]]] = {}
+        for annotation_id, image_id, annotator_id, change, added, removed in changes:
+            if change == "deleted":
+                overlay[annotation_id] = None
+                continue
+            current = overlay.get(annotation_id, _MISSING)
+            if current is _MISSING:
+                position = self.find(annotation_id)
+                tags = set() if position is None else set(self.tags(position).tolist())
+            else:
+                tags = current[2] if current else set()
+            tags.difference_update(unpack(removed).tolist())
+            tags.update(unpack(added).tolist())
+            overlay[annotation_id] = (image_id, annotator_id, tags)
+        if not overlay:
+            return self
+
+        lengths = np.diff(self.offsets)
+        keep = ~np.isin(self.ids, np.fromiter(overlay, dtype=np.int64))
+        rows = [(i, *row) for i, row in overlay.items() if row is not None]
+        new_tags = [sorted(tags) for *_, tags in rows]
+
+        ids = np.concatenate(
+            [self.ids[keep], np.array([r[0] for r in rows], np.int64)]
+        )
+        image_ids = np.concatenate(
+            [self.image_ids[keep], np.array([r[1] for r in rows], np.int64)]
+        )
+        annotator_ids = np.concatenate(
+            [self.annotator_ids[keep], np.array([r[2] for r in rows], np.int64)]
+        )
+        all_lengths = np.concatenate(
+            [lengths[keep], np.array([len(t) for t in new_tags], np.int64)]
+        )
+        tag_ids = np.concatenate(
+            [
+                self.tag_ids[np.repeat(keep, lengths)],
+                np.array([t for tags in new_tags for t in tags], np.int32),
+            ]
+        )
+
+        # Back into id order, moving each row's slice of tag ids along with it
+        order = np.argsort(ids, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(all_lengths)])[:-1][order]
+        lengths = all_lengths[order]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        gather = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return AnnotationState(
+            ids=ids[order],
+            image_ids=image_ids[order],
+            annotator_ids=annotator_ids[order],
+            offsets=offsets,
+            tag_ids=tag_ids[gather],
+        )
+
+
+def int_matrix(result, columns: int) -> np.ndarray:
+    # np.array() over millions of row tuples is orders of magnitude slower
+    values = itertools.chain.from_iterable(result)
+    return np.fromiter(values, dtype=np.int64).reshape(-1, columns)
+
+
+def take_snapshot(db: Session) -> AnnotationSnapshot:
+    """Snapshot the annotation tables together with the position in the log"""
+    db.rollback()
+    # pysqlite only opens a transaction before writes; the reads below must
+    # all see the same moment
+    db.connection().exec_driver_sql("BEGIN")
+    change_id = db.scalar(select(func.coalesce(func.max(AnnotationChange.id), 0)))
+    taken_at = datetime.utcnow()
+    rows = int_matrix(
+        db.execute(
+            select(Annotation.id, Annotation.image_id, Annotation.annotator_id).where(
+                Annotation.image_id.is_not(None)
+            )
+        ),
+        3,
+    )
+    pairs = int_matrix(
+        db.execute(select(annotation_tags.c.annotation_id, annotation_tags.c.tag_id)),
+        2,
+    )
+    names = {str(i): name for i, name in db.execute(select(Tags.id, Tags.name))}
+    db.rollback()
+
+    state = AnnotationState.build(rows, pairs)
+    snapshot = AnnotationSnapshot(
+        change_id=change_id,
+        taken_at=taken_at,
+        annotations=len(state),
+        tag_names=names,
+        data=state.dumps(),
+    )
+    db.add(snapshot)
+    db.commit()
+    return snapshot
+
+
+_cache_lock = threading.Lock()
+_cached: tuple[Optional[int], Optional[AnnotationState]] = (None, None)
+
+
+def _snapshot_state(db: Session, snapshot_id: int) -> AnnotationState:
+    """Decoded snapshot, keeping the last one since queries cluster in time"""
+    global _cached
+    with _cache_lock:
+        if _cached[0] == snapshot_id:
+            return _cached[1]
+    data = db.scalar(
+        select(AnnotationSnapshot.data).where(AnnotationSnapshot.id == snapshot_id)
+    )
+    state = AnnotationState.loads(data)
+    with _cache_lock:
+        _cached = (snapshot_id, state)
+    return state
+
+
+def first_snapshot_at(db: Session) -> Optional[datetime]:
+    return db.scalar(select(func.min(AnnotationSnapshot.taken_at)))
+
+
+def state_as_of(db: Session, at: datetime) -> Optional[AnnotationState]:
+    """Every annotation as it was at `at`; None before history was recorded"""
+    snapshot = db.execute(
+        select(AnnotationSnapshot.id, AnnotationSnapshot.change_id)
+        .where(AnnotationSnapshot.taken_at <= at)
+        .order_by(AnnotationSnapshot.taken_at.desc())
+        .limit(1)
+    ).first()
+    if snapshot is None:
+        return None
+
+    changes = db.execute(
+        select(
+            AnnotationChange.annotation_id,
+            AnnotationChange.image_id,
+            AnnotationChange.annotator_id,
+            AnnotationChange.change,
+            AnnotationChange.added,
+            AnnotationChange.removed,
+        )
+        .where(
+            AnnotationChange.id > snapshot.change_id,
+            AnnotationChange.created_at <= at,
+        )
+        .order_by(AnnotationChange.id)
+    )
+    return _snapshot_state(db, snapshot.id).apply(changes)
+
+
+def tag_names(db: Session, tag_ids: Iterable[int]) -> dict[int, str]:
+    """Names of tag ids, including tags deleted since the latest snapshot"""
+    wanted = set(int(i) for i in tag_ids)
+    names = dict(
+        db.execute(select(Tags.id, Tags.name).where(Tags.id.in_(wanted))).all()
+    )
+    missing = wanted - names.keys()
+    if missing:
+        for snapshot_names in db.scalars(
+            select(AnnotationSnapshot.tag_names).order_by(AnnotationSnapshot.id.desc())
+        ):
+            names.update(
+                (i, snapshot_names[str(i)]) for i in missing if str(i) in snapshot_names
+            )
+            missing -= names.keys()
+            if not missing:
+                break
+    return names
+
+
+def changes(
+    db: Session,
+    annotation_id: Optional[int] = None,
+    image_id: Optional[int] = None,
+    annotator_id: Optional[int] = None,
+    after: int = 0,
+    limit: int = 100,
+) -> list[dict]:
+    query = select(AnnotationChange).where(AnnotationChange.id > after)
+    if annotation_id is not None:
+        query = query.where(AnnotationChange.annotation_id == annotation_id)
+    if image_id is not None:
+        query = query.where(AnnotationChange.image_id == image_id)
+    if annotator_id is not None:
+        query = query.where(AnnotationChange.annotator_id == annotator_id)
+    rows = db.scalars(query.order_by(AnnotationChange.id).limit(limit)).all()
+
+    deltas = [(unpack(row.added), unpack(row.removed)) for row in rows]
+    names = tag_names(
+        db, (int(i) for added, removed in deltas for i in (*added, *removed))
+    )
+    return [
+        {
+            "id": row.id,
+            "annotation_id": row.annotation_id,
+            "image_id": row.image_id,
+            "annotator_id": row.annotator_id,
+            "change": row.change,
+            "operation": row.operation,
+            "actor": row.actor,
+            "added": [names.get(int(i), f"#{i}") for i in added],
+            "removed": [names.get(int(i), f"#{i}") for i in removed],
+            "created_at": row.created_at,
+        }
+        for row, (added, removed) in zip(rows, deltas)
+    ]
+
+
+def snapshot_if_due(db: Session, force: bool = False) -> Optional[AnnotationSnapshot]:
+    """Snapshot once enough changes piled up; one worker at a time"""
+    latest = db.scalar(select(func.max(AnnotationSnapshot.change_id)))
+    if latest is not None and not force:
+        pending = db.scalar(
+            select(func.count(AnnotationChange.id)).where(AnnotationChange.id > latest)
+        )
+        if pending < SNAPSHOT_CHANGES:
+            return None
+
+    with open("paladium.db.snapshot.lock", "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None  # another worker is on it
+        return take_snapshot(db)
+
+
+_stop = threading.Event()
+
+
+def start_snapshots(session_factory: Callable[[], Session]):
+    """Take snapshots in the background every SNAPSHOT_INTERVAL seconds, if due"""
+
+    def run():
+        while not _stop.wait(SNAPSHOT_INTERVAL):
+            try:
+                with session_factory() as db:
+                    snapshot = snapshot_if_due(db)
+                    # Expired by the commit, loaded again while attached
+                    if snapshot is not None:
+                        logger.info(
+                            "Snapshot of %s annotations at change %s",
+                            snapshot.annotations,
+                            snapshot.change_id,
+                        )
+            except Exception as e:
+                logger.warning("History snapshot failed: %s", e)
+
+    _stop.clear()
+    threading.Thread(target=run, name="history-snapshots", daemon=True).start()
+
+
+def stop_snapshots():
+    _stop.set()
@@ -0,0 +1,42 @@
+"""Idempotency-Key support: a retried write is answered from the stored result.
+
+The key is stored in the same transaction as the write it belongs to, so
+either both commit or neither does; a concurrent retry that loses the race
+hits the unique constraint and replays the winner's result.
+"""
+
+import hashlib
+from datetime import datetime
+from typing import Optional
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from dal.models import IdempotencyKey
+from dal.outbox import IDEMPOTENCY_TTL
+
+
+def fingerprint(request: dict) -> str:
+    encoded = orjson.dumps(request, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def lookup(db: Session, scope: str, key: str) -> Optional[IdempotencyKey]:
+    return db.scalar(
+        select(IdempotencyKey).where(
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.key == key,
+            IdempotencyKey.created_at >= datetime.utcnow() - IDEMPOTENCY_TTL,
+        )
+    )
+
+
+def remember(
+    db: Session, scope: str, key: str, request_fingerprint: str, response: dict
+):
+    db.add(
+        IdempotencyKey(
+            scope=scope, key=key, fingerprint=request_fingerprint, response=response
+        )
+    )
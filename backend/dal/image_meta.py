@@ -0,0 +1,92 @@
+"""Backfill of core.utils.image_meta for images stored before uploads read it,
+or imported by URL. Images are decoded in a process pool, BATCH_SIZE per
+task, and each batch is written with one executemany.
+
+From backend/:
+    python -m dal.image_meta --workers 4
+
+Cached responses of a running server are only invalidated when it shares
+CACHE_BACKEND_URL with the CLI.
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from core.utils import image_meta
+from core.utils.cache import bump_versions
+from core.utils.storage import NotFound, key_for, storage
+from dal.models import Image
+
+BATCH_SIZE = 64
+
+
+def extract_batch(keys: list[str]) -> list[Optional[dict]]:
+    """Runs in a worker process; missing or undecodable images yield None"""
+    results = []
+    for key in keys:
+        try:
+            results.append(image_meta.extract(storage.read(key)))
+        except (NotFound, OSError, ValueError):
+            results.append(None)
+    return results
+
+
+def backfill(db: Session, workers: int) -> Iterator[tuple[int, int]]:
+    """Fill the metadata of images without it, yielding (done, total) per batch"""
+    images = db.execute(select(Image.id, Image.url).where(Image.width.is_(None))).all()
+    batches = []
+    iterator = iter(images)
+    while batch := list(itertools.islice(iterator, BATCH_SIZE)):
+        batches.append(batch)
+
+    done = 0
+    # spawn, like the embeddings pool: storage clients do not survive a fork
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        results = pool.map(
+            extract_batch, [[key_for(url) for _, url in batch] for batch in batches]
+        )
+        try:
+            for batch, metas in zip(batches, results):
+                rows = [
+                    {"id": image_id, **meta}
+                    for (image_id, _), meta in zip(batch, metas)
+                    if meta is not None
+                ]
+                if rows:
+                    db.execute(update(Image), rows)
+                    db.commit()
+                done += len(batch)
+                yield done, len(images)
+        finally:
+            bump_versions("images")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read metadata of stored images")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    from dal import migrate
+    from dal.setup import ENGINE, setup_db
+
+    migrate.check(ENGINE)
+
+    done = total = 0
+    with setup_db() as db:
+        for done, total in backfill(db, args.workers):
+            print(f"{done}/{total} images", file=sys.stderr)
+    print(f"Went through {done} of {total} images without metadata")
+
+
+if __name__ == "__main__":
+    main()
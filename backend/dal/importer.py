@@ -0,0 +1,329 @@
+"""Bulk import of labeled datasets.
+
+Records stream from core.utils.importers and are handled IMPORT_CHUNK_SIZE at
+a time: annotators, images and tags are resolved with a few IN queries, what
+is missing is inserted with executemany and the chunk commits. Memory stays
+bounded by the chunk, and a failed import keeps the chunks before it.
+
+Records are matched to existing images by url, never by name: names are
+client file names and repeat across unrelated uploads. Imported tags are
+added to an existing annotation by the same annotator on the same image, so
+running an import twice changes nothing. Every created or
+updated annotation is logged to the history and the outbox like any other
+change.
+
+From backend/:
+    python -m dal.importer instances.json --format coco --annotator-id 1
+
+Cached responses of a running server are only invalidated when it shares
+CACHE_BACKEND_URL with the CLI; otherwise import through POST /imports.
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from core.utils.cache import bump_versions
+from core.utils.importers import FORMATS, ImportRecord, parse
+from core.utils.storage import key_for, storage, url_for
+from dal import duplicates, history
+from dal.models import Annotation, Annotator, Image, Tags
+from dal.models.annotator import annotation_tags
+from dal.tags import tag_ids
+
+CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "20000"))
+MAX_ERRORS = 20
+
+
+@dataclass
+class ImportStats:
+    records: int = 0
+    skipped: int = 0
+    images_created: int = 0
+    tags_created: int = 0
+    annotations_created: int = 0
+    annotations_updated: int = 0
+    tags_added: int = 0
+    elapsed: float = 0.0
+    done: bool = False
+    errors: list[str] = field(default_factory=list)
+
+    def skip(self, record: ImportRecord, reason: str):
+        self.skipped += 1
+        if len(self.errors) < MAX_ERRORS:
+            where = f"Line {record.line}" if record.line else f"Image {record.image}"
+            self.errors.append(f"{where}: {reason}")
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _batches(values: Iterable, size: int = 500):
+    iterator = iter(values)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def import_records(
+    db: Session,
+    records: Iterable[ImportRecord],
+    annotator_id: Optional[int] = None,
+    actor: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[ImportStats]:
+    """Import `records`, committing and yielding progress after every chunk.
+
+    `annotator_id` is the default for records without one. The last stats
+    yielded have `done` set; stopping early keeps the committed chunks.
+    """
+    stats = ImportStats()
+    started = time.perf_counter()
+    try:
+        for chunk in _batches(records, chunk_size):
+            _import_chunk(db, chunk, annotator_id, actor, stats)
+            db.commit()
+            stats.elapsed = round(time.perf_counter() - started, 3)
+            yield stats
+    finally:
+        db.rollback()
+        if stats.records:
+            bump_versions("images", "tags", "annotations", "annotation_tags")
+    # A fresh snapshot keeps as-of queries from replaying the whole import
+    history.snapshot_if_due(db)
+    stats.elapsed = round(time.perf_counter() - started, 3)
+    stats.done = True
+    yield stats
+
+
+def _import_chunk(
+    db: Session,
+    chunk: list[ImportRecord],
+    default_annotator: Optional[int],
+    actor: Optional[str],
+    stats: ImportStats,
+):
+    stats.records += len(chunk)
+    now = datetime.utcnow()
+
+    by_email: dict[str, int] = {}
+    for batch in _batches({r.annotator_email for r in chunk if r.annotator_email}):
+        by_email.update(
+            db.execute(
+                select(Annotator.email, Annotator.id).where(Annotator.email.in_(batch))
+            ).all()
+        )
+    ids = {r.annotator_id for r in chunk if r.annotator_id is not None}
+    if default_annotator is not None:
+        ids.add(default_annotator)
+    known = set(by_email.values())
+    for batch in _batches(ids):
+        known.update(db.scalars(select(Annotator.id).where(Annotator.id.in_(batch))))
+
+    wanted: dict[tuple[str, int], set[str]] = defaultdict(set)
+    names: dict[str, str] = {}
+    for record in chunk:
+        if record.error:
+            stats.skip(record, record.error)
+            continue
+        if record.annotator_email:
+            annotator = by_email.get(record.annotator_email)
+        elif record.annotator_id is not None:
+            annotator = record.annotator_id
+        else:
+            annotator = default_annotator
+        if annotator not in known:
+            stats.skip(record, "unknown annotator")
+            continue
+        if not record.tags:
+            stats.skip(record, "no tags")
+            continue
+        url = record.url or url_for(record.image)
+        wanted[(url, annotator)].update(record.tags)
+        names.setdefault(url, record.image)
+    if not wanted:
+        return
+
+    image_ids = _image_ids(db, names)
+    missing = [url for url in names if url not in image_ids]
+    if missing:
+        # Only images whose bytes are stored can be hashed by the backfill
+        stored = storage.existing([key_for(url) for url in missing])
+        db.execute(
+            insert(Image.__table__),
+            [
+                {
+                    "name": names[url],
+                    "url": url,
+                    "date_added": now,
+                    "phash": None if key_for(url) in stored else duplicates.UNHASHABLE,
+                }
+                for url in missing
+            ],
+        )
+        image_ids.update(_image_ids(db, missing))
+        stats.images_created += len(missing)
+
+    ids_by_name, created_tags = tag_ids(db, set().union(*wanted.values()))
+    stats.tags_created += created_tags
+    pairs = {
+        (image_ids[url], annotator): {ids_by_name[tag] for tag in tags}
+        for (url, annotator), tags in wanted.items()
+    }
+
+    existing = _annotation_ids(db, pairs)
+    new = [pair for pair in pairs if pair not in existing]
+    created: dict[tuple[int, int], int] = {}
+    if new:
+        db.execute(
+            insert(Annotation.__table__),
+            [
+                {
+                    "image_id": image_id,
+                    "annotator_id": annotator,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for image_id, annotator in new
+            ],
+        )
+        created = _annotation_ids(db, new)
+
+    current: dict[int, set[int]] = defaultdict(set)
+    for batch in _batches(existing.values()):
+        for annotation_id, tag_id in db.execute(
+            select(annotation_tags.c.annotation_id, annotation_tags.c.tag_id).where(
+                annotation_tags.c.annotation_id.in_(batch)
+            )
+        ):
+            current[annotation_id].add(tag_id)
+
+    links, changes, updated = [], [], []
+    for (image_id, annotator), tags in pairs.items():
+        if (image_id, annotator) in existing:
+            annotation_id = existing[(image_id, annotator)]
+            added = tags - current[annotation_id]
+            if not added:
+                continue
+            change, after = "updated", current[annotation_id] | added
+            updated.append({"id": annotation_id, "updated_at": now})
+        else:
+            annotation_id = created[(image_id, annotator)]
+            change, added, after = "created", tags, tags
+        links.extend({"annotation_id": annotation_id, "tag_id": t} for t in added)
+        changes.append(
+            {
+                "annotation_id": annotation_id,
+                "image_id": image_id,
+                "annotator_id": annotator,
+                "change": change,
+                "operation": "import",
+                "actor": actor,
+                "added": added,
+                "removed": (),
+                "tags": after,
+            }
+        )
+    if not links:
+        return
+
+    db.execute(sqlite_insert(annotation_tags).on_conflict_do_nothing(), links)
+    if updated:
+        db.execute(update(Annotation), updated)
+
+    names = {tag_id: name for name, tag_id in ids_by_name.items()}
+    unnamed = {t for row in changes for t in row["tags"] if t not in names}
+    for batch in _batches(unnamed):
+        names.update(
+            db.execute(select(Tags.id, Tags.name).where(Tags.id.in_(batch))).all()
+        )
+    history.record_bulk(db, changes, names)
+
+    stats.annotations_created += len(new)
+    stats.annotations_updated += len(updated)
+    stats.tags_added += len(links)
+
+
+def _image_ids(db: Session, urls: Iterable[str]) -> dict[str, int]:
+    """Oldest image per url"""
+    found: dict[str, int] = {}
+    for batch in _batches(urls):
+        found.update(
+            db.execute(
+                select(Image.url, func.min(Image.id))
+                .where(Image.url.in_(batch))
+                .group_by(Image.url)
+            ).all()
+        )
+    return found
+
+
+def _annotation_ids(
+    db: Session, pairs: Iterable[tuple[int, int]]
+) -> dict[tuple[int, int], int]:
+    """Oldest annotation per (image_id, annotator_id) among `pairs`"""
+    wanted = set(pairs)
+    found: dict[tuple[int, int], int] = {}
+    for batch in _batches({image_id for image_id, _ in wanted}):
+        for annotation_id, image_id, annotator in db.execute(
+            select(Annotation.id, Annotation.image_id, Annotation.annotator_id)
+            .where(Annotation.image_id.in_(batch))
+            .order_by(Annotation.id.desc())
+        ):
+            if (image_id, annotator) in wanted:
+                found[(image_id, annotator)] = annotation_id
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a labeled dataset")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--annotator-id", type=int)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from dal import migrate
+    from dal.setup import ENGINE, setup_db
+
+    format = args.format or os.path.splitext(args.path)[1].lstrip(".").lower()
+    if format == "json":
+        format = "coco"
+    migrate.check(ENGINE)
+
+    with open(args.path, "rb") as stream, setup_db() as db:
+        for stats in import_records(
+            db,
+            parse(stream, format),
+            annotator_id=args.annotator_id,
+            actor="cli",
+            chunk_size=args.chunk_size,
+        ):
+            rate = stats.records / stats.elapsed if stats.elapsed else 0
+            print(
+                f"{stats.records} records, {stats.annotations_created} created, "
+                f"{stats.annotations_updated} updated, {stats.skipped} skipped "
+                f"({rate:.0f}/s)",
+                file=sys.stderr,
+            )
+    for error in stats.errors:
+        print(error, file=sys.stderr)
+    print(
+        f"Imported {stats.records} records in {stats.elapsed:.1f}s: "
+        f"{stats.images_created} images, {stats.tags_created} tags, "
+        f"{stats.annotations_created} annotations created, "
+        f"{stats.annotations_updated} updated, {stats.skipped} skipped"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""Relationship loading policy per endpoint.
+
+Every relationship in `dal.models` keeps SQLAlchemy's lazy `select` default,
+so endpoints that walk relationships must declare what they load here instead
+of firing one query per row. With PALADIUM_STRICT_LOADING=1 any relationship
+not covered by the policy raises on access, which turns a new N+1 pattern into
+a hard failure (see benchmarks/query_budget.py).
+"""
+
+import os
+
+from sqlalchemy.orm import raiseload, selectinload
+
+from dal.models import Annotation, Groups
+
+STRICT_LOADING = os.getenv("PALADIUM_STRICT_LOADING") == "1"
+
+
+def policy(*options):
+    if STRICT_LOADING:
+        return (*options, raiseload("*"))
+    return options
+
+
+# Groups with their members (groups router)
+GROUP_MEMBERS = policy(selectinload(Groups.annotators))
+
+# Annotations with their tags (tag curation, per-annotator listing)
+ANNOTATION_TAGS = policy(selectinload(Annotation.tags))
@@ -0,0 +1,119 @@
+"""Set-based group membership and image assignment.
+
+Every function applies one change to many rows in a few statements per batch
+of ids and leaves the commit to the caller, so a bulk request is a single
+transaction.
+"""
+
+import itertools
+from typing import Iterable
+
+from sqlalchemy import delete, func, literal, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from dal.models import Annotator, Image, image_groups
+from dal.models.groups import group_annotators
+
+# Ids bound per statement, well under SQLite's variable limit
+BATCH_SIZE = 5000
+
+
+def _batches(ids: Iterable[int]):
+    iterator = iter(sorted(set(ids)))
+    while batch := list(itertools.islice(iterator, BATCH_SIZE)):
+        yield batch
+
+
+def _found(db: Session, model, batch: list[int]) -> int:
+    return db.scalar(select(func.count()).where(model.id.in_(batch)))
+
+
+def add_images(db: Session, group_id: int, image_ids: Iterable[int]) -> dict:
+    """Assign images to a group; ids of missing images are counted, not added"""
+    counts = {"requested": 0, "changed": 0, "unchanged": 0, "not_found": 0}
+    for batch in _batches(image_ids):
+        found = _found(db, Image, batch)
+        added = db.execute(
+            insert(image_groups)
+            .from_select(
+                ["image_id", "group_id"],
+                select(Image.id, literal(group_id)).where(Image.id.in_(batch)),
+            )
+            .on_conflict_do_nothing()
+        ).rowcount
+        counts["requested"] += len(batch)
+        counts["changed"] += added
+        counts["unchanged"] += found - added
+        counts["not_found"] += len(batch) - found
+    return counts
+
+
+def remove_images(db: Session, group_id: int, image_ids: Iterable[int]) -> dict:
+    """Take images out of a group"""
+    counts = {"requested": 0, "changed": 0, "unchanged": 0, "not_found": 0}
+    for batch in _batches(image_ids):
+        found = _found(db, Image, batch)
+        removed = db.execute(
+            delete(image_groups).where(
+                image_groups.c.group_id == group_id,
+                image_groups.c.image_id.in_(batch),
+            )
+        ).rowcount
+        counts["requested"] += len(batch)
+        counts["changed"] += removed
+        counts["unchanged"] += found - removed
+        counts["not_found"] += len(batch) - found
+    return counts
+
+
+def add_members(db: Session, group_id: int, annotator_ids: Iterable[int]) -> dict:
+    """Put annotators in a group. An annotator belongs to one group at most:
+    members of another group are counted in `in_other_group` and left there."""
+    counts = {
+        "requested": 0,
+        "changed": 0,
+        "unchanged": 0,
+        "not_found": 0,
+        "in_other_group": 0,
+    }
+    for batch in _batches(annotator_ids):
+        found = _found(db, Annotator, batch)
+        already = db.scalar(
+            select(func.count()).where(
+                group_annotators.c.group_id == group_id,
+                group_annotators.c.annotator_id.in_(batch),
+            )
+        )
+        added = db.execute(
+            insert(group_annotators)
+            .from_select(
+                ["group_id", "annotator_id"],
+                select(literal(group_id), Annotator.id).where(Annotator.id.in_(batch)),
+            )
+            .on_conflict_do_nothing(index_elements=["annotator_id"])
+        ).rowcount
+        counts["requested"] += len(batch)
+        counts["changed"] += added
+        counts["unchanged"] += already
+        counts["not_found"] += len(batch) - found
+        counts["in_other_group"] += found - added - already
+    return counts
+
+
+def remove_members(db: Session, group_id: int, annotator_ids: Iterable[int]) -> dict:
+    """Take annotators out of a group"""
+    counts = {"requested": 0, "changed": 0, "unchanged": 0, "not_found": 0}
+    for batch in _batches(annotator_ids):
+        found = _found(db, Annotator, batch)
+        removed = db.execute(
+            delete(group_annotators).where(
+                group_annotators.c.group_id == group_id,
+                group_annotators.c.annotator_id.in_(batch),
+            )
+        ).rowcount
+        counts["requested"] += len(batch)
+        counts["changed"] += removed
+        counts["unchanged"] += found - removed
+        counts["not_found"] += len(batch) - found
+    return counts
@@ -0,0 +1,304 @@
+"""Schema migrations, an explicit step before the app starts:
+
+    python -m dal.migrate
+
+SQLite's user_version holds the SCHEMA_VERSION a database was last migrated
+to, so a starting worker only reads one pragma. With MIGRATE_ON_STARTUP=1
+(the default, convenient in development) a worker finding an older schema
+migrates it itself; with 0 it refuses to start instead.
+"""
+
+import fcntl
+import logging
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from dal import history
+from dal.models import Base
+
+logger = logging.getLogger(__name__)
+
+# Bump with every change to dal.models
+SCHEMA_VERSION = 4
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
+ORPHAN_BATCH = 500
+
+
+def add_missing_columns(engine: Engine):
+    """create_all() never alters existing tables: add new columns and indexes"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(engine.dialect)
+                    conn.execute(
+                        text(
+                            f"ALTER TABLE {table.name} "
+                            f"ADD COLUMN {column.name} {column_type}"
+                        )
+                    )
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def _foreign_keys(table) -> set[tuple]:
+    return {
+        (fk.parent.name, fk.column.table.name, fk.ondelete) for fk in table.foreign_keys
+    }
+
+
+def _existing_foreign_keys(inspector, name: str) -> set[tuple]:
+    return {
+        (column, fk["referred_table"], fk["options"].get("ondelete"))
+        for fk in inspector.get_foreign_keys(name)
+        for column in fk["constrained_columns"]
+    }
+
+
+def _autoincrement_missing(engine: Engine, table) -> bool:
+    if not table.dialect_options["sqlite"]["autoincrement"]:
+        return False
+    with engine.connect() as conn:
+        sql = conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (table.name,),
+        ).scalar()
+    return "AUTOINCREMENT" not in sql.upper()
+
+
+def _in(rowids: list[int]) -> str:
+    return f"rowid IN ({', '.join('?' * len(rowids))})"
+
+
+def _log_deleted_annotations(conn, rowids: list[int]):
+    """'deleted' changes for orphaned annotations, so history and the outbox
+    agree with the tables"""
+    annotations = conn.exec_driver_sql(
+        f"SELECT id, image_id, annotator_id FROM annotations WHERE {_in(rowids)}",
+        tuple(rowids),
+    ).all()
+    tags = defaultdict(list)
+    for annotation_id, tag_id in conn.exec_driver_sql(
+        "SELECT annotation_id, tag_id FROM annotation_tags WHERE annotation_id IN "
+        f"({', '.join('?' * len(annotations))})",
+        tuple(annotation_id for annotation_id, _, _ in annotations),
+    ):
+        tags[annotation_id].append(tag_id)
+    history.record_bulk(
+        conn,
+        [
+            {
+                "annotation_id": annotation_id,
+                "image_id": image_id,
+                "annotator_id": annotator_id,
+                "change": "deleted",
+                "operation": "migrate",
+                "actor": None,
+                "added": (),
+                "removed": tags[annotation_id],
+                "tags": (),
+            }
+            for annotation_id, image_id, annotator_id in annotations
+        ],
+        {},
+    )
+
+
+def _quarantine(conn, name: str, rowids: list[int]):
+    """Move rows to <name>__orphans, kept for an operator to inspect"""
+    conn.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {name}__orphans AS SELECT * FROM {name} WHERE 0"
+    )
+    # The table may be left from an older schema with other columns
+    columns = ", ".join(
+        column
+        for _, column, *_ in conn.exec_driver_sql(f"PRAGMA table_info({name}__orphans)")
+    )
+    conn.exec_driver_sql(
+        f"INSERT INTO {name}__orphans ({columns}) "
+        f"SELECT {columns} FROM {name} WHERE {_in(rowids)}",
+        tuple(rowids),
+    )
+    conn.exec_driver_sql(f"DELETE FROM {name} WHERE {_in(rowids)}", tuple(rowids))
+
+
+def quarantine_duplicates(engine: Engine):
+    """Unique indexes new to an existing table would fail on rows the code
+    only kept unique by checking first: keep the oldest row per key, move the
+    others to <name>__orphans"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            built = {
+                tuple(index["column_names"])
+                for index in inspector.get_indexes(table.name)
+                if index["unique"]
+            }
+            for index in table.indexes:
+                columns = tuple(column.name for column in index.columns)
+                if not index.unique or columns in built or set(columns) - existing:
+                    continue
+                # NULLs never collide in a unique index
+                rowids = conn.exec_driver_sql(
+                    f"SELECT rowid FROM {table.name} WHERE "
+                    + " AND ".join(f"{column} IS NOT NULL" for column in columns)
+                    + f" AND rowid NOT IN (SELECT min(rowid) FROM {table.name} "
+                    f"GROUP BY {', '.join(columns)})"
+                ).scalars().all()
+                for start in range(0, len(rowids), ORPHAN_BATCH):
+                    _quarantine(conn, table.name, rowids[start : start + ORPHAN_BATCH])
+                if rowids:
+                    logger.warning(
+                        "Moved %d rows of %s duplicating %s to %s__orphans",
+                        len(rowids),
+                        table.name,
+                        ", ".join(columns),
+                        table.name,
+                    )
+
+
+def rebuild_tables(engine: Engine):
+    """SQLite cannot alter a foreign key or make a key AUTOINCREMENT: copy
+    tables that differ from the models into new ones, then quarantine the rows
+    they leave orphaned"""
+    inspector = inspect(engine)
+    stale = [
+        table
+        for table in Base.metadata.sorted_tables
+        if inspector.has_table(table.name)
+        and (
+            _foreign_keys(table) != _existing_foreign_keys(inspector, table.name)
+            or _autoincrement_missing(engine, table)
+        )
+    ]
+    if not stale:
+        return
+
+    with engine.connect() as conn:
+        # Has no effect inside a transaction
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        conn.exec_driver_sql("BEGIN")
+        for table in stale:
+            columns = ", ".join(
+                column["name"]
+                for column in inspector.get_columns(table.name)
+                if column["name"] in table.columns
+            )
+            create = str(CreateTable(table).compile(engine)).replace(
+                f"CREATE TABLE {table.name} ", f"CREATE TABLE {table.name}__new ", 1
+            )
+            conn.exec_driver_sql(create)
+            conn.exec_driver_sql(
+                f"INSERT INTO {table.name}__new ({columns}) "
+                f"SELECT {columns} FROM {table.name}"
+            )
+            conn.exec_driver_sql(f"DROP TABLE {table.name}")
+            conn.exec_driver_sql(
+                f"ALTER TABLE {table.name}__new RENAME TO {table.name}"
+            )
+            for index in table.indexes:
+                index.create(conn)
+
+        orphans = defaultdict(int)
+        # Removing an orphan can orphan its own children
+        while rows := conn.exec_driver_sql("PRAGMA foreign_key_check").all():
+            by_table = defaultdict(set)
+            for name, rowid, _, _ in rows:
+                by_table[name].add(rowid)
+            for name, rowids in by_table.items():
+                for start in range(0, len(rowids), ORPHAN_BATCH):
+                    batch = sorted(rowids)[start : start + ORPHAN_BATCH]
+                    if name == "annotations":
+                        _log_deleted_annotations(conn, batch)
+                    _quarantine(conn, name, batch)
+                orphans[name] += len(rowids)
+        conn.commit()
+        conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+    logger.info("Rebuilt %s", ", ".join(table.name for table in stale))
+    for name, count in orphans.items():
+        logger.warning(
+            "Moved %d rows of %s referring to missing rows to %s__orphans",
+            count,
+            name,
+            name,
+        )
+
+
+@contextmanager
+def schema_lock():
+    """Serialise schema changes between workers starting at the same time"""
+    with open("paladium.db.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def schema_version(engine: Engine) -> int:
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def upgrade(engine: Engine) -> bool:
+    """Bring the schema to SCHEMA_VERSION; False if it already was"""
+    with schema_lock():
+        # Another worker may have migrated while this one waited for the lock
+        if schema_version(engine) >= SCHEMA_VERSION:
+            return False
+        Base.metadata.create_all(bind=engine)
+        quarantine_duplicates(engine)
+        rebuild_tables(engine)
+        add_missing_columns(engine)
+        with Session(engine) as db:
+            # Time travel starts from this first snapshot
+            if history.first_snapshot_at(db) is None:
+                history.take_snapshot(db)
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    logger.info("Migrated the database schema to version %d", SCHEMA_VERSION)
+    return True
+
+
+def check(engine: Engine):
+    """Startup check: migrate an older schema if allowed, refuse otherwise"""
+    version = schema_version(engine)
+    if version > SCHEMA_VERSION:
+        # Rolling back, or old workers still running next to new ones
+        logger.warning(
+            "Database schema is at version %d, newer than this code's %d",
+            version,
+            SCHEMA_VERSION,
+        )
+    elif version < SCHEMA_VERSION:
+        if not MIGRATE_ON_STARTUP:
+            raise RuntimeError(
+                f"Database schema is at version {version}, expected "
+                f"{SCHEMA_VERSION}: run `python -m dal.migrate` first"
+            )
+        upgrade(engine)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    from dal.setup import ENGINE
+
+    if not upgrade(ENGINE):
+        print(f"Database schema already at version {SCHEMA_VERSION}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,26 @@
 from .base import Base
 
 # Import association tables and all models
-from .image import image_groups, Image
+from .image import image_groups, Image, PriorityCursor
 from .tags import Tags
 from .groups import Groups
 from .annotator import Annotator, Annotation
+from .outbox import IdempotencyKey, OutboxEvent
+from .history import AnnotationChange, AnnotationSnapshot
 
 # This ensures all models are loaded before relationships are configured
 __all__ = [
     "Base",
     "Image",
+    "PriorityCursor",
     "Tags",
     "Groups",
     "image_tags",
     "image_groups",
     "Annotator",
     "Annotation",
+    "IdempotencyKey",
+    "OutboxEvent",
+    "AnnotationChange",
+    "AnnotationSnapshot",
 ]
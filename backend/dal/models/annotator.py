@@ -1,4 +1,4 @@
-from sqlalchemy import String, Table, Column, ForeignKey, DateTime, Boolean
+from sqlalchemy import String, Table, Column, ForeignKey, DateTime, Boolean, Index
 from datetime import datetime
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .base import Base
@@ -7,8 +7,12 @@ from .base import Base
 annotation_tags = Table(
     "annotation_tags",
     Base.metadata,
-    Column("annotation_id", ForeignKey("annotations.id"), primary_key=True),
-    Column("tag_id", ForeignKey("tags.id"), primary_key=True),
+    Column(
+        "annotation_id",
+        ForeignKey("annotations.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column("tag_id", ForeignKey("tags.id"), primary_key=True, index=True),
 )
 
 
@@ -21,16 +25,23 @@ class Annotator(Base):
     password_hash: Mapped[str] = mapped_column(String(255))
     annotations: Mapped[list["Annotation"]] = relationship(back_populates="annotator")
     groups = relationship(
-        "Groups", secondary="group_annotators", back_populates="annotators"
+        "Groups",
+        secondary="group_annotators",
+        back_populates="annotators",
+        passive_deletes=True,
     )
 
 
 class Annotation(Base):
     __tablename__ = "annotations"
+    # Serves the ON DELETE CASCADE from images and the per-group stats join
+    __table_args__ = (
+        Index("ix_annotations_image_annotator", "image_id", "annotator_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    image_id: Mapped[int] = mapped_column(ForeignKey("images.id"))
-    annotator_id: Mapped[int] = mapped_column(ForeignKey("annotators.id"))
+    image_id: Mapped[int] = mapped_column(ForeignKey("images.id", ondelete="CASCADE"))
+    annotator_id: Mapped[int] = mapped_column(ForeignKey("annotators.id"), index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
@@ -40,5 +51,5 @@ class Annotation(Base):
     image: Mapped["Image"] = relationship(back_populates="annotations")
     annotator: Mapped["Annotator"] = relationship(back_populates="annotations")
     tags: Mapped[list["Tags"]] = relationship(
-        secondary=annotation_tags, back_populates="annotations"
+        secondary=annotation_tags, back_populates="annotations", passive_deletes=True
     )
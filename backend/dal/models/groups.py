@@ -6,8 +6,17 @@ from .base import Base
 group_annotators = Table(
     "group_annotators",
     Base.metadata,
-    Column("group_id", Integer, ForeignKey("groups.id")),
-    Column("annotator_id", Integer, ForeignKey("annotators.id")),
+    Column(
+        "group_id", Integer, ForeignKey("groups.id", ondelete="CASCADE"), index=True
+    ),
+    # An annotator belongs to one group at most
+    Column(
+        "annotator_id",
+        Integer,
+        ForeignKey("annotators.id", ondelete="CASCADE"),
+        unique=True,
+        index=True,
+    ),
 )
 
 
@@ -18,8 +27,11 @@ class Groups(Base):
     name: Mapped[str] = mapped_column(String(30), unique=True)
 
     images: Mapped[list["Image"]] = relationship(
-        secondary="image_groups", back_populates="groups"
+        secondary="image_groups", back_populates="groups", passive_deletes=True
     )
     annotators = relationship(
-        "Annotator", secondary="group_annotators", back_populates="groups"
+        "Annotator",
+        secondary="group_annotators",
+        back_populates="groups",
+        passive_deletes=True,
     )
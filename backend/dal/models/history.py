@@ -0,0 +1,43 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import JSON, DateTime, Integer, LargeBinary, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class AnnotationChange(Base):
+    """One change to one annotation; append-only.
+
+    `added` and `removed` are the tag ids the change added and removed,
+    packed as little-endian int32 (see dal.history).
+    """
+
+    __tablename__ = "annotation_changes"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    annotation_id: Mapped[int] = mapped_column(Integer, index=True)
+    image_id: Mapped[Optional[int]] = mapped_column(Integer, index=True)
+    annotator_id: Mapped[int] = mapped_column(Integer)
+    change: Mapped[str] = mapped_column(String(10))
+    operation: Mapped[str] = mapped_column(String(30))
+    actor: Mapped[Optional[str]] = mapped_column(String(50))
+    added: Mapped[bytes] = mapped_column(LargeBinary)
+    removed: Mapped[bytes] = mapped_column(LargeBinary)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, index=True
+    )
+
+
+class AnnotationSnapshot(Base):
+    """Every annotation as of `taken_at`, which includes changes up to `change_id`"""
+
+    __tablename__ = "annotation_snapshots"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    change_id: Mapped[int] = mapped_column(Integer)
+    taken_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+    annotations: Mapped[int] = mapped_column(Integer)
+    tag_names: Mapped[dict] = mapped_column(JSON)
+    data: Mapped[bytes] = mapped_column(LargeBinary)
@@ -1,5 +1,6 @@
-from sqlalchemy import String, Table, Column, ForeignKey, DateTime
+from sqlalchemy import String, Table, Column, ForeignKey, DateTime, Float, Integer, Text
 from datetime import datetime
+from typing import Optional
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .base import Base
 
@@ -7,20 +8,67 @@ from .base import Base
 image_groups = Table(
     "image_groups",
     Base.metadata,
-    Column("image_id", ForeignKey("images.id"), primary_key=True),
-    Column("group_id", ForeignKey("groups.id"), primary_key=True),
+    Column("image_id", ForeignKey("images.id", ondelete="CASCADE"), primary_key=True),
+    Column(
+        "group_id",
+        ForeignKey("groups.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    ),
 )
 
 
 class Image(Base):
     __tablename__ = "images"
+    # Ids of deleted images are never reused, the embedding index is keyed by id
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(255))
-    url: Mapped[str] = mapped_column(String(255))
+    name: Mapped[str] = mapped_column(String(255), index=True)
+    # Imports match existing images by url
+    url: Mapped[str] = mapped_column(String(255), index=True)
     date_added: Mapped[datetime] = mapped_column(DateTime, default=datetime.now())
+    # 64-bit dHash as hex, see core.utils.phash
+    phash: Mapped[Optional[str]] = mapped_column(String(16), index=True)
+    # Read at upload by core.utils.image_meta; width and height as displayed
+    width: Mapped[Optional[int]] = mapped_column(Integer, index=True)
+    height: Mapped[Optional[int]] = mapped_column(Integer, index=True)
+    mime_type: Mapped[Optional[str]] = mapped_column(String(50), index=True)
+    byte_size: Mapped[Optional[int]] = mapped_column(Integer)
+    orientation: Mapped[Optional[int]] = mapped_column(Integer)
+    placeholder: Mapped[Optional[str]] = mapped_column(Text)
+    # Value of one more label, see dal.priority; NULL until first scored
+    priority: Mapped[Optional[float]] = mapped_column(Float, index=True)
 
     groups: Mapped[list["Groups"]] = relationship(  # noqa: F821 # type: ignore
-        secondary=image_groups, back_populates="images"
+        secondary=image_groups, back_populates="images", passive_deletes=True
     )
-    annotations: Mapped[list["Annotation"]] = relationship(back_populates="image")  # type: ignore # noqa: F821
+    # Deleted with the image by ON DELETE CASCADE
+    annotations: Mapped[list["Annotation"]] = relationship(  # type: ignore # noqa: F821
+        back_populates="image", cascade="all, delete", passive_deletes=True
+    )
+
+
+class PriorityCursor(Base):
+    """Last AnnotationChange folded into Image.priority; a single row"""
+
+    __tablename__ = "priority_cursor"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    change_id: Mapped[int] = mapped_column(Integer)
+
+
+# Selected by the image lists next to id, name and url
+IMAGE_META = (
+    Image.width,
+    Image.height,
+    Image.mime_type,
+    Image.byte_size,
+    Image.orientation,
+    Image.placeholder,
+)
+
+
+def meta_of(row) -> dict:
+    """The IMAGE_META values of a selected row"""
+    return {column.key: getattr(row, column.key) for column in IMAGE_META}
@@ -0,0 +1,88 @@
+"""Transactional outbox for annotation changes.
+
+Every change is added to the `outbox` table in the same transaction that
+makes it, so a consumer tailing the table by id sees each committed change
+once and never one that was rolled back. SQLite has a single writer, so ids
+become visible in order and `after=<last id seen>` never skips a row.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from dal.models import Annotation, IdempotencyKey, OutboxEvent
+
+RETENTION = timedelta(days=float(os.getenv("OUTBOX_RETENTION_DAYS", "7")))
+IDEMPOTENCY_TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+PRUNE_INTERVAL = 60
+
+_pruned_at = 0.0
+
+
+def record_annotation(db: Session, annotation: Annotation, change: str):
+    """Queue the full state of an annotation; it needs an id, so flush new ones first"""
+    db.add(
+        OutboxEvent(
+            **annotation_event(
+                change,
+                annotation.id,
+                annotation.image_id,
+                annotation.annotator_id,
+                (tag.name for tag in annotation.tags),
+            )
+        )
+    )
+    _prune(db)
+
+
+def annotation_event(
+    change: str,
+    annotation_id: int,
+    image_id: int,
+    annotator_id: int,
+    tag_names: Iterable[str],
+) -> dict:
+    """Column values of an outbox row, for record_annotation and bulk inserts"""
+    return {
+        "topic": f"annotation.{change}",
+        "payload": {
+            "annotation_id": annotation_id,
+            "image_id": image_id,
+            "annotator_id": annotator_id,
+            "tags": sorted(tag_names),
+        },
+    }
+
+
+def tail(db: Session, after: int, limit: int) -> list[dict]:
+    return [
+        dict(row)
+        for row in db.execute(
+            select(
+                OutboxEvent.id,
+                OutboxEvent.topic,
+                OutboxEvent.payload,
+                OutboxEvent.created_at,
+            )
+            .where(OutboxEvent.id > after)
+            .order_by(OutboxEvent.id)
+            .limit(limit)
+        ).mappings()
+    ]
+
+
+def _prune(db: Session):
+    """Drop expired outbox rows and idempotency keys, at most once a minute"""
+    global _pruned_at
+    if time.monotonic() - _pruned_at < PRUNE_INTERVAL:
+        return
+    _pruned_at = time.monotonic()
+    now = datetime.utcnow()
+    db.execute(delete(OutboxEvent).where(OutboxEvent.created_at < now - RETENTION))
+    db.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.created_at < now - IDEMPOTENCY_TTL)
+    )
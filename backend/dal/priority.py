@@ -0,0 +1,255 @@
+"""Image.priority, kept current from the annotation change log.
+
+A background thread, in one worker at a time, rescores every PRIORITY_INTERVAL
+seconds what the change log and the images table say went stale:
+
+- images whose annotations changed, and their embedding look-alikes, whose
+  suggestion confidence depends on those labels
+- images never scored (new uploads) and their near-duplicates, whose
+  clusters grew
+- near-duplicates of deleted images, whose clusters shrank: forget() leaves
+  them unscored
+
+From backend/:
+    python -m dal.priority --all
+"""
+
+import argparse
+import fcntl
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Callable, Iterable
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from core.utils import ai, embeddings, phash, priority
+from core.utils.cache import bump_versions
+from dal import duplicates
+from dal.models import Annotation, AnnotationChange, Image, PriorityCursor
+from dal.models.annotator import annotation_tags
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+INTERVAL = float(os.getenv("PRIORITY_INTERVAL", "10"))
+# Near-duplicates as listed by /images/{id}/duplicates by default
+DUPLICATE_DISTANCE = 6
+
+
+def _agreement(
+    db: Session, image_ids: Iterable[int]
+) -> tuple[dict[int, int], dict[int, list[float]]]:
+    """Annotators of each image and the share of them that gave each tag"""
+    image_ids = list(image_ids)
+    annotators = dict(
+        db.execute(
+            select(Annotation.image_id, func.count(Annotation.id))
+            .where(Annotation.image_id.in_(image_ids))
+            .group_by(Annotation.image_id)
+        ).all()
+    )
+    shares = defaultdict(list)
+    for image_id, count in db.execute(
+        select(Annotation.image_id, func.count())
+        .join(annotation_tags, annotation_tags.c.annotation_id == Annotation.id)
+        .where(Annotation.image_id.in_(image_ids))
+        .group_by(Annotation.image_id, annotation_tags.c.tag_id)
+    ):
+        shares[image_id].append(count / annotators[image_id])
+    return annotators, shares
+
+
+def _similar(image_id: int) -> list[tuple[int, float]]:
+    """Neighbours similar enough to suggest tags for the image, as searched by
+    ai.local_suggestions"""
+    vector = embeddings.index().vector(image_id)
+    if vector is None:
+        return []
+    return [
+        (neighbour, similarity)
+        for neighbour, similarity in embeddings.index().nearest(
+            vector, ai.LOCAL_NEIGHBOURS * 5, exclude=image_id
+        )
+        if similarity >= ai.LOCAL_MIN_SIMILARITY
+    ]
+
+
+def _confidence(db: Session, image_ids: list[int]) -> dict[int, float]:
+    """Confidence of local suggestions for images with a stored embedding;
+    0 where they would fall back to the model"""
+    if not ai.LOCAL_SUGGESTIONS:
+        return {}
+    similar = {image_id: _similar(image_id) for image_id in image_ids}
+
+    annotators, shares = _agreement(
+        db, {neighbour for pairs in similar.values() for neighbour, _ in pairs}
+    )
+    confidence = {}
+    for image_id, pairs in similar.items():
+        labeled = [(n, similarity) for n, similarity in pairs if n in annotators]
+        # ai.local_suggestions asks the model unless enough neighbours agree
+        if len(labeled) < ai.LOCAL_MIN_AGREEMENT:
+            confidence[image_id] = 0.0
+            continue
+        confidence[image_id] = max(
+            priority.confidence(
+                similarity, max(shares.get(n, [0.0])), ai.LOCAL_MIN_SIMILARITY
+            )
+            for n, similarity in labeled
+        )
+    return confidence
+
+
+def _cluster_size(tree: phash.BKTree, image_id: int) -> int:
+    value = tree.values.get(image_id)
+    return 1 if value is None else len(tree.search(value, DUPLICATE_DISTANCE))
+
+
+def rescore(db: Session, image_ids: Iterable[int]) -> int:
+    """Score these images, BATCH_SIZE per commit; returns how many still exist"""
+    image_ids = sorted(set(image_ids))
+    if not image_ids:
+        return 0
+    # Cached until the images table changes
+    tree = duplicates.duplicate_tree(db)
+    scored = 0
+    for start in range(0, len(image_ids), BATCH_SIZE):
+        batch = db.scalars(
+            select(Image.id).where(Image.id.in_(image_ids[start : start + BATCH_SIZE]))
+        ).all()
+        annotators, shares = _agreement(db, batch)
+        confidence = _confidence(db, batch)
+        rows = [
+            {
+                "id": image_id,
+                "priority": priority.score(
+                    annotators.get(image_id, 0),
+                    shares.get(image_id, []),
+                    confidence.get(image_id, 0.0),
+                    _cluster_size(tree, image_id),
+                ),
+            }
+            for image_id in batch
+        ]
+        if rows:
+            db.execute(update(Image), rows)
+            db.commit()
+            scored += len(rows)
+    return scored
+
+
+def refresh(db: Session) -> int:
+    """Rescore what changed since the last refresh; one worker at a time"""
+    with open("paladium.db.priority.lock", "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0  # another worker is on it
+
+        cursor = db.get(PriorityCursor, 1)
+        after = cursor.change_id if cursor else 0
+        latest = db.scalar(select(func.max(AnnotationChange.id))) or 0
+        changed = set(
+            db.scalars(
+                select(AnnotationChange.image_id)
+                .where(
+                    AnnotationChange.id > after,
+                    AnnotationChange.id <= latest,
+                    AnnotationChange.image_id.is_not(None),
+                )
+                .distinct()
+            )
+        )
+        unscored = db.scalars(select(Image.id).where(Image.priority.is_(None))).all()
+        if latest == after and not unscored:
+            return 0  # the usual idle tick, nothing written
+        if ai.LOCAL_SUGGESTIONS:
+            # Similarity is symmetric: the images a relabeled one may suggest
+            # tags for are its own neighbours
+            changed.update(
+                neighbour
+                for image_id in list(changed)
+                for neighbour, _ in _similar(image_id)
+            )
+        if unscored:
+            tree = duplicates.duplicate_tree(db)
+            for image_id in unscored:
+                value = tree.values.get(image_id)
+                if value is not None:
+                    changed.update(
+                        duplicate
+                        for duplicate, _ in tree.search(value, DUPLICATE_DISTANCE)
+                    )
+
+        scored = rescore(db, changed.union(unscored))
+        db.merge(PriorityCursor(id=1, change_id=latest))
+        db.commit()
+    if scored:
+        bump_versions("image_priority")
+    return scored
+
+
+def forget(db: Session, image_id: int):
+    """Before deleting an image, leave its near-duplicates unscored for the
+    next refresh: their cluster shrinks"""
+    tree = duplicates.duplicate_tree(db)
+    value = tree.values.get(image_id)
+    if value is None:
+        return
+    others = [
+        duplicate
+        for duplicate, _ in tree.search(value, DUPLICATE_DISTANCE)
+        if duplicate != image_id
+    ]
+    if others:
+        db.execute(update(Image).where(Image.id.in_(others)).values(priority=None))
+
+
+_stop = threading.Event()
+
+
+def start_scoring(session_factory: Callable[[], Session]):
+    """Refresh priorities in the background every INTERVAL seconds"""
+
+    def run():
+        while not _stop.wait(INTERVAL):
+            try:
+                with session_factory() as db:
+                    scored = refresh(db)
+                if scored:
+                    logger.info("Rescored the priority of %s images", scored)
+            except Exception as e:
+                logger.warning("Priority refresh failed: %s", e)
+
+    _stop.clear()
+    threading.Thread(target=run, name="priority-scoring", daemon=True).start()
+
+
+def stop_scoring():
+    _stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score images for labeling")
+    parser.add_argument(
+        "--all", action="store_true", help="rescore every image, not only changed"
+    )
+    args = parser.parse_args()
+
+    from dal import migrate
+    from dal.setup import ENGINE, setup_db
+
+    migrate.check(ENGINE)
+
+    with setup_db() as db:
+        scored = rescore(db, db.scalars(select(Image.id))) if args.all else 0
+        scored += refresh(db)
+    bump_versions("image_priority")
+    print(f"Scored {scored} images")
+
+
+if __name__ == "__main__":
+    main()
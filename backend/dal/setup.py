@@ -1,12 +1,29 @@
+import importlib
+import threading
+
 from fastapi.concurrency import asynccontextmanager
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, select
 from sqlalchemy.orm import sessionmaker
 
-from dal.models import Base
+from core.utils import embeddings, lifecycle
+from core.utils.events import bus
+from dal import analytics, duplicates, history, migrate, priority
+from dal.models import Image
 
 ENGINE = create_engine("sqlite:///paladium.db")
 
 
+@event.listens_for(ENGINE, "connect")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run while another worker writes; writers wait instead of failing
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    # Off by default in SQLite; deletes cascade through the ON DELETE rules
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
 def setup_db():
     global ENGINE
     Session = sessionmaker(bind=ENGINE)
@@ -21,9 +38,31 @@ def get_db():
         db.close()
 
 
+def _warm_up():
+    """Off the startup path: modules imported on first use, and hashes and
+    embeddings of images stored while the pool was down or before they existed"""
+    for module in ("openai", "passlib.context", "jose.jwt", "pyarrow.parquet"):
+        importlib.import_module(module)
+    if embeddings.claim_backfill():
+        with setup_db() as db:
+            duplicates.backfill_hashes(db)
+            embeddings.schedule(db.execute(select(Image.id, Image.url)).all())
+
+
 @asynccontextmanager
 async def lifespan(app):
     global ENGINE
-    Base.metadata.create_all(bind=ENGINE)
+    migrate.check(ENGINE)
+    threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+    lifecycle.install_drain_handlers()
+    bus.start()
+    history.start_snapshots(setup_db)
+    analytics.start_snapshots(setup_db)
+    priority.start_scoring(setup_db)
     yield
-    pass
+    lifecycle.start_draining()
+    history.stop_snapshots()
+    analytics.stop_snapshots()
+    priority.stop_scoring()
+    embeddings.shutdown()
+    ENGINE.dispose()
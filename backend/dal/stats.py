@@ -0,0 +1,157 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import and_, distinct, func, select
+from sqlalchemy.orm import Session
+
+from dal.models import Annotation, Annotator, Groups, Tags, image_groups
+from dal.models.annotator import annotation_tags
+from dal.models.groups import group_annotators
+
+
+# Shorter spans are stretched to this, so a burst of labels right after
+# someone starts does not extrapolate to thousands per hour
+MIN_RATE_HOURS = 1.0
+
+
+def _labels_per_hour(
+    count: int, first: Optional[datetime], last: Optional[datetime]
+) -> Optional[float]:
+    """Throughput between the first and the last label, over at least
+    MIN_RATE_HOURS; None when undefined"""
+    if count < 2 or not first or not last:
+        return None
+    hours = max((last - first).total_seconds() / 3600, MIN_RATE_HOURS)
+    return round(count / hours, 2)
+
+
+def _percentage(done: int, total: int) -> float:
+    return round(done / total * 100, 2) if total > 0 else 0
+
+
+def group_stats(db: Session) -> list[dict]:
+    """Progress of every group in a single grouped query.
+
+    The expected work of a group is every (image, member) pair, so only
+    annotations made by members on images of the group are counted.
+    """
+    rows = db.execute(
+        select(
+            Groups.id,
+            Groups.name,
+            func.count(distinct(image_groups.c.image_id)),
+            func.count(distinct(group_annotators.c.annotator_id)),
+            func.count(distinct(Annotation.id)),
+            func.min(Annotation.created_at),
+            func.max(Annotation.created_at),
+        )
+        .select_from(Groups)
+        .outerjoin(image_groups, image_groups.c.group_id == Groups.id)
+        .outerjoin(group_annotators, group_annotators.c.group_id == Groups.id)
+        .outerjoin(
+            Annotation,
+            and_(
+                Annotation.image_id == image_groups.c.image_id,
+                Annotation.annotator_id == group_annotators.c.annotator_id,
+            ),
+        )
+        .group_by(Groups.id)
+        .order_by(Groups.id)
+    ).all()
+
+    result = []
+    for group_id, name, images, members, done, first, last in rows:
+        expected = images * members
+        result.append(
+            {
+                "group_id": group_id,
+                "name": name,
+                "total_images": images,
+                "total_annotators": members,
+                "expected_labels": expected,
+                "completed_labels": done,
+                "remaining_labels": expected - done,
+                "progress_percentage": _percentage(done, expected),
+                "labels_per_hour": _labels_per_hour(done, first, last),
+            }
+        )
+    return result
+
+
+def annotator_stats(db: Session, annotator_id: Optional[int] = None) -> list[dict]:
+    """Progress of every annotator (or a single one) in a single grouped query.
+
+    Only annotations on images reachable through the annotator's groups are
+    counted, so labels left on images of a former group do not inflate progress.
+    """
+    query = (
+        select(
+            Annotator.id,
+            Annotator.name,
+            func.count(distinct(image_groups.c.image_id)),
+            func.count(distinct(Annotation.id)),
+            func.min(Annotation.created_at),
+            func.max(Annotation.created_at),
+        )
+        .select_from(Annotator)
+        .outerjoin(group_annotators, group_annotators.c.annotator_id == Annotator.id)
+        .outerjoin(image_groups, image_groups.c.group_id == group_annotators.c.group_id)
+        .outerjoin(
+            Annotation,
+            and_(
+                Annotation.image_id == image_groups.c.image_id,
+                Annotation.annotator_id == Annotator.id,
+            ),
+        )
+        .group_by(Annotator.id)
+        .order_by(Annotator.id)
+    )
+    if annotator_id is not None:
+        query = query.where(Annotator.id == annotator_id)
+
+    result = []
+    for row_id, name, total, done, first, last in db.execute(query).all():
+        result.append(
+            {
+                "annotator_id": row_id,
+                "name": name,
+                "total_images": total,
+                "classified_images": done,
+                "remaining_images": total - done,
+                "progress_percentage": _percentage(done, total),
+                "labels_per_hour": _labels_per_hour(done, first, last),
+            }
+        )
+    return result
+
+
+def image_tag_stats(db: Session, image_id: int) -> dict:
+    """Tag distribution of one image, the delta pushed after every tag change"""
+    annotators = db.scalar(
+        select(func.count(Annotation.id)).where(Annotation.image_id == image_id)
+    )
+    rows = db.execute(
+        select(Tags.id, Tags.name, func.count())
+        .select_from(Annotation)
+        .join(annotation_tags, annotation_tags.c.annotation_id == Annotation.id)
+        .join(Tags, Tags.id == annotation_tags.c.tag_id)
+        .where(Annotation.image_id == image_id)
+        .group_by(Tags.id)
+        .order_by(func.count().desc())
+    ).all()
+
+    tags = [
+        {
+            "id": tag_id,
+            "name": name,
+            "count": count,
+            "percentage": round(count / annotators * 100) if annotators > 0 else 0,
+        }
+        for tag_id, name, count in rows
+    ]
+    return {
+        "image_id": image_id,
+        "total_annotators": annotators,
+        "tags": tags,
+        "low_agreement": annotators > 1 and any(t["percentage"] < 80 for t in tags),
+    }
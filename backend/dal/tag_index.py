@@ -0,0 +1,103 @@
+import threading
+from typing import Iterable, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from core.utils.cache import table_versions
+from core.utils.tag_query import TagImageIndex, evaluate
+from dal.models import Annotation, Image, Tags, image_groups
+from dal.models.annotator import annotation_tags
+
+TABLES = ["tags", "annotation_tags"]
+
+_lock = threading.Lock()
+_index: Optional[TagImageIndex] = None
+_version: Optional[list[int]] = None
+_universe: tuple[Optional[list[int]], np.ndarray] = (None, np.zeros(0, dtype=bool))
+
+
+def _build(db: Session) -> TagImageIndex:
+    names = dict(db.execute(select(Tags.id, Tags.name)).all())
+    rows = db.execute(
+        select(annotation_tags.c.tag_id, Annotation.image_id, func.count())
+        .join(Annotation, Annotation.id == annotation_tags.c.annotation_id)
+        .group_by(annotation_tags.c.tag_id, Annotation.image_id)
+    )
+    return TagImageIndex((names[tag_id], image_id, count) for tag_id, image_id, count in rows)
+
+
+def _current(db: Session) -> TagImageIndex:
+    """The index, rebuilt when tag data changed outside of index_image()"""
+    global _index, _version
+    version = table_versions(TABLES)
+    if _index is None or version != _version:
+        _index = _build(db)
+        _version = version
+    return _index
+
+
+def _existing_images(db: Session, size: int) -> np.ndarray:
+    global _universe
+    version = table_versions(["images"])
+    if _universe[0] != version or len(_universe[1]) < size:
+        ids = np.fromiter(db.scalars(select(Image.id)), dtype=np.int64)
+        mask = np.zeros(max(size, int(ids.max(initial=0)) + 1), dtype=bool)
+        mask[ids] = True
+        _universe = (version, mask)
+    return _universe[1]
+
+
+def search(
+    db: Session, expression: str, min_agreement: int = 1, group_id: Optional[int] = None
+) -> np.ndarray:
+    """Ids of the images matching a tag expression, ascending"""
+    with _lock:
+        index = _current(db)
+        universe = _existing_images(db, index.size)
+        if group_id is not None:
+            scope = np.zeros(len(universe), dtype=bool)
+            ids = np.fromiter(
+                db.scalars(
+                    select(image_groups.c.image_id).where(
+                        image_groups.c.group_id == group_id
+                    )
+                ),
+                dtype=np.int64,
+            )
+            scope[ids[ids < len(scope)]] = True
+            universe = universe & scope
+        return np.flatnonzero(evaluate(expression, index, universe, min_agreement))
+
+
+def index_image(db: Session, image_id: int, tags: Iterable[str]):
+    """Apply a committed change of `tags` on one image to the index.
+
+    Call after bump_versions(), the index then adopts the new version
+    instead of rebuilding on the next search.
+    """
+    global _version
+    tags = set(tags)
+    with _lock:
+        if _index is None or not tags:
+            return
+        counts = dict(
+            db.execute(
+                select(Tags.name, func.count())
+                .select_from(Annotation)
+                .join(annotation_tags, annotation_tags.c.annotation_id == Annotation.id)
+                .join(Tags, Tags.id == annotation_tags.c.tag_id)
+                .where(Annotation.image_id == image_id, Tags.name.in_(tags))
+                .group_by(Tags.name)
+            ).all()
+        )
+        for tag in tags:
+            _index.set(tag, image_id, counts.get(tag, 0))
+        # Adopt the new version only if no other write (maybe in another
+        # worker) slipped in, otherwise the next search rebuilds
+        version = table_versions(TABLES)
+        if _version is not None and all(
+            new - old <= 1 for new, old in zip(version, _version)
+        ):
+            _version = version
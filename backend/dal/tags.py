@@ -0,0 +1,58 @@
+import itertools
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from dal.models import Tags
+
+
+def get_or_create_tags(db: Session, names: list[str]) -> tuple[list[Tags], bool]:
+    """Tags for `names` in order, without duplicates, and whether any was missing.
+
+    Missing names are inserted with ON CONFLICT DO NOTHING, so two requests
+    creating the same new tag both succeed instead of one failing on the
+    unique constraint.
+    """
+    wanted = list(dict.fromkeys(name.strip().lower() for name in names))
+    if not wanted:
+        return [], False
+
+    found = {
+        tag.name: tag for tag in db.scalars(select(Tags).where(Tags.name.in_(wanted)))
+    }
+    missing = [name for name in wanted if name not in found]
+    if missing:
+        db.execute(
+            insert(Tags).on_conflict_do_nothing(index_elements=["name"]),
+            [{"name": name} for name in missing],
+        )
+        created = db.scalars(select(Tags).where(Tags.name.in_(missing)))
+        found.update((tag.name, tag) for tag in created)
+    return [found[name] for name in wanted], bool(missing)
+
+
+def tag_ids(db: Session, names: set[str]) -> tuple[dict[str, int], int]:
+    """Ids of already normalised tag names, creating missing ones in bulk.
+
+    Like get_or_create_tags, without loading ORM objects; also returns how
+    many tags were created.
+    """
+    found: dict[str, int] = {}
+    iterator = iter(names)
+    while chunk := list(itertools.islice(iterator, 500)):
+        found.update(
+            db.execute(select(Tags.name, Tags.id).where(Tags.name.in_(chunk))).all()
+        )
+    missing = [name for name in names if name not in found]
+    if missing:
+        db.execute(
+            insert(Tags).on_conflict_do_nothing(index_elements=["name"]),
+            [{"name": name} for name in missing],
+        )
+        for start in range(0, len(missing), 500):
+            chunk = missing[start : start + 500]
+            found.update(
+                db.execute(select(Tags.name, Tags.id).where(Tags.name.in_(chunk))).all()
+            )
+    return found, len(missing)
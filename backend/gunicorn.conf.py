@@ -0,0 +1,29 @@
+"""Production entry point: N Uvicorn workers under Gunicorn.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Workers do not share memory, so unless configured otherwise they share
+cache versions and SSE events through a SQLite file next to the database.
+Point CACHE_BACKEND_URL at Redis when workers span several hosts.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# The app is imported in every worker after the fork: each one gets its own
+# ENGINE, thread pools and embedding process pool
+preload_app = False
+
+# Seconds a worker gets to finish in-flight requests on SIGTERM
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+keepalive = 5
+
+accesslog = "-"
+
+os.environ.setdefault("CACHE_BACKEND_URL", "sqlite:///paladium-bus.db")
+os.environ.setdefault("EVENT_BUS_URL", "sqlite:///paladium-bus.db")
@@ -1,22 +1,40 @@
 import os
-from pathlib import Path
 
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from sqlalchemy import text
 from fastapi.middleware.cors import CORSMiddleware
 
 
-from dal.setup import lifespan
-from routers import annotations, annotators, auth, groups, images
-
+from core.middleware.admission import AdmissionMiddleware
+from core.middleware.cache import ResponseCacheMiddleware
+from core.middleware.metrics import MetricsMiddleware, instrument_engine, render_metrics
+from core.utils import lifecycle
+from core.utils.storage import storage
+from dal.setup import ENGINE, lifespan
+from routers import (
+    analytics,
+    annotations,
+    annotators,
+    auth,
+    events,
+    groups,
+    images,
+    imports,
+    stats,
+    tags,
+    uploads,
+)
 
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+instrument_engine(ENGINE)
 
+# Inside the response cache: cache hits cost nothing and are never limited
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(ResponseCacheMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[os.getenv("FRONTEND_URL")],
@@ -33,8 +51,41 @@ def read_root():
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health", include_in_schema=False)
+def health():
+    """Liveness: the process is up and serving requests"""
+    return {"ok": True}
+
+
+@app.get("/ready", include_in_schema=False)
+def ready():
+    """Readiness: fails while draining or when the database or storage is unreachable"""
+    if lifecycle.draining():
+        return ORJSONResponse({"ok": False, "reason": "draining"}, status_code=503)
+    try:
+        with ENGINE.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        return ORJSONResponse({"ok": False, "reason": str(e)}, status_code=503)
+    problem = storage.problem()
+    if problem:
+        return ORJSONResponse({"ok": False, "reason": problem}, status_code=503)
+    return {"ok": True}
+
+
 app.include_router(images.router, prefix="/images", tags=["images"])
 app.include_router(groups.router, prefix="/groups", tags=["groups"])
 app.include_router(annotators.router, prefix="/annotators", tags=["annotators"])
 app.include_router(annotations.router, prefix="/annotations", tags=["annotations"])
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
+app.include_router(stats.router, prefix="/stats", tags=["stats"])
+app.include_router(tags.router, prefix="/tags", tags=["tags"])
+app.include_router(events.router, prefix="/events", tags=["events"])
+app.include_router(uploads.router, prefix="/uploads", tags=["uploads"])
+app.include_router(imports.router, prefix="/imports", tags=["imports"])
+app.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
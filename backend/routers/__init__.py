@@ -1 +1 @@
-from . import annotators, images, groups, annotations  # noqa: F401
+from . import annotators, images, groups, annotations, stats, events, tags, uploads, imports, analytics  # noqa: F401
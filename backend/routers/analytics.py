@@ -0,0 +1,128 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from core.middleware.metrics import ProfiledRoute
+from core.schemas.api import (
+    AnalyticsSnapshot,
+    LabelRate,
+    TagCooccurrence,
+    TagHistogram,
+)
+from dal import analytics
+from dal.setup import get_db
+
+router = APIRouter(route_class=ProfiledRoute)
+
+
+class Filters:
+    """Annotations of one group or annotator, created in [since, until)"""
+
+    def __init__(
+        self,
+        group_id: Optional[int] = None,
+        annotator_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ):
+        self.group_id = group_id
+        self.annotator_id = annotator_id
+        self.since = since
+        self.until = until
+
+    def mask(self, facts: analytics.Facts) -> np.ndarray:
+        return facts.mask(self.group_id, self.annotator_id, self.since, self.until)
+
+
+def _current(db: Session) -> analytics.Facts:
+    try:
+        return analytics.current(db)
+    except analytics.SnapshotPending:
+        raise HTTPException(
+            503,
+            "The first analytics snapshot is still being written",
+            headers={"Retry-After": "10"},
+        )
+
+
+def _snapshot_info(facts: analytics.Facts) -> dict:
+    return {
+        "change_id": facts.change_id,
+        "taken_at": facts.taken_at,
+        "annotations": facts.annotations,
+        "rows": len(facts.tag_ids),
+    }
+
+
+@router.get("/snapshot", response_model=AnalyticsSnapshot)
+def get_snapshot(db: Session = Depends(get_db)):
+    """The columnar snapshot analytics are answered from"""
+    return _snapshot_info(_current(db))
+
+
+@router.post("/snapshot", response_model=AnalyticsSnapshot)
+def take_snapshot(db: Session = Depends(get_db)):
+    """Export a fresh snapshot now instead of waiting for the background job"""
+    if analytics.snapshot_if_due(db, force=True) is None:
+        raise HTTPException(409, "A snapshot is already being written")
+    return _snapshot_info(_current(db))
+
+
+@router.get("/tags", response_model=TagHistogram)
+def get_tag_histogram(
+    limit: int = Query(50, ge=1, le=10_000),
+    filters: Filters = Depends(),
+    db: Session = Depends(get_db),
+):
+    """Most used tags and the share of annotations carrying each"""
+    facts = _current(db)
+    mask = filters.mask(facts)
+    return {
+        "snapshot_at": facts.taken_at,
+        "annotations": int((facts.first & mask).sum()),
+        "tags": analytics.tag_histogram(facts, mask, limit),
+    }
+
+
+@router.get("/cooccurrence", response_model=TagCooccurrence)
+def get_cooccurrence(
+    tags: Optional[list[str]] = Query(None),
+    top: int = Query(20, ge=1, le=200),
+    filters: Filters = Depends(),
+    db: Session = Depends(get_db),
+):
+    """How many annotations carry both tags, for `tags` or the `top` most used"""
+    facts = _current(db)
+    mask = filters.mask(facts)
+    if tags:
+        ids_by_name = {name: tag_id for tag_id, name in facts.tag_names.items()}
+        wanted = list(dict.fromkeys(t.strip().lower() for t in tags))
+        unknown = [name for name in wanted if name not in ids_by_name]
+        if unknown:
+            raise HTTPException(404, f"Unknown tags: {', '.join(unknown)}")
+        tag_ids = np.array([ids_by_name[name] for name in wanted], dtype=np.int64)
+    else:
+        tag_ids = analytics.top_tags(facts, mask, top)
+    return {
+        "snapshot_at": facts.taken_at,
+        "tags": [facts.tag_names[int(tag_id)] for tag_id in tag_ids],
+        "counts": analytics.cooccurrence(facts, mask, tag_ids).tolist(),
+    }
+
+
+@router.get("/label-rate", response_model=LabelRate)
+def get_label_rate(
+    bucket: Literal["hour", "day", "week"] = "day",
+    filters: Filters = Depends(),
+    db: Session = Depends(get_db),
+):
+    """Annotations created per annotator in each hour, day or week (UTC)"""
+    facts = _current(db)
+    return {
+        "snapshot_at": facts.taken_at,
+        "bucket": bucket,
+        "annotators": analytics.label_rate(facts, filters.mask(facts), bucket),
+    }
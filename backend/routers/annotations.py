@@ -1,27 +1,67 @@
-import base64
-from fastapi import APIRouter, HTTPException, Depends
+import logging
+from collections import defaultdict
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-
-
-from datetime import datetime
-from core.schemas.api import AITagSuggestion, AnnotationCreate, ImageResponse
+from sqlalchemy import select
+import numpy as np
+
+
+from datetime import datetime, timezone
+from core.middleware.metrics import ProfiledRoute, track_ai
+from core.schemas.api import (
+    AITagSuggestion,
+    AnnotationCreate,
+    AnnotationList,
+    AnnotationChangeEntry,
+    AnnotationsAsOf,
+    ImageResponse,
+    OutboxPage,
+    SnapshotInfo,
+)
+from core.utils import ai
+from core.utils.auth import request_actor
+from core.utils.cache import bump_versions
+from core.utils.events import bus, sse
 from dal.models.groups import Groups
-from openai import OpenAI
 
-from dal.models import Annotator, Annotation, Image, Tags
+from dal import history, idempotency, loading, outbox, tag_index
+from dal.models import Annotator, Annotation, IdempotencyKey, Image, Tags
+from dal.models.annotator import annotation_tags
+from dal.models.image import IMAGE_META, meta_of
 from dal.setup import get_db
+from dal.stats import annotator_stats, image_tag_stats
+from dal.tags import get_or_create_tags
 
+logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 
 # Annotation Endpoints
 @router.post("/{annotator_id}", tags=["annotations"])
 def create_annotation(
-    annotator_id: int, annotation_data: AnnotationCreate, db: Session = Depends(get_db)
+    annotator_id: int,
+    annotation_data: AnnotationCreate,
+    idempotency_key: Optional[str] = Header(None),
+    actor: Optional[str] = Depends(request_actor),
+    db: Session = Depends(get_db),
 ):
-    """Create or update an annotation for an image"""
+    """Create or update an annotation for an image.
+
+    A request repeated with the same `Idempotency-Key` header is answered
+    with the stored result of the first one instead of being applied again.
+    """
+    scope = f"annotations:{annotator_id}"
+    request_fingerprint = idempotency.fingerprint(annotation_data.model_dump())
+    if idempotency_key:
+        stored = idempotency.lookup(db, scope, idempotency_key)
+        if stored is not None:
+            return _replay(stored, request_fingerprint)
+
     # Verify annotator exists
     annotator = db.query(Annotator).filter(Annotator.id == annotator_id).first()
     if not annotator:
@@ -35,6 +75,7 @@ def create_annotation(
     # Check if annotation already exists for this annotator and image
     existing_annotation = (
         db.query(Annotation)
+        .options(*loading.ANNOTATION_TAGS)
         .filter(
             Annotation.annotator_id == annotator_id,
             Annotation.image_id == annotation_data.image_id,
@@ -42,68 +83,230 @@ def create_annotation(
         .first()
     )
 
-    # Get or create tags
-    tag_objects = []
-    for tag_name in annotation_data.tag_names:
-        tag = db.query(Tags).filter(Tags.name == tag_name.strip().lower()).first()
-        if not tag:
-            tag = Tags(name=tag_name.strip().lower())
-            db.add(tag)
-        tag_objects.append(tag)
+    tag_objects, tags_created = get_or_create_tags(db, annotation_data.tag_names)
+    # Only new tag names invalidate what is built from the tags table
+    changed = ("tags",) if tags_created else ()
 
+    touched = {tag.name for tag in tag_objects}
     if existing_annotation:
+        touched.update(tag.name for tag in existing_annotation.tags)
         # Update existing annotation
         existing_annotation.tags = tag_objects
         existing_annotation.updated_at = datetime.now()
-        db.commit()
-        return {
+        annotation = existing_annotation
+        result = {
             "ok": True,
             "message": "Annotation updated",
             "annotation_id": existing_annotation.id,
         }
     else:
         # Create new annotation
-        new_annotation = Annotation(
+        annotation = Annotation(
             image_id=annotation_data.image_id,
             annotator_id=annotator_id,
         )
-        new_annotation.tags = tag_objects
-        db.add(new_annotation)
-        db.commit()
-        db.refresh(new_annotation)
-
-        return {
+        annotation.tags = tag_objects
+        db.add(annotation)
+        db.flush()
+        result = {
             "ok": True,
             "message": "Annotation created",
-            "annotation_id": new_annotation.id,
+            "annotation_id": annotation.id,
         }
 
+    change = "updated" if existing_annotation else "created"
+    history.record(db, annotation, change, "annotate", actor)
+    if idempotency_key:
+        idempotency.remember(db, scope, idempotency_key, request_fingerprint, result)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent retry with the same key committed first
+        db.rollback()
+        if not idempotency_key:
+            raise
+        stored = idempotency.lookup(db, scope, idempotency_key)
+        if stored is None:
+            raise
+        return _replay(stored, request_fingerprint)
+
+    bump_versions(*changed, "annotations", "annotation_tags")
+    tag_index.index_image(db, annotation_data.image_id, touched)
+    _publish_annotation(
+        db, annotator_id, annotation_data.image_id, created=change == "created"
+    )
+    return result
+
 
-@router.get("/", tags=["annotations"])
-def get_all_annotations(db: Session = Depends(get_db)):
-    """Get all annotations with their associated data"""
-    annotations = db.query(Annotation).all()
+def _replay(stored: IdempotencyKey, request_fingerprint: str) -> JSONResponse:
+    if stored.fingerprint != request_fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for another request",
+        )
+    return JSONResponse(stored.response, headers={"Idempotent-Replayed": "true"})
 
-    result = []
-    for annotation in annotations:
-        result.append(
+
+@router.get("/outbox", response_model=OutboxPage, tags=["annotations"])
+def get_outbox(after: int = 0, limit: int = 500, db: Session = Depends(get_db)):
+    """Annotation changes committed after the event id `after`, oldest first.
+
+    Consumers keep the `next_after` of each page and pass it back to read
+    only what changed since, instead of rescanning the annotations.
+    """
+    if not 1 <= limit <= 5000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 5000")
+
+    events = outbox.tail(db, after, limit)
+    return {"events": events, "next_after": events[-1]["id"] if events else after}
+
+
+@router.get(
+    "/history", response_model=list[AnnotationChangeEntry], tags=["annotations"]
+)
+def get_annotation_history(
+    annotation_id: Optional[int] = None,
+    image_id: Optional[int] = None,
+    annotator_id: Optional[int] = None,
+    after: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+):
+    """Who changed which tags on which annotation, oldest first"""
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+
+    return history.changes(db, annotation_id, image_id, annotator_id, after, limit)
+
+
+@router.post("/history/snapshots", response_model=SnapshotInfo, tags=["annotations"])
+def create_history_snapshot(db: Session = Depends(get_db)):
+    """Snapshot the current annotations now instead of waiting for the next one"""
+    snapshot = history.snapshot_if_due(db, force=True)
+    if snapshot is None:
+        raise HTTPException(status_code=409, detail="A snapshot is already being taken")
+    return {
+        "id": snapshot.id,
+        "change_id": snapshot.change_id,
+        "taken_at": snapshot.taken_at,
+        "annotations": snapshot.annotations,
+    }
+
+
+@router.get("/as-of", response_model=AnnotationsAsOf, tags=["annotations"])
+def get_annotations_as_of(
+    at: datetime,
+    image_id: Optional[int] = None,
+    annotator_id: Optional[int] = None,
+    limit: int = 500,
+    offset: int = 0,
+    db: Session = Depends(get_db),
+):
+    """Annotations as they were at `at` (UTC), optionally of one image or annotator.
+
+    Paginated in annotation id order; `total` counts every match.
+    """
+    if not 1 <= limit <= 5000 or offset < 0:
+        raise HTTPException(
+            status_code=400, detail="limit must be between 1 and 5000, offset positive"
+        )
+    at = at.astimezone(timezone.utc).replace(tzinfo=None) if at.tzinfo else at
+    state = history.state_as_of(db, at)
+    if state is None:
+        first = history.first_snapshot_at(db)
+        detail = f"History starts at {first.isoformat()}" if first else "No history yet"
+        raise HTTPException(status_code=404, detail=detail)
+
+    selected = np.ones(len(state), dtype=bool)
+    if image_id is not None:
+        selected &= state.image_ids == image_id
+    if annotator_id is not None:
+        selected &= state.annotator_ids == annotator_id
+    positions = np.flatnonzero(selected)
+    page = positions[offset : offset + limit]
+
+    names = history.tag_names(
+        db,
+        np.unique(
+            np.concatenate(
+                [state.tags(p) for p in page] or [np.empty(0, dtype=np.int32)]
+            )
+        ),
+    )
+    return {
+        "as_of": at,
+        "total": len(positions),
+        "annotations": [
             {
-                "annotation_id": annotation.id,
-                "image_id": annotation.image_id,
-                "annotator_id": annotation.annotator_id,
-                "annotator_name": annotation.annotator.name
-                if annotation.annotator
-                else None,
-                "image_path": annotation.image.url if annotation.image else None,
-                "tags": [tag.name for tag in annotation.tags],
-                "created_at": annotation.created_at.isoformat()
-                if annotation.created_at
-                else None,
-                "updated_at": annotation.updated_at.isoformat()
-                if annotation.updated_at
-                else None,
+                "annotation_id": int(state.ids[p]),
+                "image_id": int(state.image_ids[p]),
+                "annotator_id": int(state.annotator_ids[p]),
+                "tags": sorted(names.get(int(t), f"#{t}") for t in state.tags(p)),
             }
+            for p in page
+        ],
+    }
+
+
+def _publish_annotation(db: Session, annotator_id: int, image_id: int, created: bool):
+    """Push the tag distribution of the image and, for new labels, progress"""
+    if not bus.active:
+        return
+    bus.publish("image.tags", **image_tag_stats(db, image_id))
+    if created:
+        stats = annotator_stats(db, annotator_id)
+        if stats:
+            bus.publish("annotation.progress", image_id=image_id, **stats[0])
+
+
+@router.get("/", response_model=AnnotationList, tags=["annotations"])
+def get_all_annotations(db: Session = Depends(get_db)):
+    """Get all annotations with their associated data"""
+    # Plain tuples, no ORM objects: this endpoint exports the whole dataset
+    tags_by_annotation = defaultdict(list)
+    for annotation_id, tag_name in db.execute(
+        select(annotation_tags.c.annotation_id, Tags.name).join(
+            Tags, Tags.id == annotation_tags.c.tag_id
+        )
+    ):
+        tags_by_annotation[annotation_id].append(tag_name)
+
+    rows = db.execute(
+        select(
+            Annotation.id,
+            Annotation.image_id,
+            Annotation.annotator_id,
+            Annotator.name,
+            Image.url,
+            Annotation.created_at,
+            Annotation.updated_at,
         )
+        .outerjoin(Annotator, Annotator.id == Annotation.annotator_id)
+        .outerjoin(Image, Image.id == Annotation.image_id)
+        .order_by(Annotation.id)
+    )
+
+    result = [
+        {
+            "annotation_id": annotation_id,
+            "image_id": image_id,
+            "annotator_id": annotator_id,
+            "annotator_name": annotator_name,
+            "image_path": image_path,
+            "tags": tags_by_annotation.get(annotation_id, []),
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+        for (
+            annotation_id,
+            image_id,
+            annotator_id,
+            annotator_name,
+            image_path,
+            created_at,
+            updated_at,
+        ) in rows
+    ]
 
     return {"ok": True, "total": len(result), "annotations": result}
 
@@ -112,29 +315,43 @@ def get_all_annotations(db: Session = Depends(get_db)):
     "/images/{annotator_id}", response_model=list[ImageResponse], tags=["annotations"]
 )
 def get_images_for_annotator(annotator_id: int, db: Session = Depends(get_db)):
-    """Get all images with their classification status for a specific annotator"""
+    """Get all images with their classification status for a specific annotator.
+
+    Images the annotator has not classified come first, then by priority: the
+    most uncertain, least labeled images first.
+    """
     # Verify annotator exists
     annotator = db.query(Annotator).filter(Annotator.id == annotator_id).first()
     if not annotator:
         raise HTTPException(status_code=404, detail="Annotator not found")
 
     # Get all images
-    images = (
-        db.query(Image)
-        .filter(Image.groups.any(Groups.annotators.any(Annotator.id == annotator.id)))
-        .all()
-    )
+    images = db.execute(
+        select(
+            Image.id,
+            Image.name,
+            Image.url,
+            Image.date_added,
+            Image.priority,
+            *IMAGE_META,
+        )
+        .where(Image.groups.any(Groups.annotators.any(Annotator.id == annotator.id)))
+        # Images uploaded since the last scoring pass are unlabeled, so first too
+        .order_by(Image.priority.desc().nulls_first(), Image.id)
+    ).all()
+
+    # Every annotation of this annotator, with its tags, in one round trip
+    annotations = {
+        annotation.image_id: annotation
+        for annotation in db.query(Annotation)
+        .options(*loading.ANNOTATION_TAGS)
+        .filter(Annotation.annotator_id == annotator_id)
+    }
 
     result = []
     for image in images:
         # Check if this annotator has classified this image
-        annotation = (
-            db.query(Annotation)
-            .filter(
-                Annotation.image_id == image.id, Annotation.annotator_id == annotator_id
-            )
-            .first()
-        )
+        annotation = annotations.get(image.id)
 
         is_classified = annotation is not None
         classified_at = annotation.created_at if annotation else None
@@ -151,100 +368,118 @@ def get_images_for_annotator(annotator_id: int, db: Session = Depends(get_db)):
                 is_classified=is_classified,
                 classified_at=classified_at,
                 date_added=image.date_added,
+                priority=image.priority,
+                **meta_of(image),
             )
         )
 
+    # Stable: priority order within each half
+    result.sort(key=lambda image: image.is_classified)
     return result
 
 
 @router.get("/stats/{annotator_id}", tags=["annotations"])
 def get_annotator_stats(annotator_id: int, db: Session = Depends(get_db)):
     """Get statistics for an annotator"""
-    annotator = db.query(Annotator).filter(Annotator.id == annotator_id).first()
-    if not annotator:
+    stats = annotator_stats(db, annotator_id)
+    if not stats:
         raise HTTPException(status_code=404, detail="Annotator not found")
 
-    total_images = (
-        db.query(Image).filter(
-            Image.groups.any(Groups.annotators.any(Annotator.id == annotator.id))
-        )
-    ).count()
-    classified_images = (
-        db.query(Annotation).filter(Annotation.annotator_id == annotator_id).count()
-    )
+    return stats[0]
 
-    return {
-        "annotator_id": annotator_id,
-        "total_images": total_images,
-        "classified_images": classified_images,
-        "remaining_images": total_images - classified_images,
-        "progress_percentage": round((classified_images / total_images * 100), 2)
-        if total_images > 0
-        else 0,
-    }
-
-
-@router.get("/ai-suggest/{image_id}", response_model=AITagSuggestion, tags=["ai"])
-def get_ai_suggestions(image_id: int, db: Session = Depends(get_db)):
-    """Get AI-generated tag suggestions for an image"""
-    client = OpenAI()
 
+def _suggestion_context(db: Session, image_id: int) -> tuple[list[str], str]:
     image = db.query(Image).filter(Image.id == image_id).first()
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
     if not getattr(image, "url", None):
         raise HTTPException(status_code=400, detail="Image has no URL")
 
-    popular_tags = (
-        db.query(Tags.name, func.count(Tags.id).label("count"))
-        .join(Annotation.tags)
-        .group_by(Tags.name)
-        .order_by(func.count(Tags.id).desc())
-        .limit(10)
-        .all()
-    )
-    popular = ", ".join([row[0] for row in popular_tags]) if popular_tags else "none"
-
-    prompt = (
-        "You are an image tagging assistant. "
-        "Suggest exactly 5 short, relevant, lowercase tags (no '#', no spaces—use hyphens), "
-        f"favoring common tags when relevant. Common tags in this dataset: {popular}.\n"
-        "Return them as a comma-separated list only."
-    )
+    return ai.popular_tags(db), image.url
 
-    image_path = f".{image.url}"
-    with open(image_path, "rb") as f:
-        image_bytes = f.read()
-        image_b64 = base64.b64encode(image_bytes).decode("utf-8")
 
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"},
-                    },
-                ],
-            }
-        ],
-        max_tokens=150,
-    )
+@router.get("/ai-suggest/{image_id}", response_model=AITagSuggestion, tags=["ai"])
+def get_ai_suggestions(image_id: int, response: Response, db: Session = Depends(get_db)):
+    """Get AI-generated tag suggestions for an image"""
+    popular, url = _suggestion_context(db, image_id)
 
-    text = resp.choices[0].message.content or ""
+    # Images that look like labeled ones are answered locally, no model call
+    local = ai.local_suggestions(db, image_id, url, popular)
+    if local:
+        response.headers["X-Suggestion-Source"] = "local"
+        return AITagSuggestion(suggestions=local)
 
-    raw = text.replace("\n", ",").replace("•", ",").replace(";", ",").lower()
-    tags = [t.strip().strip("#").replace(" ", "-") for t in raw.split(",")]
-    tags = [t for t in tags if t]  # non-empty
-    tags = list(dict.fromkeys(tags))  # de-dupe, keep order
-    tags = tags[:5] if len(tags) >= 5 else tags
+    from openai import OpenAI
 
-    if len(tags) < 5:
-        # simple fallback: fill with top popular tags not already selected
-        pop_only = [p for p in [row[0] for row in popular_tags] if p not in tags]
-        tags += pop_only[: max(0, 5 - len(tags))]
+    client = OpenAI()
+    with track_ai():
+        resp = client.chat.completions.create(
+            model=ai.MODEL,
+            messages=ai.vision_messages(
+                ai.suggestion_prompt(popular), ai.image_data_url(url)
+            ),
+            max_tokens=150,
+        )
 
-    return AITagSuggestion(suggestions=tags)
+    parser = ai.TagStreamParser(popular)
+    parser.feed(resp.choices[0].message.content or "")
+    parser.finish()
+
+    response.headers["X-Suggestion-Source"] = "openai"
+    return AITagSuggestion(suggestions=parser.tags)
+
+
+@router.get("/ai-suggest/{image_id}/stream", tags=["ai"])
+async def stream_ai_suggestions(image_id: int, db: Session = Depends(get_db)):
+    """Stream AI tag suggestions over SSE, one `tag` event as soon as it is parsed.
+
+    Ends with a `done` event carrying the full list and its source. Upstream
+    generation stops once enough tags arrived or when the client goes away.
+    """
+    popular, url = await run_in_threadpool(_suggestion_context, db, image_id)
+    local = await run_in_threadpool(ai.local_suggestions, db, image_id, url, popular)
+
+    async def local_stream():
+        for tag in local:
+            yield sse("tag", {"name": tag, "popular": tag in popular})
+        yield sse("done", {"suggestions": local, "source": "local"})
+
+    async def stream():
+        from openai import AsyncOpenAI
+
+        parser = ai.TagStreamParser(popular)
+        client = AsyncOpenAI()
+        upstream = None
+        try:
+            data_url = await run_in_threadpool(ai.image_data_url, url)
+            with track_ai():
+                upstream = await client.chat.completions.create(
+                    model=ai.MODEL,
+                    messages=ai.vision_messages(ai.suggestion_prompt(popular), data_url),
+                    max_tokens=150,
+                    stream=True,
+                )
+                async for chunk in upstream:
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    for tag in parser.feed(text or ""):
+                        yield sse("tag", {"name": tag, "popular": tag in popular})
+                    if parser.done:
+                        break
+        except Exception as e:
+            # Suggestions degrade to popular tags, the stream itself must not fail
+            logger.warning("AI suggestion stream failed for image %s: %s", image_id, e)
+        finally:
+            # Also runs on client disconnect, when the generator is cancelled
+            if upstream is not None:
+                await upstream.close()
+            await client.close()
+
+        for tag in parser.finish():
+            yield sse("tag", {"name": tag, "popular": tag in popular})
+        yield sse("done", {"suggestions": parser.tags, "source": "openai"})
+
+    return StreamingResponse(
+        local_stream() if local else stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,13 +1,16 @@
 from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy import delete, exists, select
 from sqlalchemy.orm import Session
 from typing import List
 
+from core.middleware.metrics import ProfiledRoute
 from core.schemas.api import AnnotatorCreate, AnnotatorResponse
 from core.utils.auth import hash_password
-from dal.models import Annotator
+from core.utils.cache import bump_versions
+from dal.models import Annotation, Annotator
 from dal.setup import get_db
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 
 @router.post("/", response_model=AnnotatorResponse)
@@ -25,6 +28,7 @@ def create_annotator(annotator: AnnotatorCreate, db: Session = Depends(get_db)):
     )
     db.add(new_annotator)
     db.commit()
+    bump_versions("annotators")
     db.refresh(new_annotator)
 
     return AnnotatorResponse(
@@ -54,17 +58,17 @@ def get_annotator(annotator_id: int, db: Session = Depends(get_db)):
 @router.delete("/{annotator_id}")
 def delete_annotator(annotator_id: int, db: Session = Depends(get_db)):
     """Delete an annotator"""
-    annotator = db.query(Annotator).filter(Annotator.id == annotator_id).first()
-    if not annotator:
+    if db.scalar(select(Annotator.id).where(Annotator.id == annotator_id)) is None:
         raise HTTPException(status_code=404, detail="Annotator not found")
 
-    # Check if annotator has any annotations
-    if annotator.annotations:
+    if db.scalar(select(exists().where(Annotation.annotator_id == annotator_id))):
         raise HTTPException(
             status_code=400, detail="Cannot delete annotator with existing annotations"
         )
 
-    db.delete(annotator)
+    # Group memberships go with it by ON DELETE CASCADE
+    db.execute(delete(Annotator).where(Annotator.id == annotator_id))
     db.commit()
+    bump_versions("annotators", "group_annotators")
 
     return {"ok": True, "message": "Annotator deleted"}
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
+from core.middleware.metrics import ProfiledRoute
 from core.schemas.api import (
     AnnotatorResponse,
     ChangePassword,
@@ -22,9 +23,10 @@ from core.utils.auth import (
     verify_password,
     create_token,
 )
+from core.utils.cache import bump_versions
 from dal.setup import get_db
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 
 # Admin Routes
@@ -82,6 +84,7 @@ def annotator_register(data: AnnotatorCreate, db: Session = Depends(get_db)):
     )
     db.add(annotator)
     db.commit()
+    bump_versions("annotators")
     db.refresh(annotator)
 
     token = create_token(annotator.id, "annotator")
@@ -0,0 +1,50 @@
+import asyncio
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+from core.utils.events import bus, sse
+
+router = APIRouter()
+
+HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+
+@router.get("", tags=["events"])
+async def stream_events(
+    request: Request, topics: Optional[str] = None, annotator_id: Optional[int] = None
+):
+    """Server-sent events with annotation progress, tag and membership deltas.
+
+    `topics` is a comma-separated subset of annotation, image and group;
+    `annotator_id` keeps only that annotator's progress events. A `resync`
+    event means the client fell behind and should refetch its state, a
+    `reconnect` event that this worker is going away.
+    """
+    wanted = {t.strip() for t in topics.split(",") if t.strip()} if topics else None
+    subscriber = bus.subscribe(wanted, annotator_id)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        subscriber.queue.get(), timeout=HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield sse(event.type, event.data, event.id)
+                if event.type == "reconnect":
+                    break  # worker is shutting down
+        finally:
+            bus.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
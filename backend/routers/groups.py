@@ -1,12 +1,26 @@
 from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy import delete, insert, select
 from sqlalchemy.orm import Session
 from typing import List
 
-from core.schemas.api import AddMemberRequest, AnnotatorInGroup, GroupWithMembers
+from core.middleware.metrics import ProfiledRoute
+from core.schemas.api import (
+    AddMemberRequest,
+    AnnotatorInGroup,
+    BulkImagesRequest,
+    BulkMembersRequest,
+    BulkMembershipResult,
+    GroupWithMembers,
+)
+from core.utils.cache import bump_versions
+from core.utils.events import bus
+from core.utils.tag_query import QueryError
+from dal import loading, membership, tag_index
 from dal.models import Groups, Annotator
+from dal.models.groups import group_annotators
 from dal.setup import get_db
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 
 @router.post("/")
@@ -19,6 +33,7 @@ def create_group(name: str, db: Session = Depends(get_db)):
     group = Groups(name=name)
     db.add(group)
     db.commit()
+    bump_versions("groups")
     db.refresh(group)
     return {"id": group.id, "name": group.name}
 
@@ -26,7 +41,7 @@ def create_group(name: str, db: Session = Depends(get_db)):
 @router.get("/", response_model=List[GroupWithMembers])
 def get_all_groups(db: Session = Depends(get_db)):
     """Get all groups with their members"""
-    groups = db.query(Groups).all()
+    groups = db.query(Groups).options(*loading.GROUP_MEMBERS).all()
     return [
         GroupWithMembers(
             id=group.id,
@@ -43,7 +58,12 @@ def get_all_groups(db: Session = Depends(get_db)):
 @router.get("/{group_id}", response_model=GroupWithMembers)
 def get_group(group_id: int, db: Session = Depends(get_db)):
     """Get a specific group with its members and images"""
-    group = db.query(Groups).filter(Groups.id == group_id).first()
+    group = (
+        db.query(Groups)
+        .options(*loading.GROUP_MEMBERS)
+        .filter(Groups.id == group_id)
+        .first()
+    )
     if not group:
         raise HTTPException(404, "Group not found")
 
@@ -57,43 +77,58 @@ def get_group(group_id: int, db: Session = Depends(get_db)):
     )
 
 
+def _with_members(db: Session, group_id: int) -> GroupWithMembers:
+    group = (
+        db.query(Groups)
+        .options(*loading.GROUP_MEMBERS)
+        .filter(Groups.id == group_id)
+        .first()
+    )
+    return GroupWithMembers(
+        id=group.id,
+        name=group.name,
+        members=[
+            AnnotatorInGroup(id=a.id, name=a.name, email=a.email)
+            for a in group.annotators
+        ],
+    )
+
+
+def _check_group(db: Session, group_id: int):
+    if db.scalar(select(Groups.id).where(Groups.id == group_id)) is None:
+        raise HTTPException(404, "Group not found")
+
+
 @router.post("/{group_id}/members", response_model=GroupWithMembers)
 def add_member_to_group(
     group_id: int, request: AddMemberRequest, db: Session = Depends(get_db)
 ):
     """Add an annotator to a group"""
-    # Check if group exists
-    group = db.query(Groups).filter(Groups.id == group_id).first()
-    if not group:
-        raise HTTPException(404, "Group not found")
-
-    # Check if annotator exists
-    annotator = db.query(Annotator).filter(Annotator.id == request.annotator_id).first()
-    if not annotator:
+    _check_group(db, group_id)
+    annotator_id = request.annotator_id
+    if db.scalar(select(Annotator.id).where(Annotator.id == annotator_id)) is None:
         raise HTTPException(404, "Annotator not found")
 
-    # Check if annotator is already in this group
-    if annotator in group.annotators:
+    # An annotator belongs to one group at most
+    current = db.execute(
+        select(Groups.id, Groups.name)
+        .join(group_annotators, group_annotators.c.group_id == Groups.id)
+        .where(group_annotators.c.annotator_id == annotator_id)
+    ).first()
+    if current and current.id == group_id:
         raise HTTPException(400, "Annotator is already in this group")
+    if current:
+        raise HTTPException(400, f"Annotator is already in group '{current.name}'")
 
-    # Check if annotator is in another group
-    other_group = db.query(Groups).filter(Groups.annotators.contains(annotator)).first()
-    if other_group:
-        raise HTTPException(400, f"Annotator is already in group '{other_group.name}'")
-
-    # Add annotator to group
-    group.annotators.append(annotator)
+    db.execute(
+        insert(group_annotators).values(group_id=group_id, annotator_id=annotator_id)
+    )
     db.commit()
-    db.refresh(group)
-
-    return GroupWithMembers(
-        id=group.id,
-        name=group.name,
-        members=[
-            AnnotatorInGroup(id=a.id, name=a.name, email=a.email)
-            for a in group.annotators
-        ],
+    bump_versions("group_annotators")
+    bus.publish(
+        "group.members", group_id=group_id, annotator_id=annotator_id, action="added"
     )
+    return _with_members(db, group_id)
 
 
 @router.delete("/{group_id}/members/{annotator_id}", response_model=GroupWithMembers)
@@ -101,42 +136,110 @@ def remove_member_from_group(
     group_id: int, annotator_id: int, db: Session = Depends(get_db)
 ):
     """Remove an annotator from a group"""
-    # Check if group exists
-    group = db.query(Groups).filter(Groups.id == group_id).first()
-    if not group:
-        raise HTTPException(404, "Group not found")
-
-    # Check if annotator exists
-    annotator = db.query(Annotator).filter(Annotator.id == annotator_id).first()
-    if not annotator:
+    _check_group(db, group_id)
+    if db.scalar(select(Annotator.id).where(Annotator.id == annotator_id)) is None:
         raise HTTPException(404, "Annotator not found")
 
-    # Check if annotator is in this group
-    if annotator not in group.annotators:
+    if not membership.remove_members(db, group_id, [annotator_id])["changed"]:
         raise HTTPException(400, "Annotator is not in this group")
+    db.commit()
+    bump_versions("group_annotators")
+    bus.publish(
+        "group.members", group_id=group_id, annotator_id=annotator_id, action="removed"
+    )
+    return _with_members(db, group_id)
+
+
+@router.post("/{group_id}/members/bulk-add", response_model=BulkMembershipResult)
+def add_members_to_group(
+    group_id: int, request: BulkMembersRequest, db: Session = Depends(get_db)
+):
+    """Add many annotators to a group in one transaction.
+
+    Annotators already in another group stay there and are counted in
+    `in_other_group`.
+    """
+    _check_group(db, group_id)
+    counts = membership.add_members(db, group_id, request.annotator_ids)
+    return _members_changed(db, group_id, counts, "added")
+
+
+@router.post("/{group_id}/members/bulk-remove", response_model=BulkMembershipResult)
+def remove_members_from_group(
+    group_id: int, request: BulkMembersRequest, db: Session = Depends(get_db)
+):
+    """Remove many annotators from a group in one transaction"""
+    _check_group(db, group_id)
+    counts = membership.remove_members(db, group_id, request.annotator_ids)
+    return _members_changed(db, group_id, counts, "removed")
 
-    # Remove annotator from group
-    group.annotators.remove(annotator)
+
+def _members_changed(db: Session, group_id: int, counts: dict, action: str) -> dict:
     db.commit()
-    db.refresh(group)
+    if counts["changed"]:
+        bump_versions("group_annotators")
+        bus.publish(
+            "group.members", group_id=group_id, count=counts["changed"], action=action
+        )
+    return counts
+
+
+def _selected_images(db: Session, request: BulkImagesRequest) -> list[int]:
+    if (request.image_ids is None) == (request.q is None):
+        raise HTTPException(400, "Give either image_ids or q")
+    if request.image_ids is not None:
+        return request.image_ids
+    if request.min_agreement < 1:
+        raise HTTPException(400, "min_agreement must be at least 1")
+    try:
+        ids = tag_index.search(
+            db, request.q, request.min_agreement, request.source_group_id
+        )
+    except QueryError as e:
+        raise HTTPException(400, f"Invalid expression: {e}")
+    return ids.tolist()
 
-    return GroupWithMembers(
-        id=group.id,
-        name=group.name,
-        members=[
-            AnnotatorInGroup(id=a.id, name=a.name, email=a.email)
-            for a in group.annotators
-        ],
-    )
+
+@router.post("/{group_id}/images/bulk-add", response_model=BulkMembershipResult)
+def add_images_to_group(
+    group_id: int, request: BulkImagesRequest, db: Session = Depends(get_db)
+):
+    """Add images to a group in one transaction, by id or by tag expression,
+    e.g. `{"q": "car AND NOT truck", "source_group_id": 2}`"""
+    _check_group(db, group_id)
+    counts = membership.add_images(db, group_id, _selected_images(db, request))
+    return _images_changed(db, group_id, counts, "added")
+
+
+@router.post("/{group_id}/images/bulk-remove", response_model=BulkMembershipResult)
+def remove_images_from_group(
+    group_id: int, request: BulkImagesRequest, db: Session = Depends(get_db)
+):
+    """Remove images from a group in one transaction, by id or by tag
+    expression"""
+    _check_group(db, group_id)
+    if request.q is not None and request.source_group_id is None:
+        # Only images of this group can be removed from it
+        request.source_group_id = group_id
+    counts = membership.remove_images(db, group_id, _selected_images(db, request))
+    return _images_changed(db, group_id, counts, "removed")
+
+
+def _images_changed(db: Session, group_id: int, counts: dict, action: str) -> dict:
+    db.commit()
+    if counts["changed"]:
+        bump_versions("image_groups")
+        bus.publish(
+            "group.images", group_id=group_id, count=counts["changed"], action=action
+        )
+    return counts
 
 
 @router.delete("/{group_id}")
 def delete_group(group_id: int, db: Session = Depends(get_db)):
-    """Delete a group"""
-    group = db.query(Groups).filter(Groups.id == group_id).first()
-    if not group:
-        raise HTTPException(404, "Group not found")
-
-    db.delete(group)
+    """Delete a group; its member and image links go with it by ON DELETE CASCADE"""
+    _check_group(db, group_id)
+    db.execute(delete(Groups).where(Groups.id == group_id))
     db.commit()
+    bump_versions("groups", "group_annotators", "image_groups")
     return {"ok": True, "message": "Group deleted"}
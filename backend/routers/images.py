@@ -1,57 +1,301 @@
-import base64
-from datetime import datetime
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
-from openai import OpenAI
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from pathlib import Path
 import uuid
-from dal.models.annotator import Annotation
-import filetype
-from sqlalchemy import func
-
-
-from dal.models import Image, Tags, Groups
+from typing import Optional
+from dal.models.annotator import Annotation, annotation_tags
+from sqlalchemy import delete, func, select
+
+
+from core.middleware.metrics import ProfiledRoute, track_ai
+from core.schemas.api import (
+    DuplicateCluster,
+    DuplicateImage,
+    ImageListItem,
+    ImageSearchResult,
+    SignedUrl,
+)
+from core.utils import ai, embeddings, image_meta, phash
+from core.utils.auth import request_actor
+from core.utils.cache import bump_versions
+from core.utils.events import bus
+from core.utils.storage import SIGNED_URL_TTL, key_for, storage, url_for
+from core.utils.tag_query import QueryError
+from dal import duplicates, history, loading, membership, priority, tag_index
+from dal.models import Image, Tags, Groups, image_groups
+from dal.models.image import IMAGE_META, meta_of
 from dal.setup import get_db
+from dal.stats import image_tag_stats
+from dal.tags import get_or_create_tags
 
-router = APIRouter()
-
-UPLOAD_DIR = Path("uploads")
+logger = logging.getLogger(__name__)
 
+router = APIRouter(route_class=ProfiledRoute)
 
 @router.post("/upload")
 async def upload_image(file: UploadFile = File(...), db: Session = Depends(get_db)):
     """Upload an image file"""
+    import filetype
 
     if not file.content_type.startswith("image/"):
         raise HTTPException(400, "Only image files are allowed")
 
     content = await file.read()
 
-    if filetype.guess(content) is None:
+    kind = filetype.guess(content)
+    if kind is None:
         raise HTTPException(400, "Invalid image")
 
+    image_hash, meta = await run_in_threadpool(_analyse, content)
+    meta.setdefault("mime_type", kind.mime)
+    meta.setdefault("byte_size", len(content))
+
     ext = Path(file.filename).suffix or ".jpg"
     filename = f"{uuid.uuid4().hex}{ext}"
-    (UPLOAD_DIR / filename).write_bytes(content)
+    await run_in_threadpool(storage.put, filename, content, meta["mime_type"])
 
-    new_image = Image(name=file.filename, url=f"/uploads/{filename}")
+    new_image = Image(
+        name=file.filename, url=url_for(filename), phash=image_hash, **meta
+    )
     db.add(new_image)
     db.commit()
+    bump_versions("images")
     db.refresh(new_image)
+    embeddings.schedule([(new_image.id, new_image.url)])
 
     return JSONResponse(
-        {"ok": True, "id": new_image.id, "name": new_image.name, "url": new_image.url}
+        {
+            "ok": True,
+            "id": new_image.id,
+            "name": new_image.name,
+            "url": new_image.url,
+            **meta_of(new_image),
+        }
+    )
+
+
+def _analyse(content: bytes) -> tuple[str, dict]:
+    """Perceptual hash and image_meta of an upload, off the event loop.
+
+    Either may fail on its own, e.g. on a truncated file whose header is read
+    but not its pixels; keep whichever succeeded.
+    """
+    try:
+        image_hash = phash.dhash(content)
+    except (OSError, ValueError):
+        # Stored, just never deduplicated nor read again by the backfill
+        image_hash = duplicates.UNHASHABLE
+    try:
+        meta = image_meta.extract(content)
+    except (OSError, ValueError):
+        meta = {}
+    return image_hash, meta
+
+
+def _duplicate_images(db: Session, distances: dict[int, int]) -> dict[int, dict]:
+    ids = list(distances)
+    result = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start : start + 500]
+        annotators = dict(
+            db.execute(
+                select(Annotation.image_id, func.count(Annotation.id))
+                .where(Annotation.image_id.in_(chunk))
+                .group_by(Annotation.image_id)
+            ).all()
+        )
+        for image in db.execute(
+            select(Image.id, Image.name, Image.url, *IMAGE_META).where(
+                Image.id.in_(chunk)
+            )
+        ):
+            result[image.id] = {
+                "id": image.id,
+                "name": image.name,
+                "url": image.url,
+                "distance": distances[image.id],
+                "total_annotators": annotators.get(image.id, 0),
+                **meta_of(image),
+            }
+    return result
+
+
+def _check_distance(max_distance: int):
+    if not 0 <= max_distance <= phash.HASH_BITS // 4:
+        raise HTTPException(400, f"max_distance must be between 0 and {phash.HASH_BITS // 4}")
+
+
+@router.get("/search", response_model=ImageSearchResult)
+def search_images(
+    q: str,
+    min_agreement: int = 1,
+    group_id: Optional[int] = None,
+    limit: int = 50,
+    offset: int = 0,
+    db: Session = Depends(get_db),
+):
+    """Find images by tag expression, e.g. `car>=2 AND NOT (truck OR bus)`.
+
+    `min_agreement` is the number of annotators a tag needs on an image,
+    for terms without their own `>=n`. `group_id` limits the search to the
+    images of one group.
+    """
+    if min_agreement < 1:
+        raise HTTPException(400, "min_agreement must be at least 1")
+    if not 1 <= limit <= 500 or offset < 0:
+        raise HTTPException(400, "limit must be between 1 and 500, offset positive")
+
+    try:
+        ids = tag_index.search(db, q, min_agreement, group_id)
+    except QueryError as e:
+        raise HTTPException(400, f"Invalid expression: {e}")
+
+    page = [int(i) for i in ids[offset : offset + limit]]
+    images = db.execute(
+        select(Image.id, Image.name, Image.url, *IMAGE_META)
+        .where(Image.id.in_(page))
+        .order_by(Image.id)
+    ).all()
+    return {
+        "total": len(ids),
+        "images": [
+            {"id": image.id, "name": image.name, "url": image.url, **meta_of(image)}
+            for image in images
+        ],
+    }
+
+
+@router.get("/duplicates", response_model=list[DuplicateCluster])
+def get_duplicate_clusters(max_distance: int = 6, db: Session = Depends(get_db)):
+    """Groups of near-identical images, largest first"""
+    _check_distance(max_distance)
+    tree = duplicates.duplicate_tree(db)
+    clusters = duplicates.duplicate_clusters(db, max_distance)
+
+    # Distances are relative to the first (oldest) image of each cluster
+    images = _duplicate_images(
+        db,
+        {
+            i: phash.distance(tree.values[i], tree.values[ids[0]])
+            for ids in clusters
+            for i in ids
+        },
+    )
+    return [
+        {"size": len(ids), "images": [images[i] for i in ids if i in images]}
+        for ids in clusters
+    ]
+
+
+@router.get("/{image_id}/duplicates", response_model=list[DuplicateImage])
+def get_image_duplicates(
+    image_id: int, max_distance: int = 6, db: Session = Depends(get_db)
+):
+    """Near-duplicates of one image, closest first"""
+    _check_distance(max_distance)
+    image = db.query(Image).filter(Image.id == image_id).first()
+    if not image:
+        raise HTTPException(404, "Image not found")
+
+    tree = duplicates.duplicate_tree(db)
+    if not image.phash:
+        raise HTTPException(400, "Image cannot be hashed")
+
+    distances = {
+        other: d
+        for other, d in tree.search(int(image.phash, 16), max_distance)
+        if other != image_id
+    }
+    images = _duplicate_images(db, distances).values()
+    return sorted(images, key=lambda i: (i["distance"], i["id"]))
+
+
+@router.post("/{image_id}/duplicates/propagate")
+def propagate_annotations_to_duplicates(
+    image_id: int,
+    max_distance: int = 4,
+    actor: Optional[str] = Depends(request_actor),
+    db: Session = Depends(get_db),
+):
+    """Copy this image's annotations to its near-duplicates.
+
+    Only (duplicate, annotator) pairs without an annotation are filled, so
+    nobody's own labels are overwritten.
+    """
+    _check_distance(max_distance)
+    image = db.query(Image).filter(Image.id == image_id).first()
+    if not image:
+        raise HTTPException(404, "Image not found")
+
+    tree = duplicates.duplicate_tree(db)
+    if not image.phash:
+        raise HTTPException(400, "Image cannot be hashed")
+
+    targets = [
+        other
+        for other, _ in tree.search(int(image.phash, 16), max_distance)
+        if other != image_id
+    ]
+    sources = (
+        db.query(Annotation)
+        .options(*loading.ANNOTATION_TAGS)
+        .filter(Annotation.image_id == image_id)
+        .all()
     )
 
+    existing = set()
+    for start in range(0, len(targets), 500):
+        existing.update(
+            db.execute(
+                select(Annotation.image_id, Annotation.annotator_id).where(
+                    Annotation.image_id.in_(targets[start : start + 500])
+                )
+            ).all()
+        )
+
+    copied = {tag.name for source in sources for tag in source.tags}
+    created = defaultdict(int)
+    new_annotations = []
+    for target in targets:
+        for source in sources:
+            if (target, source.annotator_id) in existing:
+                continue
+            new_annotations.append(
+                Annotation(
+                    image_id=target,
+                    annotator_id=source.annotator_id,
+                    tags=list(source.tags),
+                )
+            )
+            created[target] += 1
+
+    db.add_all(new_annotations)
+    db.flush()
+    for annotation in new_annotations:
+        history.record(db, annotation, "created", "propagate_duplicates", actor)
+    db.commit()
+    if created:
+        bump_versions("annotations", "annotation_tags")
+        for target in created:
+            _image_tags_changed(db, target, copied)
 
-@router.get("/")
+    return {
+        "ok": True,
+        "message": f"{sum(created.values())} annotation(s) copied to {len(created)} image(s)",
+        "created_count": sum(created.values()),
+        "image_ids": sorted(created),
+    }
+
+
+@router.get("/", response_model=list[ImageListItem])
 def get_all_images(db: Session = Depends(get_db)):
     """Get all images with their tags, groups, and annotation statistics"""
-    images = db.query(Image).all()
-    result = []
-
     # Get popular tags once for reuse
     popular_tags = (
         db.query(Tags.name, func.count(Tags.id).label("count"))
@@ -63,43 +307,59 @@ def get_all_images(db: Session = Depends(get_db)):
     )
     popular = ", ".join([row[0] for row in popular_tags]) if popular_tags else "none"
 
-    for img in images:
-        # Get all annotations for this image
-        annotations = db.query(Annotation).filter(Annotation.image_id == img.id).all()
-        total_annotators = len(annotations)
-
-        # Calculate tag statistics from annotations
-        tag_stats = {}
-        for ann in annotations:
-            for tag in ann.tags:
-                if tag.name not in tag_stats:
-                    tag_stats[tag.name] = {"id": tag.id, "count": 0}
-                tag_stats[tag.name]["count"] += 1
-
-        # Build tags with percentage and count
-        tags_with_stats = []
-        for tag_name, tag_data in tag_stats.items():
-            count = tag_data["count"]
-            percentage = (
-                round((count / total_annotators * 100)) if total_annotators > 0 else 0
-            )
-            tags_with_stats.append(
-                {
-                    "id": tag_data["id"],
-                    "name": tag_name,
-                    "count": count,
-                    "percentage": percentage,
-                }
+    # Aggregate everything per image in SQL, rows are plain tuples
+    total_annotators = dict(
+        db.execute(
+            select(Annotation.image_id, func.count(Annotation.id)).group_by(
+                Annotation.image_id
             )
+        ).all()
+    )
+
+    tag_counts = defaultdict(list)
+    for image_id, tag_id, tag_name, count in db.execute(
+        select(Annotation.image_id, Tags.id, Tags.name, func.count())
+        .select_from(Annotation)
+        .join(annotation_tags, annotation_tags.c.annotation_id == Annotation.id)
+        .join(Tags, Tags.id == annotation_tags.c.tag_id)
+        .group_by(Annotation.image_id, Tags.id)
+    ):
+        tag_counts[image_id].append((tag_id, tag_name, count))
+
+    groups_by_image = defaultdict(list)
+    for image_id, group_id, group_name in db.execute(
+        select(image_groups.c.image_id, Groups.id, Groups.name).join(
+            Groups, Groups.id == image_groups.c.group_id
+        )
+    ):
+        groups_by_image[image_id].append({"id": group_id, "name": group_name})
+
+    result = []
+    for img in db.execute(
+        select(Image.id, Image.name, Image.url, Image.date_added, *IMAGE_META).order_by(
+            Image.id
+        )
+    ):
+        annotators = total_annotators.get(img.id, 0)
 
-        # Sort tags by count (most popular first)
-        tags_with_stats.sort(key=lambda x: x["count"], reverse=True)
+        # Build tags with percentage and count, most popular first
+        tags_with_stats = [
+            {
+                "id": tag_id,
+                "name": tag_name,
+                "count": count,
+                "percentage": round(count / annotators * 100) if annotators > 0 else 0,
+            }
+            for tag_id, tag_name, count in sorted(
+                tag_counts.get(img.id, []), key=lambda t: t[2], reverse=True
+            )
+        ]
 
         # Use AI to determine if there's a conflict
         has_conflict = False
-        if tags_with_stats and total_annotators > 1:
+        if tags_with_stats and annotators > 1:
             has_conflict = check_tag_conflict_with_ai(
-                img, tags_with_stats, total_annotators, popular
+                img, tags_with_stats, annotators, popular
             )
 
         result.append(
@@ -108,14 +368,11 @@ def get_all_images(db: Session = Depends(get_db)):
                 "name": img.name,
                 "url": img.url,
                 "tags": tags_with_stats,
-                "groups": [
-                    {"id": group.id, "name": group.name} for group in img.groups
-                ],
-                "total_annotators": total_annotators,
+                "groups": groups_by_image.get(img.id, []),
+                "total_annotators": annotators,
                 "has_conflict": has_conflict,
-                "date_added": img.date_added.isoformat()
-                if hasattr(img, "date_added")
-                else None,
+                "date_added": img.date_added,
+                **meta_of(img),
             }
         )
 
@@ -123,7 +380,7 @@ def get_all_images(db: Session = Depends(get_db)):
 
 
 def check_tag_conflict_with_ai(
-    image: Image, tags_with_stats: list, total_annotators: int, popular_tags: str
+    image, tags_with_stats: list, total_annotators: int, popular_tags: str
 ) -> bool:
     """Use AI to determine if there's a tagging conflict for this image"""
 
@@ -151,64 +408,103 @@ def check_tag_conflict_with_ai(
         "Answer with ONLY 'YES' if there's a conflict or 'NO' if annotations are reasonably consistent."
     )
 
+    from openai import OpenAI
+
     client = None
     try:
         client = OpenAI()
 
-        image_path = f".{image.url}"
-        with open(image_path, "rb") as f:
-            image_bytes = f.read()
-            image_b64 = base64.b64encode(image_bytes).decode("utf-8")
-
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"},
-                        },
-                    ],
-                }
-            ],
-            max_tokens=10,
-        )
+        with track_ai():
+            resp = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": prompt},
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": ai.image_data_url(image.url, image.mime_type)
+                                },
+                            },
+                        ],
+                    }
+                ],
+                max_tokens=10,
+            )
 
         answer = resp.choices[0].message.content.strip().upper()
         return "YES" in answer
 
     except Exception as e:
         # Fallback to percentage-based check if AI fails
-        print(f"AI conflict check failed for image {image.id}: {e}")
+        logger.warning("AI conflict check failed for image %s: %s", image.id, e)
         return any(tag["percentage"] < 80 for tag in tags_with_stats)
     finally:
         if client:
             client.close()
 
 
+def _image_tags_changed(db: Session, image_id: int, tags: set[str]):
+    """Follow a committed tag change on one image in the index and the event stream"""
+    tag_index.index_image(db, image_id, tags)
+    if bus.active:
+        bus.publish("image.tags", **image_tag_stats(db, image_id))
+
+
+@router.get("/{image_id}/url", response_model=SignedUrl)
+def get_image_url(
+    image_id: int, expires_in: int = SIGNED_URL_TTL, db: Session = Depends(get_db)
+):
+    """Time-limited URL serving the image bytes directly from storage"""
+    if not 1 <= expires_in <= 7 * 24 * 3600:
+        raise HTTPException(400, "expires_in must be between 1 second and 7 days")
+    url = db.scalar(select(Image.url).where(Image.id == image_id))
+    if url is None:
+        raise HTTPException(404, "Image not found")
+
+    return {
+        "url": storage.signed_url(key_for(url), expires_in),
+        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=expires_in),
+    }
+
+
 @router.delete("/{image_id}")
-def delete_image(image_id: int, db: Session = Depends(get_db)):
-    """Delete an image"""
-    image = db.query(Image).filter(Image.id == image_id).first()
-    if not image:
+def delete_image(
+    image_id: int,
+    background: BackgroundTasks,
+    actor: Optional[str] = Depends(request_actor),
+    db: Session = Depends(get_db),
+):
+    """Delete an image; its annotations and group links go with it by ON DELETE
+    CASCADE, the file is removed after the response"""
+    url = db.scalar(select(Image.url).where(Image.id == image_id))
+    if url is None:
         raise HTTPException(404, "Image not found")
 
-    # Delete physical file
-    file_path = UPLOAD_DIR / Path(image.url).name
-    if file_path.exists():
-        file_path.unlink()
+    for annotation in (
+        db.query(Annotation)
+        .options(*loading.ANNOTATION_TAGS)
+        .filter(Annotation.image_id == image_id)
+    ):
+        history.record(db, annotation, "deleted", "delete_image", actor)
 
-    db.delete(image)
+    priority.forget(db, image_id)
+    db.execute(delete(Image).where(Image.id == image_id))
     db.commit()
+    embeddings.index().remove(image_id)
+    background.add_task(storage.delete, key_for(url))
+    bump_versions("images", "image_groups", "annotations", "annotation_tags")
     return {"ok": True, "message": "Image deleted"}
 
 
 @router.delete("/{image_id}/tags/{tag_name}")
 def remove_tag_from_all_annotations(
-    image_id: int, tag_name: str, db: Session = Depends(get_db)
+    image_id: int,
+    tag_name: str,
+    actor: Optional[str] = Depends(request_actor),
+    db: Session = Depends(get_db),
 ):
     """Remove a specific tag from ALL annotations of an image (admin/curator action)"""
     image = db.query(Image).filter(Image.id == image_id).first()
@@ -221,15 +517,23 @@ def remove_tag_from_all_annotations(
         raise HTTPException(404, "Tag not found")
 
     # Get all annotations for this image
-    annotations = db.query(Annotation).filter(Annotation.image_id == image_id).all()
+    annotations = (
+        db.query(Annotation)
+        .options(*loading.ANNOTATION_TAGS)
+        .filter(Annotation.image_id == image_id)
+        .all()
+    )
 
     removed_count = 0
     for annotation in annotations:
         if tag in annotation.tags:
             annotation.tags.remove(tag)
+            history.record(db, annotation, "updated", "remove_tag", actor)
             removed_count += 1
 
     db.commit()
+    bump_versions("annotation_tags")
+    _image_tags_changed(db, image_id, {tag_name.lower()})
 
     return {
         "ok": True,
@@ -244,7 +548,11 @@ class RenameTagRequest(BaseModel):
 
 @router.patch("/{image_id}/tags/{tag_name}")
 def rename_tag_in_all_annotations(
-    image_id: int, tag_name: str, body: RenameTagRequest, db: Session = Depends(get_db)
+    image_id: int,
+    tag_name: str,
+    body: RenameTagRequest,
+    actor: Optional[str] = Depends(request_actor),
+    db: Session = Depends(get_db),
 ):
     """Rename a specific tag in ALL annotations of an image (admin/curator action)"""
     image = db.query(Image).filter(Image.id == image_id).first()
@@ -264,23 +572,17 @@ def rename_tag_in_all_annotations(
     if new_tag_name_lower == tag_name.lower():
         raise HTTPException(400, "New tag name is the same as the old one")
 
-    # Check if new tag already exists
-    existing_tag = db.query(Tags).filter(Tags.name == new_tag_name_lower).first()
-
-    if existing_tag:
-        # If the new tag already exists, we'll merge them
-        # Replace old tag with existing new tag in all annotations
-        new_tag = existing_tag
-        merge_mode = True
-    else:
-        # Create new tag
-        new_tag = Tags(name=new_tag_name_lower)
-        db.add(new_tag)
-        db.flush()  # Get the new tag ID
-        merge_mode = False
+    # If the new tag already exists, the old one is merged into it
+    [new_tag], created = get_or_create_tags(db, [new_tag_name_lower])
+    merge_mode = not created
 
     # Get all annotations for this image
-    annotations = db.query(Annotation).filter(Annotation.image_id == image_id).all()
+    annotations = (
+        db.query(Annotation)
+        .options(*loading.ANNOTATION_TAGS)
+        .filter(Annotation.image_id == image_id)
+        .all()
+    )
 
     updated_count = 0
     for annotation in annotations:
@@ -289,6 +591,7 @@ def rename_tag_in_all_annotations(
             # Only add new tag if it's not already there (handles merge case)
             if new_tag not in annotation.tags:
                 annotation.tags.append(new_tag)
+            history.record(db, annotation, "updated", "rename_tag", actor)
             updated_count += 1
 
     # If no annotations use the old tag anymore, we can optionally delete it
@@ -301,6 +604,8 @@ def rename_tag_in_all_annotations(
         db.delete(old_tag)
 
     db.commit()
+    bump_versions("tags", "annotation_tags")
+    _image_tags_changed(db, image_id, {tag_name.lower(), new_tag_name_lower})
 
     return {
         "ok": True,
@@ -313,12 +618,17 @@ def rename_tag_in_all_annotations(
 
 @router.delete("/{image_id}/annotations/{annotator_id}/tags/{tag_name}")
 def remove_tag_from_specific_annotation(
-    image_id: int, annotator_id: int, tag_name: str, db: Session = Depends(get_db)
+    image_id: int,
+    annotator_id: int,
+    tag_name: str,
+    actor: Optional[str] = Depends(request_actor),
+    db: Session = Depends(get_db),
 ):
     """Remove a tag from a specific annotator's annotation"""
     # Find the specific annotation
     annotation = (
         db.query(Annotation)
+        .options(*loading.ANNOTATION_TAGS)
         .filter(
             Annotation.image_id == image_id, Annotation.annotator_id == annotator_id
         )
@@ -338,25 +648,29 @@ def remove_tag_from_specific_annotation(
 
     annotation.tags.remove(tag)
     annotation.updated_at = datetime.utcnow()
+    history.record(db, annotation, "updated", "remove_own_tag", actor)
     db.commit()
+    bump_versions("annotations", "annotation_tags")
+    _image_tags_changed(db, image_id, {tag_name.lower()})
 
     return {"ok": True, "message": f"Tag '{tag_name}' removed from annotation"}
 
 
-@router.post("/{image_id}/groups/{group_id}")
-def add_image_to_group(image_id: int, group_id: int, db: Session = Depends(get_db)):
-    """Add an image to a group"""
-    image = db.query(Image).filter(Image.id == image_id).first()
-    group = db.query(Groups).filter(Groups.id == group_id).first()
-
-    if not image:
+def _check_image_and_group(db: Session, image_id: int, group_id: int):
+    if db.scalar(select(Image.id).where(Image.id == image_id)) is None:
         raise HTTPException(404, "Image not found")
-    if not group:
+    if db.scalar(select(Groups.id).where(Groups.id == group_id)) is None:
         raise HTTPException(404, "Group not found")
 
-    if group not in image.groups:
-        image.groups.append(group)
+
+@router.post("/{image_id}/groups/{group_id}")
+def add_image_to_group(image_id: int, group_id: int, db: Session = Depends(get_db)):
+    """Add an image to a group"""
+    _check_image_and_group(db, image_id, group_id)
+    if membership.add_images(db, group_id, [image_id])["changed"]:
         db.commit()
+        bump_versions("image_groups")
+        bus.publish("group.images", group_id=group_id, image_id=image_id, action="added")
 
     return {"ok": True, "message": "Image added to group"}
 
@@ -366,16 +680,12 @@ def remove_image_from_group(
     image_id: int, group_id: int, db: Session = Depends(get_db)
 ):
     """Remove an image from a group"""
-    image = db.query(Image).filter(Image.id == image_id).first()
-    group = db.query(Groups).filter(Groups.id == group_id).first()
-
-    if not image:
-        raise HTTPException(404, "Image not found")
-    if not group:
-        raise HTTPException(404, "Group not found")
-
-    if group in image.groups:
-        image.groups.remove(group)
+    _check_image_and_group(db, image_id, group_id)
+    if membership.remove_images(db, group_id, [image_id])["changed"]:
         db.commit()
+        bump_versions("image_groups")
+        bus.publish(
+            "group.images", group_id=group_id, image_id=image_id, action="removed"
+        )
 
     return {"ok": True, "message": "Image removed from group"}
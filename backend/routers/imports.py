@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from core.middleware.metrics import ProfiledRoute
+from core.utils.auth import request_actor
+from core.utils.importers import FORMATS, ImportFormatError, parse
+from dal.importer import import_records
+from dal.setup import setup_db
+
+router = APIRouter(route_class=ProfiledRoute)
+
+
+@router.post("")
+async def import_dataset(
+    format: str,
+    file: UploadFile = File(...),
+    annotator_id: Optional[int] = None,
+    actor: Optional[str] = Depends(request_actor),
+):
+    """Import a COCO, CSV or JSONL dataset, streaming progress as JSON lines.
+
+    One line per committed chunk and a last one with "done": true; a line with
+    "error" ends a failed import, whose earlier chunks stay committed.
+    """
+    if format not in FORMATS:
+        raise HTTPException(400, f"Format must be one of {', '.join(FORMATS)}")
+    if format == "coco" and annotator_id is None:
+        raise HTTPException(400, "COCO has no annotators, pass annotator_id")
+
+    # The upload is closed once this handler returns, before the body streams
+    spooled = tempfile.NamedTemporaryFile(suffix=f".{format}", delete=False)
+    with spooled:
+        await run_in_threadpool(shutil.copyfileobj, file.file, spooled, 1 << 20)
+
+    def progress():
+        try:
+            with open(spooled.name, "rb") as stream, setup_db() as db:
+                records = parse(stream, format)
+                for stats in import_records(db, records, annotator_id, actor):
+                    yield orjson.dumps(stats.as_dict()) + b"\n"
+        except ImportFormatError as e:
+            yield orjson.dumps({"error": str(e)}) + b"\n"
+        finally:
+            os.unlink(spooled.name)
+
+    return StreamingResponse(
+        progress(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
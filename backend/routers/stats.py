@@ -0,0 +1,38 @@
+import os
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from core.middleware.metrics import ProfiledRoute
+from core.schemas.api import AnnotatorStats, GroupStats, PrincipalCost
+from core.utils import admission
+from core.utils.cache import TTLCache
+from dal.setup import get_db
+from dal.stats import annotator_stats, group_stats
+
+router = APIRouter(route_class=ProfiledRoute)
+
+# Dashboards poll these endpoints, a few seconds of staleness is acceptable
+_stats_cache = TTLCache(ttl=float(os.getenv("STATS_CACHE_TTL", "5")))
+
+
+@router.get("/groups", response_model=list[GroupStats])
+def get_group_stats(db: Session = Depends(get_db)):
+    """Get progress, throughput and remaining work for every group"""
+    return _stats_cache.get_or_set("groups", lambda: group_stats(db))
+
+
+@router.get("/annotators", response_model=list[AnnotatorStats])
+def get_all_annotator_stats(db: Session = Depends(get_db)):
+    """Get progress, throughput and remaining work for every annotator"""
+    return _stats_cache.get_or_set("annotators", lambda: annotator_stats(db))
+
+
+@router.get("/costs", response_model=list[PrincipalCost])
+def get_costs():
+    """Get what each principal spent on expensive endpoints, most OpenAI calls first"""
+    return sorted(
+        admission.backend.costs(),
+        key=lambda cost: (cost["ai_calls"], cost["seconds"]),
+        reverse=True,
+    )
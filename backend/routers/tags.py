@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from core.middleware.metrics import ProfiledRoute
+from core.schemas.api import (
+    MergeSuggestion,
+    RelatedTag,
+    SynonymCandidate,
+    TagSearchResult,
+)
+from core.utils.cache import table_versions
+from core.utils.tag_search import TagIndex
+from dal import cooccurrence
+from dal.models import Tags
+from dal.models.annotator import annotation_tags
+from dal.setup import get_db
+
+router = APIRouter(route_class=ProfiledRoute)
+
+# Usage only orders the results, it may lag behind labeling a little
+USAGE_TTL = float(os.getenv("TAG_USAGE_TTL", "30"))
+
+_lock = threading.Lock()
+_index: Optional[TagIndex] = None
+_index_version: Optional[list[int]] = None
+_usage_loaded_at = 0.0
+
+
+def _usage(db: Session) -> dict[int, int]:
+    return dict(
+        db.execute(
+            select(annotation_tags.c.tag_id, func.count()).group_by(
+                annotation_tags.c.tag_id
+            )
+        ).all()
+    )
+
+
+def _tag_index(db: Session) -> TagIndex:
+    """The shared index, caught up with tag writes and periodically re-ranked"""
+    global _index, _index_version, _usage_loaded_at
+    version = table_versions(["tags"])
+    with _lock:
+        if _index is not None and version != _index_version:
+            # New tags are appended; renames and deletions need a rebuild
+            total = db.scalar(select(func.count(Tags.id)))
+            new = db.execute(
+                select(Tags.id, Tags.name).where(Tags.id > _index.max_id)
+            ).all()
+            if total == len(_index) + len(new) and _index.extend(new):
+                _index_version = version
+            else:
+                _index = None
+
+        if _index is None:
+            _index = TagIndex(db.execute(select(Tags.id, Tags.name)).all(), _usage(db))
+            _index_version = version
+            _usage_loaded_at = time.monotonic()
+        elif time.monotonic() - _usage_loaded_at > USAGE_TTL:
+            _index.set_usage(_usage(db))
+            _usage_loaded_at = time.monotonic()
+        return _index
+
+
+@router.get("/search", response_model=list[TagSearchResult])
+def search_tags(q: str, limit: int = 10, db: Session = Depends(get_db)):
+    """Autocomplete tags: prefix matches first, then close spellings, by usage"""
+    if not 1 <= limit <= 50:
+        raise HTTPException(400, "limit must be between 1 and 50")
+
+    return _tag_index(db).search(q, limit)
+
+
+def _tag_id(db: Session, name: str) -> int:
+    tag_id = db.scalar(select(Tags.id).where(Tags.name == name.strip().lower()))
+    if tag_id is None:
+        raise HTTPException(404, "Tag not found")
+    return tag_id
+
+
+def _names(db: Session, tag_ids: set[int]) -> dict[int, str]:
+    return dict(
+        db.execute(select(Tags.id, Tags.name).where(Tags.id.in_(tag_ids))).all()
+    )
+
+
+@router.get("/merge-suggestions", response_model=list[MergeSuggestion])
+def get_merge_suggestions(
+    limit: int = Query(50, ge=1, le=500),
+    min_support: int = Query(5, ge=1),
+    min_npmi: float = Query(0.5, ge=-1, le=1),
+    db: Session = Depends(get_db),
+):
+    """Likely synonyms across the vocabulary: merge `source` into `target`"""
+    suggestions = cooccurrence.merge_suggestions(db, limit, min_support, min_npmi)
+    ids = {s["source_id"] for s in suggestions} | {s["target_id"] for s in suggestions}
+    names = _names(db, ids)
+    return [
+        {**s, "source": names[s["source_id"]], "target": names[s["target_id"]]}
+        for s in suggestions
+        if s["source_id"] in names and s["target_id"] in names
+    ]
+
+
+@router.get("/{name}/related", response_model=list[RelatedTag])
+def get_related_tags(
+    name: str, limit: int = Query(20, ge=1, le=500), db: Session = Depends(get_db)
+):
+    """Tags most often in the same annotation as this one"""
+    related = cooccurrence.related(db, _tag_id(db, name), limit)
+    names = _names(db, {r["tag_id"] for r in related})
+    return [{**r, "tag": names[r["tag_id"]]} for r in related if r["tag_id"] in names]
+
+
+@router.get("/{name}/synonyms", response_model=list[SynonymCandidate])
+def get_synonym_candidates(
+    name: str,
+    limit: int = Query(20, ge=1, le=500),
+    min_support: int = Query(3, ge=1),
+    db: Session = Depends(get_db),
+):
+    """Tags given to the same images as this one by other annotators, by NPMI"""
+    candidates = cooccurrence.synonyms(db, _tag_id(db, name), limit, min_support)
+    names = _names(db, {c["tag_id"] for c in candidates})
+    return [
+        {**c, "tag": names[c["tag_id"]]} for c in candidates if c["tag_id"] in names
+    ]
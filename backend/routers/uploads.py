@@ -0,0 +1,26 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, RedirectResponse
+
+from core.utils.storage import REQUIRE_SIGNED_URLS, LocalStorage, storage
+
+router = APIRouter()
+
+
+@router.get("/{key}", include_in_schema=False)
+def get_upload(
+    key: str, expires: Optional[int] = None, signature: Optional[str] = None
+):
+    """Image bytes, with Range support; object stores redirect to a signed URL"""
+    if not isinstance(storage, LocalStorage):
+        return RedirectResponse(storage.signed_url(key), status_code=307)
+
+    if signature is not None or REQUIRE_SIGNED_URLS:
+        if expires is None or not storage.verify(key, expires, signature or ""):
+            raise HTTPException(403, "Invalid or expired signature")
+
+    path = storage.path(key)
+    if not path.is_file():
+        raise HTTPException(404, "File not found")
+    return FileResponse(path, headers={"Cache-Control": "private, max-age=3600"})